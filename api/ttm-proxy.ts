@@ -14,7 +14,7 @@ export default async function handler(req: VercelRequest, res: VercelResponse) {
   // Handle CORS
   res.setHeader('Access-Control-Allow-Origin', '*')
   res.setHeader('Access-Control-Allow-Methods', 'GET, POST, DELETE, OPTIONS')
-  res.setHeader('Access-Control-Allow-Headers', 'Content-Type, Authorization')
+  res.setHeader('Access-Control-Allow-Headers', 'Content-Type, Authorization, Idempotency-Key')
 
   if (req.method === 'OPTIONS') {
     return res.status(200).end()
@@ -42,12 +42,18 @@ export default async function handler(req: VercelRequest, res: VercelResponse) {
     })
 
     // Prepare request options
+    const headers: Record<string, string> = {
+      'Content-Type': req.headers['content-type'] || 'application/json',
+      'User-Agent': 'Alkemy-TTM-Proxy/1.0',
+    }
+    const idempotencyKey = req.headers['idempotency-key']
+    if (typeof idempotencyKey === 'string') {
+      headers['Idempotency-Key'] = idempotencyKey
+    }
+
     const options: RequestInit = {
       method: req.method,
-      headers: {
-        'Content-Type': req.headers['content-type'] || 'application/json',
-        'User-Agent': 'Alkemy-TTM-Proxy/1.0',
-      },
+      headers,
     }
 
     // Handle request body for POST/PUT requests
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# The service modules are imported flat, as the API does when run from its directory
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
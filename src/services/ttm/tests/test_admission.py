@@ -0,0 +1,85 @@
+import pytest
+
+from ttm_admission import AdmissionRejected, FairQueue, ProjectQuota, parse_quotas, simulate
+
+
+def test_backlogged_share_follows_weights():
+    queue = FairQueue(quotas={"a": ProjectQuota(weight=3), "b": ProjectQuota(weight=1)})
+    for project in ("a", "b", "c"):
+        for _ in range(300):
+            queue.put_nowait(project, project)
+    served = [queue.get_nowait() for _ in range(250)]
+    assert {p: served.count(p) / len(served) for p in ("a", "b", "c")} == {"a": 0.6, "b": 0.2, "c": 0.2}
+
+
+def test_small_projects_are_not_stuck_behind_a_flood():
+    fifo = simulate(fair=False)
+    drr = simulate(fair=True)
+    for project in ("steady", "burst"):
+        assert len(drr[project]) == 10
+        assert max(drr[project]) <= 5.0
+        assert max(fifo[project]) > 150.0
+    # The flood pays for it, but only by the small projects' 20 seconds of work
+    assert max(drr["flood"]) == max(fifo["flood"]) + 20.0
+
+
+def test_lower_weight_flood_yields_more():
+    even = simulate(fair=True)
+    weighted = simulate(fair=True, weights={"flood": 0.5})
+    for project in ("steady", "burst"):
+        assert sum(weighted[project]) < sum(even[project])
+        assert max(weighted[project]) <= 2.0
+
+
+def test_queue_keeps_fifo_order_within_a_project():
+    queue = FairQueue()
+    for i in range(5):
+        queue.put_nowait("a", i)
+        queue.put_nowait("b", 10 + i)
+    served = [queue.get_nowait() for _ in range(10)]
+    assert [i for i in served if i < 10] == list(range(5))
+    assert [i for i in served if i >= 10] == list(range(10, 15))
+
+
+def test_admission_retry_after():
+    now = [0.0]
+    queue = FairQueue(default_quota=ProjectQuota(rate_per_minute=6, burst=2), clock=lambda: now[0])
+    queue.admit("p")
+    queue.admit("p")
+    with pytest.raises(AdmissionRejected) as rejected:
+        queue.admit("p")
+    assert rejected.value.retry_after == 10
+    now[0] = 10.0
+    queue.admit("p")
+    assert queue.stats()["projects"]["p"]["rejected"] == 1
+
+
+def test_rate_zero_project_is_refused_without_retry_after():
+    queue = FairQueue(quotas={"frozen": ProjectQuota(rate_per_minute=0, burst=1)})
+    queue.admit("frozen")
+    with pytest.raises(AdmissionRejected) as rejected:
+        queue.admit("frozen")
+    assert rejected.value.retry_after is None
+
+
+@pytest.mark.parametrize("quota", [
+    {"weight": 0},
+    {"weight": -1},
+    {"weight": float("inf")},
+    {"burst": 0},
+    {"rate_per_minute": -1},
+])
+def test_out_of_range_quotas_are_rejected(quota):
+    with pytest.raises(ValueError):
+        ProjectQuota(**quota)
+
+
+def test_parse_quotas():
+    quotas = parse_quotas("studio:120:40:4, trial:6::0.5", ProjectQuota(burst=5))
+    assert quotas == {
+        "studio": ProjectQuota(rate_per_minute=120, burst=40, weight=4),
+        "trial": ProjectQuota(rate_per_minute=6, burst=5, weight=0.5),
+    }
+    for spec in ("studio:1:2:3:4", ":1", "trial:6::0", "trial:x"):
+        with pytest.raises(ValueError):
+            parse_quotas(spec)
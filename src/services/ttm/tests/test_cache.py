@@ -0,0 +1,56 @@
+from types import SimpleNamespace
+
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from diffusers.pipelines.wan.pipeline_wan_i2v import retrieve_latents
+
+from ttm_cache import ConditioningCache
+
+
+class VAE:
+    def __init__(self):
+        self.encoded = []
+
+    def encode(self, x):
+        self.encoded.append(x)
+        return SimpleNamespace(latent_dist=SimpleNamespace(mode=lambda: x * 2))
+
+
+class Pipeline:
+    """Stub whose `prepare_latents` encodes the conditioning frame per generator, then `extra` tensors"""
+
+    def __init__(self):
+        self.vae = VAE()
+        self.encoded = self.vae.encoded
+
+    def prepare_latents(self, condition, generators=1, extra=()):
+        latents = [retrieve_latents(self.vae.encode(condition), sample_mode="argmax") for _ in range(generators)]
+        return latents + [retrieve_latents(self.vae.encode(x), sample_mode="argmax") for x in extra]
+
+
+def test_only_the_conditioning_encode_is_cached():
+    cache, pipeline = ConditioningCache("m", 1 << 20), Pipeline()
+    condition, other = torch.ones(1, 3, 2, 4, 4), torch.full((1, 3, 2, 4, 4), 5.0)
+    timings = {}
+
+    with cache.vae_condition(pipeline, "image", timings):
+        latents = pipeline.prepare_latents(condition, generators=3, extra=[other])
+    # The repeats of the batch reuse the first encode; another input of the same shape is not served from it
+    assert [x is condition for x in pipeline.encoded] == [True, False]
+    assert all((latent == 2).all() for latent in latents[:3])
+    assert (latents[3] == 10).all()
+    assert timings["vae_condition_cache_hit"] is False
+
+    pipeline.encoded.clear()
+    with cache.vae_condition(pipeline, "image", timings):
+        latents = pipeline.prepare_latents(condition.clone(), extra=[other])
+    assert [x is other for x in pipeline.encoded] == [True]
+    assert (latents[0] == 2).all() and (latents[1] == 10).all()
+    assert timings["vae_condition_cache_hit"] is True
+
+    # Outside the context the pipeline is unwrapped
+    pipeline.encoded.clear()
+    pipeline.prepare_latents(condition)
+    assert len(pipeline.encoded) == 1
@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+
+from ttm_compositing import MotionObject, Sprite, composite_objects, make_motion_object, resample_trajectory
+
+BACKGROUND = 90
+
+
+def square(color, size: int, positions) -> MotionObject:
+    sprite = Sprite.from_arrays(np.full((size, size, 3), color, np.uint8), np.ones((size, size)))
+    positions = np.array(positions, dtype=np.float32)
+    return MotionObject(sprite, positions, np.ones(len(positions)), np.zeros(len(positions)))
+
+
+@pytest.fixture
+def image():
+    return np.full((48, 64, 3), BACKGROUND, np.uint8)
+
+
+def test_later_objects_are_drawn_on_top(image):
+    red = square((255, 0, 0), 10, [[20, 20], [30, 20]])
+    blue = square((0, 0, 255), 10, [[25, 25], [25, 25]])
+
+    frames, masks = composite_objects(image, [red, blue], 2)
+
+    # Red covers [15, 25) in both axes in frame 0, blue [20, 30)
+    assert (frames[0, 15:20, 15:25] == (255, 0, 0)).all()
+    assert (frames[0, 20:30, 20:30] == (0, 0, 255)).all()
+    frames, _ = composite_objects(image, [blue, red], 2)
+    assert (frames[0, 20:25, 20:25] == (255, 0, 0)).all()
+    assert (frames[0, 25:30, 20:30] == (0, 0, 255)).all()
+
+    # Outside the objects' ROIs the background is untouched
+    expected = np.zeros((2, 48, 64), bool)
+    expected[0, 15:25, 15:25] = expected[0, 20:30, 20:30] = True
+    expected[1, 15:25, 25:35] = expected[1, 20:30, 20:30] = True
+    assert (frames[~expected] == BACKGROUND).all()
+    assert np.array_equal(masks == 255, expected)
+
+
+def test_soft_edges_blend_with_what_is_below(image):
+    alpha = np.ones((4, 4))
+    alpha[:, 0] = 0.5
+    half = MotionObject(Sprite.from_arrays(np.full((4, 4, 3), 250, np.uint8), alpha), np.array([[10.0, 10.0]]), np.ones(1), np.zeros(1))
+
+    frames, masks = composite_objects(image, [half], 1)
+
+    assert (frames[0, 8:12, 8] == (BACKGROUND + 250) // 2).all()
+    assert (frames[0, 8:12, 9:12] == 250).all()
+    assert (masks[0, 8:12, 8:12] == 255).all()
+
+
+def test_objects_are_clipped_at_the_frame_edge(image):
+    edge = square((0, 255, 0), 10, [[2, 46], [-20, 20]])
+
+    frames, masks = composite_objects(image, [edge], 2)
+
+    assert (frames[0, 41:, :7] == (0, 255, 0)).all()
+    assert masks[0].sum() == 7 * 7 * 255
+    assert (frames[1] == BACKGROUND).all()  # Entirely outside
+
+
+def test_a_range_of_frames_matches_the_whole_clip(image):
+    image[10:20, 10:20] = (200, 50, 0)
+    moving = make_motion_object(image, np.array([[0.2, 0.3], [0.8, 0.7]]), 9, bbox=(10 / 64, 10 / 48, 20 / 64, 20 / 48), rotation_end=30.0)
+
+    frames, masks = composite_objects(image, [moving], 9)
+    part, part_masks = composite_objects(image, [moving], 9, range(3, 7))
+
+    assert np.array_equal(part, frames[3:7])
+    assert np.array_equal(part_masks, masks[3:7])
+
+
+def test_resample_trajectory():
+    trajectory = np.array([[0.0, 0.0], [1.0, 2.0]])
+    assert np.allclose(resample_trajectory(trajectory, 3), [[0, 0], [0.5, 1], [1, 2]])
+    assert np.array_equal(resample_trajectory(np.zeros((5, 2)), 3), np.zeros((3, 2)))
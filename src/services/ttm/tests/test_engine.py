@@ -0,0 +1,233 @@
+import json
+import time
+
+import numpy as np
+import pytest
+
+torch = pytest.importorskip("torch")
+diffusers = pytest.importorskip("diffusers")
+
+from PIL import Image
+
+from ttm_core_service import MotionSpec, TTMEngine, apply_default_indices, build_tiny_snapshot
+from ttm_jobs import JobCancelled, JobControl, JobControlGroup, JobTimedOut
+from ttm_stitching import plan_windows
+
+
+class TinyTTMPipeline(diffusers.WanImageToVideoPipeline):
+    """The stock pipeline standing in for the TTM one; motion signals are accepted and ignored"""
+
+    def __call__(self, *args, motion_signal_video_path=None, motion_signal_mask_path=None,
+                 tweak_index=None, tstrong_index=None, **kwargs):
+        return super().__call__(*args, **kwargs)
+
+
+@pytest.fixture(scope="module")
+def engine(tmp_path_factory):
+    snapshot = tmp_path_factory.mktemp("snapshot")
+    build_tiny_snapshot(snapshot)
+    return TTMEngine.from_snapshot(
+        "tiny-random-wan",
+        local_path=str(snapshot),
+        device="cpu",
+        dtype=torch.float32,
+        pipeline_cls=TinyTTMPipeline,
+        max_area=64 * 64,
+        num_inference_steps=2
+    )
+
+
+@pytest.fixture
+def inputs(engine):
+    image = engine.prepare_image(Image.new("RGB", (96, 64), "red"))
+    spec = MotionSpec(motion_type="object", trajectory=[[0.3, 0.5], [0.7, 0.5]], num_frames=17)
+    apply_default_indices(spec)
+    return image, spec
+
+
+def test_from_snapshot_records_load_timings(engine):
+    for stage in ("resolve_snapshot", "verify_snapshot", "load_weights", "to_device", "warm_up", "cold_start"):
+        assert engine.load_timings[stage] >= 0
+
+
+def test_generate_one_video_per_seed(engine, inputs):
+    image, spec = inputs
+    timings = {}
+    videos = engine.generate(image, "a cat walks left", spec, seeds=[0, 1], timings=timings)
+
+    assert len(videos) == 2
+    for video in videos:
+        assert video.dtype == np.uint8
+        assert video.shape == (17, image.height, image.width, 3)
+    assert timings["inference"] > 0
+
+    again = engine.generate(image, "a cat walks left", spec, seeds=[0, 1])
+    assert all(np.array_equal(a, b) for a, b in zip(again, videos))
+    assert not np.array_equal(videos[0], videos[1])
+
+
+def test_decode_chunks_matches_full_decode(engine, inputs):
+    image, spec = inputs
+    full = engine.generate(image, "a ball rolls right", spec, seeds=[3])[0]
+    latents = engine.generate_latents(image, "a ball rolls right", spec, seeds=[3])[0]
+
+    chunks = list(engine.decode_chunks(latents, chunk_frames=8))
+
+    assert len(chunks) > 1
+    assert all(len(chunk) <= 9 for chunk in chunks)
+    streamed = np.concatenate(chunks)
+    assert streamed.shape == full.shape
+    assert np.abs(streamed.astype(np.int16) - full.astype(np.int16)).max() == 0
+
+
+def stop_at(control, step: int, action):
+    """`control.step_callback` that records steps and calls `action` at `step`"""
+    steps = []
+
+    def callback(pipeline, i, timestep, callback_kwargs):
+        steps.append(i)
+        if i == step:
+            action()
+        return control.step_callback(pipeline, i, timestep, callback_kwargs)
+
+    return callback, steps
+
+
+def expire(control: JobControl):
+    control.submitted_at -= control.timeout + 1
+
+
+@pytest.mark.parametrize("action, error", [
+    (lambda control: control.cancel(), JobCancelled),
+    (expire, JobTimedOut),
+])
+def test_step_callback_stops_generation_at_the_next_step(engine, inputs, action, error):
+    image, spec = inputs
+    view = engine.with_limits(engine.max_area, 6)
+    control = JobControl("job", timeout=600)
+    callback, steps = stop_at(control, 1, lambda: action(control))
+
+    with pytest.raises(error):
+        view.generate(image, "a cat walks left", spec, seeds=[0], callback=callback)
+    assert steps == [0, 1]
+
+
+def test_batch_stops_only_when_every_member_is_cancelled(engine, inputs):
+    image, spec = inputs
+    view = engine.with_limits(engine.max_area, 6)
+    controls = [JobControl("a", timeout=600), JobControl("b", timeout=600)]
+
+    callback, steps = stop_at(JobControlGroup(controls), 1, controls[0].cancel)
+    assert len(view.generate(image, "a cat walks left", spec, seeds=[0, 1], callback=callback)) == 2
+    assert steps == list(range(6))
+
+    callback, steps = stop_at(JobControlGroup(controls), 2, controls[1].cancel)
+    with pytest.raises(JobCancelled):
+        view.generate(image, "a cat walks left", spec, seeds=[0, 1], callback=callback)
+    assert steps == [0, 1, 2]
+
+    # Any member's deadline stops the whole batch
+    controls = [JobControl("a", timeout=600), JobControl("b", timeout=600)]
+    callback, steps = stop_at(JobControlGroup(controls), 0, lambda: expire(controls[1]))
+    with pytest.raises(JobTimedOut):
+        view.generate(image, "a cat walks left", spec, seeds=[0, 1], callback=callback)
+    assert steps == [0]
+
+
+@pytest.fixture(scope="module")
+def api(engine, tmp_path_factory):
+    """
+    The API app serving the tiny engine, slowed to many steps per job
+
+    One app lifetime for the module: the queue's asyncio primitives bind to
+    the event loop of the first TestClient that starts the app.
+    """
+    import ttm_api
+    from fastapi.testclient import TestClient
+    from ttm_journal import JobJournal
+
+    tmp_path = tmp_path_factory.mktemp("api")
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setattr(ttm_api.Config, "TEMP_DIR", str(tmp_path / "work"))
+        monkeypatch.setattr(ttm_api.Config, "OUTPUT_DIR", str(tmp_path / "out"))
+        monkeypatch.setattr(ttm_api.Config, "DEFAULT_MAX_AREA", 64 * 64)
+        monkeypatch.setattr(ttm_api, "journal", JobJournal(str(tmp_path / "journal")))
+        monkeypatch.setattr(ttm_api.canary, "interval", 0)
+        monkeypatch.setattr(ttm_api, "draining", False)  # Restored after shutdown sets it
+        with TestClient(ttm_api.app) as client:
+            monkeypatch.setattr(ttm_api, "ttm_engine", engine.with_limits(engine.max_area, 5000))
+            yield client
+
+
+def submit(client, **request) -> str:
+    import io
+    import ttm_api
+
+    image = io.BytesIO()
+    Image.new("RGB", (96, 64), "red").save(image, "PNG")
+    request = {"motion_type": "object", "prompt": "a cat walks left", "trajectory": [[0.3, 0.5], [0.7, 0.5]],
+               "num_frames": 17, **request}
+    response = client.post(
+        f"{ttm_api.Config.API_PREFIX}/generate",
+        files={"image": ("image.png", image.getvalue())},
+        data={"request_json": json.dumps(request)}
+    )
+    assert response.status_code == 200, response.text
+    return response.json()["job_id"]
+
+
+def wait_for(client, job_id: str, done, timeout: float = 60):
+    import ttm_api
+
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = client.get(f"{ttm_api.Config.API_PREFIX}/status/{job_id}").json()
+        if done(job):
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f"Job {job_id} still {job['status']}")
+
+
+def test_cancel_stops_a_running_job(api):
+    import ttm_api
+
+    started = time.time()
+    job_id = submit(api)
+    wait_for(api, job_id, lambda job: job["status"] == "processing" and job["progress"] > 0.1)
+    assert api.post(f"{ttm_api.Config.API_PREFIX}/cancel/{job_id}").status_code == 200
+
+    job = wait_for(api, job_id, lambda job: job["status"] in ttm_api.TERMINAL_STATUSES)
+    assert job["status"] == "cancelled"
+    assert job["progress"] < 0.8
+    assert time.time() - started < 20  # 5000 steps take far longer
+    assert api.post(f"{ttm_api.Config.API_PREFIX}/cancel/{job_id}").status_code == 409
+
+
+def test_deadline_times_out_a_running_job(api):
+    import ttm_api
+
+    job_id = submit(api, timeout_seconds=2)
+    job = wait_for(api, job_id, lambda job: job["status"] in ttm_api.TERMINAL_STATUSES)
+    assert job["status"] == "timed_out"
+    assert job["progress"] < 0.8
+
+
+def test_long_video_is_generated_in_stitched_windows(api, engine, monkeypatch):
+    import imageio
+    import ttm_api
+    import ttm_core_service
+
+    monkeypatch.setattr(ttm_core_service, "MAX_NUM_FRAMES", 21)
+    monkeypatch.setattr(ttm_api.Config, "LONG_WINDOW_FRAMES", 17)
+    monkeypatch.setattr(ttm_api.Config, "LONG_OVERLAP_FRAMES", 5)
+    monkeypatch.setattr(ttm_api, "ttm_engine", engine)
+
+    job_id = submit(api, num_frames=45, seed=0)
+    job = wait_for(api, job_id, lambda job: job["status"] in ttm_api.TERMINAL_STATUSES)
+
+    assert job["status"] == "completed", job["result"]
+    assert job["result"]["windows"] == len(plan_windows(45, 17, 5))
+    assert job["result"]["frames"] == 45
+    reader = imageio.get_reader(job["result"]["video_url"])
+    assert sum(1 for _ in reader) == 45
+    reader.close()
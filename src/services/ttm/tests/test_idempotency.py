@@ -0,0 +1,126 @@
+import asyncio
+from typing import Dict, List, Optional
+
+import pytest
+from pydantic import BaseModel
+
+import ttm_idempotency
+from ttm_idempotency import IdempotencyKeyConflict, SubmissionIndex, request_fingerprint
+from ttm_wire import Trajectory
+
+
+class Request(BaseModel):
+    prompt: str
+    trajectory: Optional[Trajectory] = None
+
+
+class Jobs:
+    """Stub job store: `create_job` and `job_status` as the API passes them"""
+
+    def __init__(self):
+        self.statuses: Dict[str, Optional[str]] = {}
+        self.created: List[str] = []
+
+    async def create_job(self) -> str:
+        await asyncio.sleep(0)
+        job_id = f"job{len(self.created)}"
+        self.created.append(job_id)
+        self.statuses[job_id] = "pending"
+        return job_id
+
+    def job_status(self, job_id: str) -> Optional[str]:
+        return self.statuses.get(job_id)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(ttm_idempotency.time, "time", lambda: now[0])
+    return now
+
+
+def submit(index: SubmissionIndex, jobs: Jobs, key: Optional[str], fingerprint: str):
+    return asyncio.run(index.submit(key, fingerprint, jobs.job_status, jobs.create_job))
+
+
+def test_fingerprint_covers_image_and_parameters():
+    base = request_fingerprint("img", Request(prompt="a", trajectory=[[0.1, 0.2], [0.3, 0.4]]))
+    assert base == request_fingerprint("img", Request(prompt="a", trajectory=[{"x": 0.1, "y": 0.2}, {"x": 0.3, "y": 0.4}]))
+    assert base != request_fingerprint("other", Request(prompt="a", trajectory=[[0.1, 0.2], [0.3, 0.4]]))
+    assert base != request_fingerprint("img", Request(prompt="b", trajectory=[[0.1, 0.2], [0.3, 0.4]]))
+    assert base != request_fingerprint("img", Request(prompt="a", trajectory=[[0.1, 0.2], [0.3, 0.5]]))
+    assert base != request_fingerprint("img", Request(prompt="a"))
+
+
+def test_key_replays_the_original_job_in_any_state():
+    index, jobs = SubmissionIndex(ttl_seconds=60), Jobs()
+    assert submit(index, jobs, "k", "f") == ("job0", False)
+    jobs.statuses["job0"] = "completed"
+    assert submit(index, jobs, "k", "f") == ("job0", True)
+    assert jobs.created == ["job0"]
+    assert index.stats()["replayed"] == 1
+
+
+def test_key_reused_for_another_request_conflicts():
+    index, jobs = SubmissionIndex(ttl_seconds=60), Jobs()
+    submit(index, jobs, "k", "f")
+    with pytest.raises(IdempotencyKeyConflict):
+        submit(index, jobs, "k", "g")
+    assert jobs.created == ["job0"]
+
+
+def test_key_of_a_deleted_job_creates_a_new_one():
+    index, jobs = SubmissionIndex(ttl_seconds=60), Jobs()
+    submit(index, jobs, "k", "f")
+    jobs.statuses["job0"] = None
+    assert submit(index, jobs, "k", "f") == ("job1", False)
+    assert submit(index, jobs, "k", "f") == ("job1", True)
+
+
+@pytest.mark.parametrize("status, reused", [
+    ("pending", True),
+    ("processing", True),
+    ("completed", False),
+    ("failed", False),
+    ("cancelled", False),
+    ("timed_out", False),
+    ("partial", False),
+])
+def test_identical_submission_attaches_only_while_in_flight(status, reused):
+    index, jobs = SubmissionIndex(ttl_seconds=60), Jobs()
+    submit(index, jobs, None, "f")
+    jobs.statuses["job0"] = status
+    assert submit(index, jobs, None, "f") == (("job0", True) if reused else ("job1", False))
+    assert index.stats()["coalesced"] == int(reused)
+
+
+def test_concurrent_identical_submissions_create_one_job():
+    index, jobs = SubmissionIndex(ttl_seconds=60), Jobs()
+
+    async def both():
+        return await asyncio.gather(*(index.submit(None, "f", jobs.job_status, jobs.create_job) for _ in range(2)))
+
+    assert asyncio.run(both()) == [("job0", False), ("job0", True)]
+
+
+def test_entries_expire_after_ttl(clock):
+    index, jobs = SubmissionIndex(ttl_seconds=60), Jobs()
+    submit(index, jobs, "k", "f")
+    clock[0] += 30
+    assert submit(index, jobs, "k", "f") == ("job0", True)
+
+    clock[0] += 31
+    # The key is forgotten, so a different request may use it
+    assert submit(index, jobs, "k", "g") == ("job1", False)
+    assert index.stats()["keys"] == 1
+    assert index.stats()["in_flight"] == 1
+
+
+def test_entries_are_bounded_oldest_first():
+    index, jobs = SubmissionIndex(ttl_seconds=60, max_entries=2), Jobs()
+    for i in range(3):
+        submit(index, jobs, f"k{i}", f"f{i}")
+    assert index.stats()["keys"] == 3  # Trimmed on the next submission
+    submit(index, jobs, "k2", "f2")
+    assert index.stats()["keys"] == 2
+    assert submit(index, jobs, "k0", "f0") == ("job3", False)
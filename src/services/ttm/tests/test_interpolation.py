@@ -0,0 +1,71 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+import pytest
+
+from ttm_interpolation import FrameInterpolator, diffused_frame_count, interpolate_frames
+
+
+def pan(num_frames: int, step: float = 2.0, size=(48, 64)) -> np.ndarray:
+    """A smooth texture panning right by `step` pixels per frame"""
+    height, width = size
+    texture = cv2.GaussianBlur(np.random.default_rng(0).integers(0, 256, (height, width + 200, 3), dtype=np.uint8), (0, 0), 3)
+    shifts = [np.float32([[1, 0, -step * k], [0, 1, 0]]) for k in range(num_frames)]
+    return np.stack([cv2.warpAffine(texture, m, (width + 200, height))[:, :width] for m in shifts])
+
+
+@pytest.mark.parametrize("num_frames, ratio, expected", [
+    (81, 0.5, 41),
+    (81, 0.4, 33),
+    (81, 1.0, 81),
+    (21, 0.5, 17),  # Never fewer than the 17-frame minimum
+    (17, 0.5, 17),  # Too short to thin out
+    (33, 0.5, 17),
+])
+def test_diffused_frame_count(num_frames, ratio, expected):
+    assert diffused_frame_count(num_frames, ratio) == expected
+
+
+@pytest.mark.parametrize("source, target", [(17, 33), (17, 41), (9, 10), (12, 12)])
+@pytest.mark.parametrize("chunks", [[100], [1] * 17, [3, 5, 1, 8], [7, 2, 100]])
+def test_chunked_output_matches_the_whole_clip(source, target, chunks):
+    frames = pan(source)
+    whole = interpolate_frames(frames, target)
+
+    interpolator = FrameInterpolator(source, target)
+    outputs, start = [], 0
+    for size in chunks:
+        if start < source:
+            outputs.append(interpolator.add(frames[start:start + size]))
+            start += size
+
+    assert interpolator.done
+    assert np.array_equal(np.concatenate(outputs), whole)
+
+
+def test_thread_pool_gives_the_same_frames():
+    frames = pan(17)
+    with ThreadPoolExecutor(4) as pool:
+        assert np.array_equal(interpolate_frames(frames, 41, pool), interpolate_frames(frames, 41))
+
+
+def test_generated_frames_are_copied_unchanged():
+    frames = pan(17)
+    output = interpolate_frames(frames, 33)
+
+    assert output.shape == (33,) + frames.shape[1:]
+    assert np.array_equal(output[0], frames[0])
+    assert np.array_equal(output[-1], frames[-1])
+    # At twice the rate every other output frame is a generated one
+    assert np.array_equal(output[::2], frames)
+    assert np.array_equal(interpolate_frames(frames, 17), frames)
+
+
+def test_in_between_frames_follow_the_motion():
+    frames = pan(3, step=4.0)
+    midpoint = interpolate_frames(frames[::2], 3)[1].astype(float)
+    truth = frames[1].astype(float)
+    blend = (frames[0].astype(float) + frames[2]) / 2
+    # Warping along the flow lands much closer to the true frame than a cross-fade
+    assert np.abs(midpoint - truth)[:, 8:-8].mean() < 0.5 * np.abs(blend - truth)[:, 8:-8].mean()
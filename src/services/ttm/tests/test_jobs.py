@@ -0,0 +1,111 @@
+import pytest
+
+pytest.importorskip("torch")
+
+import ttm_api
+from fastapi.testclient import TestClient
+from ttm_api import Config, JobStatus
+from ttm_jobs import JobIndex
+
+
+def add(index: JobIndex, job_id: str, project: str, status: str = "pending") -> JobStatus:
+    job = index[job_id] = JobStatus(job_id=job_id, status=status, progress=0.0, project_id=project)
+    return job
+
+
+def ids(jobs):
+    return [job.job_id for job in jobs]
+
+
+@pytest.fixture
+def index():
+    index = JobIndex()
+    for i in range(6):
+        add(index, f"a{i}", "a", "completed" if i % 2 else "pending")
+    for i in range(3):
+        add(index, f"b{i}", "b")
+    return index
+
+
+def test_query_by_project_and_status(index):
+    jobs, cursor, total = index.query()
+    assert ids(jobs) == ["b2", "b1", "b0", "a5", "a4", "a3", "a2", "a1", "a0"]
+    assert cursor is None and total == 9
+    assert ids(index.query("a")[0]) == ["a5", "a4", "a3", "a2", "a1", "a0"]
+    assert ids(index.query(status="completed")[0]) == ["a5", "a3", "a1"]
+    assert ids(index.query("b", "pending")[0]) == ["b2", "b1", "b0"]
+    assert index.query("b", "completed") == ([], None, 0)
+    assert index.counts("a") == {"pending": 3, "completed": 3}
+    assert index.counts() == {"pending": 6, "completed": 3}
+
+
+def test_status_change_refiles_the_job(index):
+    calls = []
+    index.on_status_change = lambda job, previous: calls.append((job.job_id, previous, job.status))
+
+    index["b1"].status = "processing"
+    index["b1"].progress = 0.5  # Other fields leave the indexes alone
+    index["b1"].status = "processing"
+
+    assert calls == [("b1", "pending", "processing")]
+    assert ids(index.query("b", "pending")[0]) == ["b2", "b0"]
+    assert ids(index.query(status="processing")[0]) == ["b1"]
+    assert index.counts("b") == {"pending": 2, "processing": 1}
+
+    # Copies handed out by the API do not re-file the original
+    copy = index["b2"].model_copy()
+    copy.status = "failed"
+    assert index.counts("b") == {"pending": 2, "processing": 1}
+
+
+def test_cursor_is_stable_across_inserts_and_deletes(index):
+    page, cursor, _ = index.query("a", limit=2)
+    assert ids(page) == ["a5", "a4"]
+
+    # New jobs appear before the cursor; deleting seen or unseen jobs shifts nothing
+    add(index, "a6", "a")
+    del index["a5"]
+    del index["a2"]
+    page, cursor, total = index.query("a", cursor=cursor, limit=2)
+    assert ids(page) == ["a3", "a1"]
+    assert total == 5
+    page, cursor, _ = index.query("a", cursor=cursor, limit=2)
+    assert ids(page) == ["a0"]
+    assert cursor is None
+
+
+def test_deleted_and_replaced_jobs_leave_no_trace(index):
+    deleted = index["a0"]
+    del index["a0"]
+    deleted.status = "cancelled"  # No longer listened to
+    assert "a0" not in index
+    assert index.counts("a") == {"pending": 2, "completed": 3}
+
+    add(index, "b0", "c", "failed")
+    assert ids(index.query("b")[0]) == ["b2", "b1"]
+    assert ids(index.query("c")[0]) == ["b0"]
+    assert ids(index.query()[0])[0] == "b0"  # Re-inserted jobs count as new
+
+    for job_id in list(index):
+        del index[job_id]
+    assert index.query() == ([], None, 0)
+    assert index.counts() == {}
+
+
+def test_list_and_batch_status_endpoints(index, monkeypatch):
+    monkeypatch.setattr(ttm_api, "generation_jobs", index)
+    client = TestClient(ttm_api.app)
+
+    page = client.get(f"{Config.API_PREFIX}/jobs", params={"project_id": "a", "status": "pending", "limit": 2}).json()
+    assert [job["job_id"] for job in page["jobs"]] == ["a4", "a2"]
+    assert page["total"] == 3
+    page = client.get(f"{Config.API_PREFIX}/jobs", params={"project_id": "a", "status": "pending", "cursor": page["next_cursor"]}).json()
+    assert [job["job_id"] for job in page["jobs"]] == ["a0"]
+    assert page["next_cursor"] is None
+    assert client.get(f"{Config.API_PREFIX}/jobs", params={"cursor": "x"}).status_code == 400
+
+    response = client.post(f"{Config.API_PREFIX}/status:batch", json={"job_ids": ["b1", "nope", "a3", "b1"]})
+    assert response.status_code == 200
+    assert [job["job_id"] for job in response.json()["jobs"]] == ["b1", "a3", "b1"]
+    assert response.json()["missing"] == ["nope"]
+    assert client.post(f"{Config.API_PREFIX}/status:batch", json={"job_ids": ["x"] * 501}).status_code == 422
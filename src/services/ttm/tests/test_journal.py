@@ -0,0 +1,158 @@
+import json
+from pathlib import Path
+
+import pytest
+from PIL import Image
+
+import ttm_journal
+from ttm_journal import JobJournal
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(ttm_journal.time, "time", lambda: now[0])
+    return now
+
+
+def submit(journal: JobJournal, job_id: str, children=None, kind="generate", request="{}"):
+    input_path = journal.save_input(job_id, Image.new("RGB", (8, 8), "red"))
+    journal.submitted(job_id, kind, request, input_path, "default", 1.0, project_id="p", children=children)
+    return input_path
+
+
+def test_replay_skips_a_truncated_last_line(tmp_path: Path):
+    journal = JobJournal(str(tmp_path))
+    submit(journal, "a")
+    journal.status("a", "processing")
+    submit(journal, "b", children=["b0", "b1"])
+    journal.status("b0", "completed", {"status": "completed", "video_url": "b0.mp4"}, ["p/b0.mp4"])
+    journal.status("a", "completed")
+    journal.close()
+
+    # A crash in the middle of the last append
+    data = journal.path.read_bytes()
+    journal.path.write_bytes(data[:-10])
+
+    jobs = journal.replay()
+    assert list(jobs) == ["a", "b", "b0", "b1"]
+    assert jobs["a"].status == "processing"
+    assert jobs["a"].submission["input"] == "inputs/a.png"
+    assert jobs["b0"].parent_id == "b"
+    assert jobs["b0"].result["video_url"] == "b0.mp4"
+    assert jobs["b0"].storage_keys == ["p/b0.mp4"]
+    assert jobs["b1"].status == "pending"
+
+
+def test_delete_drops_a_sweep_and_its_children(tmp_path: Path):
+    journal = JobJournal(str(tmp_path))
+    submit(journal, "a", children=["a0"])
+    submit(journal, "b")
+    journal.deleted("a")
+    journal.status("a0", "completed")  # Late status of a deleted job is ignored
+    journal.close()
+
+    assert list(journal.replay()) == ["b"]
+
+
+def test_compact_drops_expired_finished_jobs(tmp_path: Path, clock):
+    journal = JobJournal(str(tmp_path), retention_seconds=60)
+    submit(journal, "old")
+    journal.status("old", "completed")
+    submit(journal, "sweep", children=["s0", "s1"])
+    journal.status("s0", "failed")
+    submit(journal, "queued")
+    clock[0] += 120
+    submit(journal, "recent")
+    journal.status("recent", "cancelled")
+
+    kept = journal.compact(journal.replay())
+
+    # The sweep has an unfinished child, so none of it expires
+    assert set(kept) == {"sweep", "s0", "s1", "queued", "recent"}
+    assert not journal.path.with_suffix(".partial").exists()
+    assert {job_id: job.status for job_id, job in journal.replay().items()} == {
+        "sweep": "pending", "s0": "failed", "s1": "pending", "queued": "pending", "recent": "cancelled",
+    }
+    # Only inputs of jobs that may still run are kept
+    assert sorted(p.name for p in journal.inputs_dir.iterdir()) == ["queued.png", "sweep.png"]
+
+    # Appends after compaction go to the new log
+    journal.status("queued", "processing")
+    journal.close()
+    assert journal.replay()["queued"].status == "processing"
+
+
+def test_compact_is_atomic(tmp_path: Path, monkeypatch):
+    journal = JobJournal(str(tmp_path), retention_seconds=0)
+    submit(journal, "a")
+    journal.status("a", "completed")
+    before = journal.path.read_bytes()
+
+    def crash(self, target):
+        raise OSError("disk gone")
+
+    monkeypatch.setattr(Path, "replace", crash)
+    with pytest.raises(OSError):
+        journal.compact(journal.replay())
+    monkeypatch.undo()
+
+    assert journal.path.read_bytes() == before
+    assert journal.replay()["a"].status == "completed"
+
+
+def test_deferred_writes_keep_their_order(tmp_path: Path):
+    journal = JobJournal(str(tmp_path))
+    submit(journal, "a")
+    for status in ("processing", "completed"):
+        journal.defer(journal.status, "a", status)
+    journal.defer(journal.release_input, "a")
+    journal.barrier().result(timeout=10)
+
+    lines = [json.loads(line) for line in journal.path.read_text().splitlines()]
+    assert [line.get("status") for line in lines] == [None, "processing", "completed"]
+    assert not (journal.inputs_dir / "a.png").exists()
+
+    journal.close()
+    journal.defer(journal.status, "a", "completed").result(timeout=10)  # Usable again after close
+    journal.close()
+
+
+def test_restore_jobs_requeues_interrupted_jobs(tmp_path: Path, monkeypatch):
+    pytest.importorskip("torch")
+    import ttm_api
+    from ttm_admission import FairQueue
+    from ttm_jobs import JobIndex
+
+    journal = JobJournal(str(tmp_path))
+    request = ttm_api.TTMRequest(motion_type="object", prompt="x", trajectory=[[0.2, 0.5], [0.8, 0.5]], num_frames=17)
+    sweep = ttm_api.TTMVariantsRequest(**request.model_dump(), variants=[{"seed": 1}, {"seed": 2}])
+    submit(journal, "running", request=request.model_dump_json())
+    journal.status("running", "processing")
+    submit(journal, "done", request=request.model_dump_json())
+    journal.status("done", "completed", {"status": "completed", "video_url": "done.mp4"})
+    submit(journal, "sweep", children=["v0", "v1"], kind="variants", request=sweep.model_dump_json())
+    journal.status("v0", "completed", {"status": "completed"})
+    journal.status("v1", "processing")
+    journal.close()
+
+    monkeypatch.setattr(ttm_api, "journal", journal)
+    monkeypatch.setattr(ttm_api, "generation_jobs", JobIndex(on_status_change=ttm_api.journal_status_change))
+    monkeypatch.setattr(ttm_api, "job_queue", FairQueue())
+    monkeypatch.setattr(ttm_api, "job_controls", {})
+    monkeypatch.setattr(ttm_api, "job_storage_keys", {})
+
+    assert ttm_api.restore_jobs() == 2
+    jobs = ttm_api.generation_jobs
+    assert {job_id: jobs[job_id].status for job_id in jobs} == {
+        "running": "pending", "done": "completed", "sweep": "pending", "v0": "completed", "v1": "pending",
+    }
+    assert jobs["done"].result.video_url == "done.mp4"
+    assert set(ttm_api.job_controls) == {"running", "v0", "v1"}
+
+    queued = [ttm_api.job_queue.get_nowait() for _ in range(ttm_api.job_queue.qsize())]
+    assert [(job_id, type(request).__name__) for job_id, _, request in queued] == [
+        ("running", "TTMRequest"), ("sweep", "TTMVariantsRequest"),
+    ]
+    assert queued[0][1].size == (8, 8)
+    journal.close()
@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+from ttm_reprojection import CameraPose, ForwardWarper, fill_holes, heuristic_depth
+
+RED, GREEN = (255, 0, 0), (0, 160, 0)
+
+
+def identity(center=(0.0, 0.0, 0.0)) -> CameraPose:
+    return CameraPose(np.array(center, dtype=np.float64), np.eye(3))
+
+
+@pytest.fixture
+def box_scene():
+    """A near red box in front of a far green wall, 64x64"""
+    image = np.zeros((64, 64, 3), np.uint8)
+    image[:] = GREEN
+    image[..., 2] = np.arange(64, dtype=np.uint8)[None, :] * 4  # Texture, so shifts are visible
+    depth = np.full((64, 64), 10.0, np.float32)
+    image[24:40, 24:40] = RED
+    depth[24:40, 24:40] = 1.0
+    return image, depth
+
+
+def test_identity_pose_reproduces_the_image():
+    image = np.random.default_rng(0).integers(0, 256, (48, 64, 3), dtype=np.uint8)
+    warper = ForwardWarper(image, heuristic_depth(48, 64))
+
+    frame, mask = warper.render(identity())
+
+    assert np.array_equal(frame, image)
+    assert (mask == 255).all()
+
+
+def test_near_box_occludes_the_far_wall(box_scene):
+    image, depth = box_scene
+    warper = ForwardWarper(image, depth)
+    # The focal length is about 55px, so the box moves ~5.5px left and the wall ~0.5px
+    frame, mask = warper.render(identity((0.1, 0.0, 0.0)))
+
+    # Wall points land under the box too; the box is nearer and wins
+    assert (frame[26:38, 20:32] == RED).all()
+    # The wall the box hid in the source view is a disocclusion
+    assert (mask[26:38, 36:38] == 0).all()
+    assert (mask[:, :16] == 255).all()
+    # The hole is filled from the wall and the box, never left black
+    assert (frame[26:38, 36:38, :2].sum(axis=-1) > 0).all()
+
+
+def test_nearest_point_wins_regardless_of_source_order(box_scene):
+    image, depth = box_scene
+    # Mirrored, the box's points come after the wall points it covers in the scatter
+    flipped = ForwardWarper(image[:, ::-1].copy(), depth[:, ::-1].copy())
+    frame, _ = flipped.render(identity((-0.1, 0.0, 0.0)))
+    assert (frame[26:38, 32:44] == RED).all()
+
+
+def test_fill_holes_keeps_valid_pixels_and_blends_the_border():
+    frame = np.zeros((32, 32, 3), np.uint8)
+    frame[:, :16] = 100
+    frame[:, 16:] = 200
+    valid = np.ones((32, 32), bool)
+    valid[8:24, 12:20] = False
+    original = frame.copy()
+
+    fill_holes(frame, valid)
+
+    assert np.array_equal(frame[valid], original[valid])
+    hole = frame[8:24, 12:20, 0].astype(int)
+    assert ((hole >= 100) & (hole <= 200)).all()
+    # Nearer the bright side, the fill is brighter
+    assert (hole[:, -1] > hole[:, 0]).all()
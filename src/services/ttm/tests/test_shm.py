@@ -0,0 +1,100 @@
+import multiprocessing as mp
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+import pytest
+
+from ttm_shm import ALIGNMENT, RingFull, SharedFrameRing, _benchmark_worker
+
+
+@pytest.fixture
+def ring():
+    ring = SharedFrameRing.create(4 * ALIGNMENT)
+    yield ring
+    ring.close()
+
+
+def frames(value: int, nbytes: int = ALIGNMENT) -> np.ndarray:
+    return np.full((nbytes,), value, dtype=np.uint8)
+
+
+def test_attached_reads_are_zero_copy(ring):
+    descriptor = ring.write(frames(7))
+    attached = SharedFrameRing.attach(ring.name)
+    try:
+        view = attached.read(descriptor)
+        assert (view == 7).all()
+        ring.read(descriptor)[0] = 9
+        assert view[0] == 9
+        del view
+    finally:
+        attached.close()
+    # Closing an attached ring leaves the owner's segment in place
+    assert (ring.read(descriptor)[1:] == 7).all()
+
+
+def test_space_is_reused_in_allocation_order(ring):
+    descriptors = [ring.write(frames(i)) for i in range(4)]
+    with pytest.raises(RingFull):
+        ring.write(frames(4))
+
+    # Freeing a newer allocation behind a live older one reclaims nothing
+    ring.free(descriptors[1])
+    with pytest.raises(RingFull):
+        ring.write(frames(4))
+
+    ring.free(descriptors[0])
+    wrapped = ring.write(frames(4, 2 * ALIGNMENT))
+    assert wrapped.offset == 0
+    assert ring.used_bytes == 4 * ALIGNMENT
+
+
+def test_reset_reclaims_everything(ring):
+    for i in range(4):
+        ring.write(frames(i))
+    ring.reset()
+    assert ring.used_bytes == 0
+    descriptor = ring.write(frames(5, 4 * ALIGNMENT))
+    assert descriptor.offset == 0
+    assert (ring.read(descriptor) == 5).all()
+
+
+def test_close_unlinks_owned_segment():
+    ring = SharedFrameRing.create(ALIGNMENT)
+    name = ring.name
+    ring.close()
+    with pytest.raises(FileNotFoundError):
+        SharedMemory(name=name)
+    ring.close()  # Closing twice is harmless
+
+
+def test_reset_after_worker_crash():
+    image = np.random.default_rng(0).integers(0, 256, (4, 16, 16, 3), dtype=np.uint8)
+    inbox = SharedFrameRing.create(image.nbytes + ALIGNMENT)
+    outbox = SharedFrameRing.create(image.nbytes + ALIGNMENT)
+    ctx = mp.get_context("spawn")
+    parent, child = ctx.Pipe()
+    worker = ctx.Process(target=_benchmark_worker, args=(child, "shm", (inbox.name, outbox.name)))
+    worker.start()
+    try:
+        parent.send(("frames", inbox.write(image)))
+        _, _, out_descriptor = parent.recv()
+        assert (outbox.read(out_descriptor) == 255 - image).all()
+        worker.kill()
+        worker.join()
+
+        # The signal was never handed back, so the inbox stays full
+        with pytest.raises(RingFull):
+            inbox.write(image)
+        inbox.reset()
+        assert inbox.used_bytes == 0
+        assert (inbox.read(inbox.write(image)) == image).all()
+    finally:
+        if worker.is_alive():
+            worker.kill()
+        names = [inbox.name, outbox.name]
+        inbox.close()
+        outbox.close()
+    for name in names:
+        with pytest.raises(FileNotFoundError):
+            SharedMemory(name=name)
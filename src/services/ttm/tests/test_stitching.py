@@ -0,0 +1,108 @@
+import numpy as np
+import pytest
+
+from ttm_stitching import crossfade, plan_windows, stitch_windows
+
+
+@pytest.mark.parametrize("num_frames", [81, 82, 100, 161, 162, 241, 801])
+def test_windows_cover_the_clip_with_the_configured_overlap(num_frames):
+    windows = plan_windows(num_frames, 81, 9)
+
+    assert windows[0].start == 0
+    assert windows[-1].stop == num_frames
+    for window in windows:
+        assert len(window) <= 81
+        assert (len(window) - 1) % 4 == 0
+    for previous, window in zip(windows, windows[1:-1]):
+        assert previous.stop - window.start == 9
+    if len(windows) > 1:
+        # The last window is only as long as needed, so it may overlap by more
+        assert 9 <= windows[-2].stop - windows[-1].start < 9 + 4
+        assert windows[-1].start > windows[-2].start
+
+
+def test_short_clips_are_one_window():
+    assert plan_windows(50, 81, 9) == [range(0, 50)]
+
+
+@pytest.mark.parametrize("window, overlap", [(80, 9), (81, 0), (81, 40)])
+def test_invalid_window_settings_are_rejected(window, overlap):
+    with pytest.raises(ValueError):
+        plan_windows(200, window, overlap)
+
+
+def render_windows(windows, chunk: int, tails: list):
+    """
+    Frames whose channel 0 is the frame's index in the clip and channel 1
+    the window's level, so seams show up only in channel 1
+    """
+    def render(index, window, tail):
+        tails.append(tail)
+        for start in range(window.start, window.stop, chunk):
+            stop = min(start + chunk, window.stop)
+            frames = np.zeros((stop - start, 2, 2, 3), np.uint8)
+            frames[..., 0] = (np.arange(start, stop) % 256)[:, None, None]
+            frames[..., 1] = 40 * (index + 1)
+            yield frames
+
+    return render
+
+
+@pytest.mark.parametrize("chunk", [1, 4, 7, 81])
+def test_stitch_yields_every_frame_once_with_crossfaded_seams(chunk):
+    num_frames = 241
+    windows = plan_windows(num_frames, 81, 9)
+    tails = []
+
+    output = np.concatenate(list(stitch_windows(windows, render_windows(windows, chunk, tails))))
+
+    assert output.shape[0] == num_frames
+    assert np.array_equal(output[:, 0, 0, 0], np.arange(num_frames) % 256)
+
+    levels = output[:, 0, 0, 1].astype(float)
+    for index, window in enumerate(windows):
+        shared = windows[index - 1].stop - window.start if index else 0
+        solo_end = windows[index + 1].start if index + 1 < len(windows) else window.stop
+        assert (levels[window.start + shared:solo_end] == 40 * (index + 1)).all()
+        if index:
+            # The later window's weight rises linearly across the seam
+            weights = np.arange(1, shared + 1) / (shared + 1)
+            expected = 40 * (index + 1) * weights + 40 * index * (1 - weights)
+            assert np.abs(levels[window.start:window.start + shared] - expected).max() <= 1
+
+    # Each window is conditioned on the previous window's frames over the shared range
+    assert tails[0] is None
+    for previous, window, tail in zip(windows, windows[1:], tails[1:]):
+        assert np.array_equal(tail[:, 0, 0, 0], np.arange(window.start, previous.stop) % 256)
+
+
+def test_stitch_holds_back_only_the_overlap():
+    windows = plan_windows(241, 81, 9)
+    received = []
+
+    def render(index, window, tail):
+        yield np.zeros((len(window), 1, 1, 3), np.uint8)
+
+    for chunk in stitch_windows(windows, render):
+        received.append(len(chunk))
+    # Each window's frames are emitted up to the next window's start
+    ends = [window.start for window in windows[1:]] + [241]
+    assert received == [end - start for start, end in zip([0] + ends, ends)]
+
+
+def test_a_short_window_is_an_error():
+    windows = plan_windows(100, 81, 9)
+
+    def render(index, window, tail):
+        yield np.zeros((len(window) - 1, 1, 1, 3), np.uint8)
+
+    with pytest.raises(RuntimeError):
+        list(stitch_windows(windows, render))
+
+
+def test_crossfade_weights():
+    previous = np.zeros((3, 1, 1, 3), np.uint8)
+    current = np.full((3, 1, 1, 3), 200, np.uint8)
+    assert crossfade(previous, current, 0, 3)[:, 0, 0, 0].tolist() == [50, 100, 150]
+    # A later part of the same seam continues the ramp
+    assert crossfade(previous[:1], current[:1], 2, 3)[:, 0, 0, 0].tolist() == [150]
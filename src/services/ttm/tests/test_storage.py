@@ -0,0 +1,81 @@
+from pathlib import Path
+from urllib.parse import urlparse
+
+import pytest
+
+boto3 = pytest.importorskip("boto3")
+moto = pytest.importorskip("moto")
+requests = pytest.importorskip("requests")
+
+from ttm_storage import LocalStorage, S3Storage, StorageBackend
+
+
+@pytest.fixture
+def s3_client(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    with moto.mock_aws():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket="ttm-videos")
+        yield client
+
+
+def test_s3_multipart_upload_presign_and_delete(s3_client, tmp_path: Path):
+    data = bytes(range(256)) * (20 * 1024**2 // 256)  # 20 MB, three 8 MB parts
+    path = tmp_path / "video.mp4"
+    path.write_bytes(data)
+    storage = S3Storage("ttm-videos", prefix="outputs/", part_size_mb=8, presign_expiry=600, client=s3_client)
+
+    url = storage.upload(path, "p/job.mp4", "video/mp4")
+
+    head = s3_client.head_object(Bucket="ttm-videos", Key="outputs/p/job.mp4")
+    assert head["ContentType"] == "video/mp4"
+    assert head["ContentLength"] == len(data)
+    assert head["ETag"].strip('"').endswith("-3")
+
+    assert urlparse(url).path.endswith("/outputs/p/job.mp4")
+    response = requests.get(url)
+    assert response.status_code == 200
+    assert response.content == data
+
+    storage.delete("p/job.mp4")
+    assert s3_client.list_objects_v2(Bucket="ttm-videos").get("KeyCount") == 0
+    storage.delete("p/job.mp4")  # Missing objects are ignored
+
+
+def test_s3_small_upload_is_single_part(s3_client, tmp_path: Path):
+    path = tmp_path / "thumb.jpg"
+    path.write_bytes(b"\xff\xd8" + b"\0" * 1024)
+    storage = S3Storage("ttm-videos", client=s3_client)
+
+    storage.upload(path, "p/job_thumb.jpg", "image/jpeg")
+
+    head = s3_client.head_object(Bucket="ttm-videos", Key="p/job_thumb.jpg")
+    assert "-" not in head["ETag"].strip('"')
+    assert head["ContentType"] == "image/jpeg"
+
+
+def test_local_storage_rejects_keys_outside_directory(tmp_path: Path):
+    storage = LocalStorage(str(tmp_path / "out"))
+    source = tmp_path / "video.mp4"
+    source.write_bytes(b"video")
+
+    with pytest.raises(ValueError):
+        storage.upload(source, "../escaped.mp4", "video/mp4")
+    assert source.exists()
+
+    url = storage.upload(source, "p/job.mp4", "video/mp4")
+    assert Path(url).read_bytes() == b"video"
+    storage.delete("p/job.mp4")
+    assert not Path(url).exists()
+
+
+def test_backends_must_implement_upload_and_delete():
+    class UploadOnly(StorageBackend):
+        def upload(self, local_path, key, content_type):
+            return key
+
+    with pytest.raises(TypeError):
+        StorageBackend()
+    with pytest.raises(TypeError):
+        UploadOnly()
@@ -0,0 +1,83 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+import pytest
+
+from ttm_upscale import LanczosUpscaler, TiledUpscaler, Upscaler, feather, load_upscaler, tile_spans
+
+
+class NearestUpscaler(Upscaler):
+    """Pixel-exact at equal sizes, so any compositing error shows"""
+
+    name = "nearest"
+
+    def upscale(self, tile, size):
+        return cv2.resize(tile, size, interpolation=cv2.INTER_NEAREST)
+
+
+def blurred_frames(count: int, width: int, height: int) -> np.ndarray:
+    frames = np.random.default_rng(0).integers(0, 256, (count * height, width, 3), dtype=np.uint8)
+    return cv2.GaussianBlur(frames, (0, 0), 2).reshape(count, height, width, 3)
+
+
+@pytest.mark.parametrize("length", [64, 65, 100, 170, 300, 831])
+def test_tile_spans_cover_with_the_overlap(length):
+    spans = tile_spans(length, 64, 8)
+
+    assert spans[0][0] == 0
+    assert spans[-1][1] == length
+    assert all(end - start == min(length, 64) for start, end in spans)
+    for (_, end), (start, _) in zip(spans, spans[1:]):
+        assert end - start >= 8
+
+
+def test_feather_weights_sum_to_one():
+    spans = tile_spans(300, 64, 8)
+    total = np.zeros(300)
+    for index, (start, end) in enumerate(spans):
+        total[start:end] += feather(spans, index)
+    assert np.allclose(total, 1)
+
+
+@pytest.mark.parametrize("size", [(300, 170), (64, 64)])
+def test_tiles_reassemble_the_frame_exactly(size):
+    frames = blurred_frames(2, *size)
+    output = TiledUpscaler(NearestUpscaler(), size, size, tile=64, overlap=8).upscale_frames(frames)
+    assert np.array_equal(output, frames)
+
+
+@pytest.mark.parametrize("sharpen", [0.6, 0.0])
+def test_tiled_lanczos_stays_close_to_whole_frames(sharpen):
+    # Neither side is a multiple of the tile, so the last tiles overlap by more
+    frames = blurred_frames(2, 300, 170)
+    upscaler = LanczosUpscaler(sharpen=sharpen)
+    tiled_upscaler = TiledUpscaler(upscaler, (300, 170), (750, 425), tile=64, overlap=8)
+
+    tiled = tiled_upscaler.upscale_frames(frames)
+    whole = np.stack([upscaler.upscale(frame, (750, 425)) for frame in frames])
+
+    assert len(tiled_upscaler.tiles) == 18
+    difference = np.abs(tiled.astype(np.int16) - whole.astype(np.int16))
+    assert difference.max() <= 8
+    assert difference.mean() < 1
+
+
+def test_thread_pool_gives_the_same_frames():
+    frames = blurred_frames(3, 200, 130)
+    tiled = TiledUpscaler(LanczosUpscaler(), (200, 130), (333, 217), tile=64, overlap=8).upscale_frames(frames)
+    with ThreadPoolExecutor(4) as pool:
+        pooled = TiledUpscaler(LanczosUpscaler(), (200, 130), (333, 217), pool, tile=64, overlap=8).upscale_frames(frames)
+    assert np.array_equal(pooled, tiled)
+
+
+def test_load_upscaler():
+    assert isinstance(load_upscaler("lanczos"), LanczosUpscaler)
+    assert isinstance(load_upscaler(f"{__name__}:NearestUpscaler"), NearestUpscaler)
+    with pytest.raises(ValueError):
+        load_upscaler("bicubic")
+    with pytest.raises(TypeError):
+        load_upscaler("collections:OrderedDict")
+    # The abstract base fails when it is constructed
+    with pytest.raises(TypeError):
+        load_upscaler("ttm_upscale:Upscaler")
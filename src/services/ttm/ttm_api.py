@@ -5,28 +5,53 @@ Provides REST endpoints for motion-controlled video generation
 
 import os
 import sys
+import io
 import json
+import re
 import uuid
 import asyncio
+import hashlib
+from contextlib import asynccontextmanager
 from pathlib import Path
-from typing import Optional, Dict, Any, List
+from dataclasses import dataclass, field
+from typing import Optional, Dict, Any, List, Callable, Iterable, Tuple
 from datetime import datetime
+from concurrent.futures import Future, ThreadPoolExecutor
 import tempfile
 import shutil
 
 import logging
-from fastapi import FastAPI, HTTPException, UploadFile, File, Form, BackgroundTasks, Request
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Header, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, FileResponse
-from fastapi.concurrency import RateLimiter
-from pydantic import BaseModel, Field, validator
+from fastapi.responses import JSONResponse, FileResponse, StreamingResponse
+from pydantic import BaseModel, Field, PrivateAttr, field_validator, model_validator
 import torch
 from PIL import Image
 import numpy as np
-import cv2
-import imageio
 import time
 
+import ttm_core_service as core
+from ttm_core_service import (
+    TTMEngine, MotionSpec, MotionType, CameraMovement, MotionObjectSpec,
+    FragmentedMP4Writer, apply_default_indices, write_motion_signal, render_motion_signal, save_motion_signal,
+    export_video, save_thumbnail
+)
+from ttm_admission import FairQueue, ProjectQuota, AdmissionRejected, parse_quotas
+from ttm_pipeline import StagedExecutor, Stage
+from ttm_cpu import CPUPartition, plan_cores, to_channels_last
+from ttm_previews import PreviewCollector, build_previews
+from ttm_interpolation import FrameInterpolator, diffused_frame_count
+from ttm_upscale import Upscaler, LanczosUpscaler, TiledUpscaler, load_upscaler
+from ttm_stitching import plan_windows, stitch_windows
+from ttm_api_fixes import JOB_TIMEOUT
+from ttm_jobs import JobIndex, JobControl, JobControlGroup, JobCancelled, JobTimedOut, JobInterrupted, TERMINAL_STATUSES
+from ttm_journal import JobJournal, FINISHED_STATUSES
+from ttm_canary import CanaryProber, CachedSnapshot, ProbeSkipped
+from ttm_images import ImageStore
+from ttm_idempotency import SubmissionIndex, IdempotencyKeyConflict, request_fingerprint
+from ttm_storage import StorageBackend, LocalStorage, SupabaseStorage, S3Storage
+from ttm_wire import Trajectory, decode_json_request, decode_msgpack_request
+
 # Set up logging
 logging.basicConfig(
     level=logging.INFO,
@@ -34,37 +59,24 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Add TTM core to path
-sys.path.append(os.path.join(os.path.dirname(__file__), 'ttm-core'))
-
-# Import TTM components with proper error handling
-ttm_components = None
-try:
-    from pipelines.wan_pipeline import WanImageToVideoTTMPipeline
-    from pipelines.utils import validate_inputs, compute_hw_from_area
-    from diffusers.utils import export_to_video, load_image
-    ttm_components = (
-        WanImageToVideoTTMPipeline,
-        validate_inputs,
-        compute_hw_from_area,
-        export_to_video,
-        load_image
-    )
-    logger.info("TTM components loaded successfully")
-except ImportError as e:
-    logger.error(f"TTM components not fully installed: {e}")
-    logger.error("Please ensure TTM repository is cloned and dependencies are installed")
-    logger.info("Run: cd services/ttm && python ttm_api_fixes.py to validate installation")
-
 # Supabase integration for storage
 from supabase import create_client, Client
 
 # Configuration
 class Config:
     # Model settings
-    MODEL_ID = "Wan-AI/Wan2.2-I2V-A14B-Diffusers"
-    DTYPE = torch.bfloat16
-    DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+    MODEL_ID = core.MODEL_ID
+    MODEL_PATH = core.MODEL_PATH
+    DTYPE = core.DTYPE
+    DEVICE = core.DEVICE
+    CPU_INT8 = os.getenv("TTM_CPU_INT8", "0") == "1"  # Int8 transformer/text encoder when running on CPU
+    QUANTIZED_CACHE_DIR = "/tmp/ttm_cache/int8"
+
+    # CPU execution: concurrent inference slots on disjoint cores, 0 runs one job with torch defaults
+    CPU_SLOTS = int(os.getenv("TTM_CPU_SLOTS", "0"))
+    CPU_WORKER_CORES = int(os.getenv("TTM_CPU_WORKER_CORES", "2"))  # Reserved for OpenCV, PIL and ffmpeg
+    CPU_BF16_AUTOCAST = os.getenv("TTM_CPU_BF16_AUTOCAST", "0") == "1"
+    CPU_CHANNELS_LAST = os.getenv("TTM_CPU_CHANNELS_LAST", "1") == "1"
 
     # API settings
     HOST = "0.0.0.0"
@@ -74,23 +86,98 @@ class Config:
     # Storage settings
     TEMP_DIR = "/tmp/ttm_workspace"
     OUTPUT_DIR = "/tmp/ttm_outputs"
+    IMAGE_DIR = "/tmp/ttm_images"
+    IMAGE_HANDLE_TTL = int(os.getenv("TTM_IMAGE_HANDLE_TTL", "3600"))
 
     # Supabase settings (from environment)
     SUPABASE_URL = os.getenv("VITE_SUPABASE_URL", "")
     SUPABASE_KEY = os.getenv("VITE_SUPABASE_SERVICE_ROLE_KEY", "")
+    SUPABASE_BUCKET = "ttm-videos"
+
+    # Output storage: "local", "supabase" or "s3"; defaults to Supabase when configured
+    STORAGE_BACKEND = os.getenv("TTM_STORAGE_BACKEND", "")
+    S3_BUCKET = os.getenv("TTM_S3_BUCKET", "")
+    S3_ENDPOINT_URL = os.getenv("TTM_S3_ENDPOINT_URL", "")  # MinIO, R2, ...
+    S3_REGION = os.getenv("TTM_S3_REGION", "")
+    S3_PREFIX = os.getenv("TTM_S3_PREFIX", "")
+    S3_PART_SIZE_MB = int(os.getenv("TTM_S3_PART_SIZE_MB", "8"))
+    S3_MAX_CONCURRENCY = int(os.getenv("TTM_S3_MAX_CONCURRENCY", "8"))
+    S3_PRESIGN_EXPIRY = int(os.getenv("TTM_S3_PRESIGN_EXPIRY", str(7 * 24 * 3600)))
 
     # TTM defaults
-    DEFAULT_NUM_FRAMES = 81
-    DEFAULT_FPS = 16
-    DEFAULT_GUIDANCE_SCALE = 3.5
-    DEFAULT_NUM_INFERENCE_STEPS = 50
-    DEFAULT_MAX_AREA = 480 * 832
-
-    # Motion control defaults
-    DEFAULT_TWEAK_INDEX_OBJECT = 3
-    DEFAULT_TSTRONG_INDEX_OBJECT = 7
-    DEFAULT_TWEAK_INDEX_CAMERA = 2
-    DEFAULT_TSTRONG_INDEX_CAMERA = 5
+    DEFAULT_NUM_FRAMES = core.DEFAULT_NUM_FRAMES
+    DEFAULT_FPS = core.DEFAULT_FPS
+    DEFAULT_GUIDANCE_SCALE = core.DEFAULT_GUIDANCE_SCALE
+    DEFAULT_NUM_INFERENCE_STEPS = core.DEFAULT_NUM_INFERENCE_STEPS
+    DEFAULT_MAX_AREA = core.DEFAULT_MAX_AREA
+
+    # Job limits
+    MAX_JOB_TIMEOUT = 3600  # Per pipeline call; long videos get this for each window
+
+    # Job journal; mount a volume here so jobs survive redeploys as well as restarts
+    JOURNAL_DIR = os.getenv("TTM_JOURNAL_DIR", "/tmp/ttm_journal")
+    JOURNAL_RETENTION = int(os.getenv("TTM_JOURNAL_RETENTION", str(24 * 3600)))  # Seconds finished jobs are kept
+    DRAIN_TIMEOUT = float(os.getenv("TTM_DRAIN_TIMEOUT", "25"))  # Seconds running jobs get to finish on SIGTERM
+
+    # Canary: a tiny generation through the inference path every CANARY_INTERVAL seconds, 0 disables
+    CANARY_INTERVAL = float(os.getenv("TTM_CANARY_INTERVAL", "300"))
+    CANARY_MAX_AREA = 128 * 128
+    CANARY_NUM_FRAMES = 17
+    CANARY_STEPS = 4
+    CANARY_TIMEOUT = 120
+    CANARY_WINDOW = 30  # Runs kept for latency and error statistics
+    CANARY_DEGRADED_FACTOR = float(os.getenv("TTM_CANARY_DEGRADED_FACTOR", "1.5"))  # Slowdown vs baseline flagged as degraded
+    HEALTH_REFRESH_SECONDS = 5  # Age limit of the cached /health/detailed report
+
+    # Idempotent submissions
+    IDEMPOTENCY_TTL = int(os.getenv("TTM_IDEMPOTENCY_TTL", str(24 * 3600)))
+    IDEMPOTENCY_MAX_KEYS = 10_000
+
+    # Per-project admission: token bucket rate/burst in GPU cost units, DRR weight
+    PROJECT_RATE_PER_MINUTE = float(os.getenv("TTM_PROJECT_RATE_PER_MINUTE", "30"))
+    PROJECT_BURST = float(os.getenv("TTM_PROJECT_BURST", "10"))
+    PROJECT_QUOTAS = os.getenv("TTM_PROJECT_QUOTAS", "")  # project:rate_per_minute:burst:weight,...
+    DEFAULT_PROJECT = "default"  # Tenant for requests without a project_id
+
+    # Job pipeline: CPU workers either side of the single inference stage
+    PREPROCESS_WORKERS = int(os.getenv("TTM_PREPROCESS_WORKERS", "2"))
+    POSTPROCESS_WORKERS = int(os.getenv("TTM_POSTPROCESS_WORKERS", "2"))
+    STAGE_QUEUE_SIZE = 2  # Batches buffered between stages
+
+    # Progressive output: VAE decode and fMP4 fragments of this many frames, 0 decodes whole clips
+    STREAM_CHUNK_FRAMES = int(os.getenv("TTM_STREAM_CHUNK_FRAMES", str(core.DEFAULT_FPS)))
+    STREAM_POLL_SECONDS = 0.1
+
+    # Gallery previews (animated WebP, sprite sheet, keyframes) encoded in parallel
+    PREVIEW_THREADS = int(os.getenv("TTM_PREVIEW_THREADS", "4"))
+
+    # Frame interpolation: with `interpolate`, 1 in INTERPOLATION_FACTOR output frames is generated
+    INTERPOLATION_FACTOR = float(os.getenv("TTM_INTERPOLATION_FACTOR", "2"))
+    INTERPOLATION_THREADS = int(os.getenv("TTM_INTERPOLATION_THREADS", "4"))
+    MIN_FPS = 8
+    MAX_FPS = 60
+
+    # Upscaling: videos with an output size are generated at up to UPSCALE_MAX_AREA and enlarged in tiles on CPU
+    UPSCALER = os.getenv("TTM_UPSCALER", "lanczos")  # Registered name or module:Class
+    UPSCALE_MAX_AREA = int(os.getenv("TTM_UPSCALE_MAX_AREA", str(core.DEFAULT_MAX_AREA)))
+    UPSCALE_THREADS = int(os.getenv("TTM_UPSCALE_THREADS", "4"))
+    MIN_OUTPUT_SIDE = 64
+    MAX_OUTPUT_SIDE = 3840
+
+    # Long videos: clips beyond one pipeline call are generated in overlapping windows and cross-faded
+    MAX_NUM_FRAMES = int(os.getenv("TTM_MAX_NUM_FRAMES", "1601"))
+    LONG_WINDOW_FRAMES = int(os.getenv("TTM_LONG_WINDOW_FRAMES", "81"))  # 4k + 1, at most 161
+    LONG_OVERLAP_FRAMES = int(os.getenv("TTM_LONG_OVERLAP_FRAMES", "9"))  # Frames each window continues from
+
+    # Variant sweeps
+    MAX_VARIANTS = 16
+    MAX_VARIANT_BATCH = int(os.getenv("TTM_MAX_VARIANT_BATCH", "4"))  # Videos per pipeline call
+
+    # Encoder caches
+    PROMPT_CACHE_MB = int(os.getenv("TTM_PROMPT_CACHE_MB", "512"))
+    CONDITIONING_CACHE_MB = int(os.getenv("TTM_CONDITIONING_CACHE_MB", "1024"))
+    CONDITIONING_CACHE_DISK_MB = int(os.getenv("TTM_CONDITIONING_CACHE_DISK_MB", "0"))
+    CONDITIONING_CACHE_DIR = "/tmp/ttm_cache/conditioning"
 
 # Initialize FastAPI app
 app = FastAPI(
@@ -108,368 +195,1060 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Global pipeline instance (loaded on startup)
-ttm_pipeline = None
+# Global engine instance (loaded on startup)
+ttm_engine: Optional[TTMEngine] = None
+image_store = ImageStore(Config.IMAGE_DIR, Config.IMAGE_HANDLE_TTL)
+submission_index = SubmissionIndex(Config.IDEMPOTENCY_TTL, Config.IDEMPOTENCY_MAX_KEYS)
 supabase_client: Optional[Client] = None
+storage: StorageBackend = LocalStorage(Config.OUTPUT_DIR)
+upscaler: Upscaler = LanczosUpscaler()
 
 # Request/Response models
-class MotionType(str):
-    OBJECT = "object"
-    CAMERA = "camera"
+PROJECT_ID_PATTERN = re.compile(r"[A-Za-z0-9_-]{1,64}")  # Used as a storage key prefix
 
-class CameraMovement(BaseModel):
-    type: str = Field(..., description="Type of camera movement: pan, zoom, orbit, dolly")
-    params: Dict[str, Any] = Field(..., description="Movement-specific parameters")
-
-class TTMRequest(BaseModel):
+class TTMRequest(MotionSpec):
     """Request model for TTM video generation"""
-    motion_type: MotionType = Field(..., description="Type of motion control")
     prompt: str = Field(..., description="Text description of desired motion")
-    trajectory: Optional[List[Dict[str, float]]] = Field(None, description="Object motion trajectory points")
-    camera_movement: Optional[CameraMovement] = Field(None, description="Camera movement specification")
-    tweak_index: Optional[int] = Field(None, description="When to start denoising outside mask")
-    tstrong_index: Optional[int] = Field(None, description="When to start denoising inside mask")
-    num_frames: int = Field(Config.DEFAULT_NUM_FRAMES, description="Number of frames to generate")
     guidance_scale: float = Field(Config.DEFAULT_GUIDANCE_SCALE, description="Guidance scale")
     seed: Optional[int] = Field(None, description="Random seed for reproducibility")
     project_id: Optional[str] = Field(None, description="Alkemy project ID for storage")
-
-    @validator('tweak_index')
-    def validate_tweak_index(cls, v):
-        if v is not None and (v < 0 or v > 50):
-            raise ValueError('tweakIndex must be between 0 and 50')
-        return v
-
-    @validator('tstrong_index')
-    def validate_tstrong_index(cls, v):
-        if v is not None and (v < 0 or v > 50):
-            raise ValueError('tstrongIndex must be between 0 and 50')
+    image_id: Optional[str] = Field(None, description="Handle from POST /images, used instead of uploading the image")
+    timeout_seconds: Optional[int] = Field(None, description="Per-job deadline in seconds, counted from submission; defaults to 10 minutes per pipeline call")
+    fps: int = Field(Config.DEFAULT_FPS, description="Output frame rate; above 16 fps the extra frames are interpolated")
+    interpolate: bool = Field(False, description="Generate fewer frames and synthesize the rest by optical flow")
+    output_width: Optional[int] = Field(None, description="Upscale to this width; the height follows the aspect ratio unless given")
+    output_height: Optional[int] = Field(None, description="Upscale to this height; the width follows the aspect ratio unless given")
+
+    @field_validator('num_frames')
+    @classmethod
+    def validate_num_frames(cls, v):
+        if v < 16 or v > Config.MAX_NUM_FRAMES:
+            raise ValueError(f'numFrames must be between 16 and {Config.MAX_NUM_FRAMES}')
         return v
 
-    @validator('num_frames')
-    def validate_num_frames(cls, v):
-        if v < 16 or v > 161:
-            raise ValueError('numFrames must be between 16 and 161')
+    @field_validator('project_id')
+    @classmethod
+    def validate_project_id(cls, v):
+        if v is not None and not PROJECT_ID_PATTERN.fullmatch(v):
+            raise ValueError('projectId must be 1-64 letters, digits, underscores or hyphens')
         return v
 
-    @validator('guidance_scale')
+    @field_validator('guidance_scale')
+    @classmethod
     def validate_guidance_scale(cls, v):
         if v < 1 or v > 20:
             raise ValueError('guidanceScale must be between 1 and 20')
         return v
 
+    @field_validator('timeout_seconds')
+    @classmethod
+    def validate_timeout_seconds(cls, v):
+        if v is not None and v < 1:
+            raise ValueError('timeoutSeconds must be at least 1')
+        return v
+
+    @field_validator('fps')
+    @classmethod
+    def validate_fps(cls, v):
+        if v < Config.MIN_FPS or v > Config.MAX_FPS:
+            raise ValueError(f'fps must be between {Config.MIN_FPS} and {Config.MAX_FPS}')
+        return v
+
+    @field_validator('output_width', 'output_height')
+    @classmethod
+    def validate_output_size(cls, v):
+        if v is not None and (v < Config.MIN_OUTPUT_SIDE or v > Config.MAX_OUTPUT_SIDE):
+            raise ValueError(f'outputWidth and outputHeight must be between {Config.MIN_OUTPUT_SIDE} and {Config.MAX_OUTPUT_SIDE}')
+        return v
+
+    @model_validator(mode='after')
+    def validate_deadline(self):
+        # Long videos run one pipeline call per window, so the cap scales with them
+        limit = Config.MAX_JOB_TIMEOUT * pipeline_calls(self)
+        if self.timeout_seconds is not None and self.timeout_seconds > limit:
+            raise ValueError(f'timeoutSeconds must be at most {limit} for {self.num_frames} frames')
+        return self
+
+class VariantOverride(BaseModel):
+    """Per-variant overrides in a variant sweep"""
+    seed: Optional[int] = None
+    trajectory: Optional[Trajectory] = None
+    camera_movement: Optional[CameraMovement] = None
+    guidance_scale: Optional[float] = None
+
+class TTMVariantsRequest(TTMRequest):
+    """Request model for generating several variants of one image and prompt"""
+    variants: List[VariantOverride] = Field(..., description="Overrides for each variant")
+
+    @field_validator('variants')
+    @classmethod
+    def validate_variants(cls, v):
+        if not v or len(v) > Config.MAX_VARIANTS:
+            raise ValueError(f'variants must contain between 1 and {Config.MAX_VARIANTS} entries')
+        return v
+
+    def child_requests(self) -> List[TTMRequest]:
+        """Expand into one validated TTMRequest per variant"""
+        base = self.model_dump(exclude={"variants"})
+        return [
+            TTMRequest(**{**base, **variant.model_dump(exclude_none=True)})
+            for variant in self.variants
+        ]
+
 class TTMResponse(BaseModel):
     """Response model for TTM video generation"""
     status: str
     video_url: Optional[str] = None
     thumbnail_url: Optional[str] = None
+    preview_url: Optional[str] = None  # Small animated WebP
+    sprite_url: Optional[str] = None  # Sprite sheet for hover scrubbing
+    sprite_layout: Optional[Dict[str, Any]] = None  # Grid, tile size and frame index of each tile
+    keyframe_urls: Optional[List[str]] = None  # Full-resolution JPEGs at sprite_layout["keyframe_indices"]
     duration_seconds: Optional[float] = None
     frames: Optional[int] = None
+    diffused_frames: Optional[int] = None  # Frames generated by the model; the rest were interpolated
+    width: Optional[int] = None
+    height: Optional[int] = None
+    upscaled: Optional[bool] = None  # Generated smaller and upscaled to width x height
+    windows: Optional[int] = None  # Pipeline calls the video was generated in; above 1 they were stitched
     generation_time: Optional[float] = None
+    timings: Optional[Dict[str, Any]] = None  # Per-stage seconds and encoder cache hits
     error: Optional[str] = None
 
+class ImageHandle(BaseModel):
+    """Handle to an uploaded image stored at generation resolution"""
+    image_id: str
+    width: int
+    height: int
+    expires_at: str
+    deduplicated: bool
+
 class JobStatus(BaseModel):
     """Status of a generation job"""
     job_id: str
-    status: str  # "pending", "processing", "completed", "failed"
+    status: str  # "pending", "processing", "completed", "failed", "cancelled", "timed_out", "partial"
     progress: float  # 0.0 to 1.0
     result: Optional[TTMResponse] = None
-
-# Job tracking
-generation_jobs: Dict[str, JobStatus] = {}
-
-# Utility functions
-def create_motion_signal_from_trajectory(
-    image: Image.Image,
-    trajectory: List[Dict[str, float]],
-    num_frames: int
-) -> tuple[np.ndarray, np.ndarray]:
+    project_id: Optional[str] = None
+    parent_id: Optional[str] = None  # Variant sweep this job belongs to
+    children: Optional[List[str]] = None  # Child job IDs of a variant sweep
+    variants: Optional[List["JobStatus"]] = None  # Child statuses, filled in on read
+
+    # Set by the JobIndex holding the job, which re-files it on every status change
+    _status_listener: Optional[Any] = PrivateAttr(None)
+
+    def __setattr__(self, name: str, value: Any):
+        previous = self.status
+        super().__setattr__(name, value)
+        if name == "status" and value != previous and self._status_listener is not None:
+            self._status_listener(self, previous)
+
+class JobPage(BaseModel):
+    """One page of a job listing"""
+    jobs: List[JobStatus]
+    next_cursor: Optional[str] = None  # Pass back as `cursor` for the next page
+    total: int  # Jobs matching the filters
+
+class BatchStatusRequest(BaseModel):
+    """Job IDs to look up in one round trip"""
+    job_ids: List[str] = Field(..., max_length=500)
+
+class BatchStatusResponse(BaseModel):
+    jobs: List[JobStatus]
+    missing: List[str]  # Unknown or deleted job IDs
+
+def log_journal_failure(write: Future):
+    if write.exception() is not None:
+        logger.error(f"Journal write failed: {write.exception()}")
+
+def journal_status_change(job: JobStatus, previous: str):
     """
-    Create motion signal video and mask from trajectory points
-
-    Args:
-        image: Input image
-        trajectory: List of {x, y} coordinates (normalized 0-1)
-        num_frames: Number of frames to generate
+    Journal a state transition; finished jobs also record their result and stored outputs
 
-    Returns:
-        motion_signal: Video showing object motion
-        mask: Binary mask of moving region
-    """
-    h, w = image.height, image.width
-    motion_signal = []
-    masks = []
-
-    # Interpolate trajectory to num_frames
-    if len(trajectory) < num_frames:
-        # Simple linear interpolation
-        interp_trajectory = []
-        for i in range(num_frames):
-            t = i / (num_frames - 1) * (len(trajectory) - 1)
-            idx = int(t)
-            frac = t - idx
-            if idx < len(trajectory) - 1:
-                x = trajectory[idx]["x"] * (1 - frac) + trajectory[idx + 1]["x"] * frac
-                y = trajectory[idx]["y"] * (1 - frac) + trajectory[idx + 1]["y"] * frac
-            else:
-                x, y = trajectory[-1]["x"], trajectory[-1]["y"]
-            interp_trajectory.append({"x": x, "y": y})
-    else:
-        interp_trajectory = trajectory[:num_frames]
+    Status changes happen on the event loop, so the writes are deferred to
+    the journal thread; the record's contents are taken now.
+    """
+    if job.status not in FINISHED_STATUSES:
+        journal.defer(journal.status, job.job_id, job.status).add_done_callback(log_journal_failure)
+        return
+    journal.defer(
+        journal.status,
+        job.job_id,
+        job.status,
+        job.result.model_dump(mode="json") if job.result is not None else None,
+        job_storage_keys.get(job.job_id)
+    ).add_done_callback(log_journal_failure)
+    if job.parent_id is None:
+        journal.defer(journal.release_input, job.job_id).add_done_callback(log_journal_failure)
+
+# Job tracking, indexed by project and status and journaled to disk
+journal = JobJournal(Config.JOURNAL_DIR, Config.JOURNAL_RETENTION)
+generation_jobs: JobIndex = JobIndex(on_status_change=journal_status_change)
+draining = False  # Set on shutdown; new submissions are refused
+job_controls: Dict[str, JobControl] = {}
+job_storage_keys: Dict[str, List[str]] = {}  # Stored output keys per completed job
+job_streams: Dict[str, Path] = {}  # Videos currently being decoded and encoded, served by /stream
+
+# CPU mode: pinned inference slots, each running its own view of the engine
+cpu_partition: Optional[CPUPartition] = None
+if Config.DEVICE == "cpu" and Config.CPU_SLOTS > 0:
+    cpu_partition = CPUPartition(
+        plan_cores(Config.CPU_SLOTS, Config.CPU_WORKER_CORES),
+        # Int8 layers take float32 activations
+        bf16_autocast=Config.CPU_BF16_AUTOCAST and not Config.CPU_INT8
+    )
+slot_engines: Dict[int, TTMEngine] = {}
 
-    # Create frames
-    for i, pos in enumerate(interp_trajectory):
-        frame = np.array(image)
-        mask = np.zeros((h, w), dtype=np.uint8)
+preview_pool = ThreadPoolExecutor(
+    max_workers=Config.PREVIEW_THREADS,
+    thread_name_prefix="ttm-preview",
+    initializer=cpu_partition.pin_worker if cpu_partition else None
+)
 
-        # Draw object at position (simplified - in real implementation would cut and paste)
-        cx, cy = int(pos["x"] * w), int(pos["y"] * h)
-        cv2.circle(frame, (cx, cy), 50, (255, 0, 0), -1)
-        cv2.circle(mask, (cx, cy), 50, 255, -1)
+# Jobs waiting for the GPU, shared fairly between projects and consumed by a single worker task
+default_quota = ProjectQuota(Config.PROJECT_RATE_PER_MINUTE, Config.PROJECT_BURST)
+job_queue = FairQueue(quotas=parse_quotas(Config.PROJECT_QUOTAS, default_quota), default_quota=default_quota)
 
-        motion_signal.append(frame)
-        masks.append(mask)
+interpolation_pool = ThreadPoolExecutor(
+    max_workers=Config.INTERPOLATION_THREADS,
+    thread_name_prefix="ttm-interpolate",
+    initializer=cpu_partition.pin_worker if cpu_partition else None
+)
 
-    return np.array(motion_signal), np.array(masks)
+upscale_pool = ThreadPoolExecutor(
+    max_workers=Config.UPSCALE_THREADS,
+    thread_name_prefix="ttm-upscale",
+    initializer=cpu_partition.pin_worker if cpu_partition else None
+)
 
-def create_camera_motion_signal(
-    image: Image.Image,
-    camera_movement: CameraMovement,
-    num_frames: int
-) -> tuple[np.ndarray, np.ndarray]:
+def diffused_frames(request: TTMRequest) -> int:
     """
-    Create motion signal for camera movement using depth-based reprojection
-
-    Args:
-        image: Input image
-        camera_movement: Camera movement specification
-        num_frames: Number of frames
+    Frames the model generates for a request; the rest of its `num_frames` are interpolated
 
-    Returns:
-        motion_signal: Video showing camera motion
-        mask: Full frame mask (camera affects entire image)
+    The model moves at its native 16 fps, so a higher output `fps` needs
+    proportionally fewer generated frames for the same motion, and
+    `interpolate` thins them out by a further INTERPOLATION_FACTOR.
     """
-    h, w = image.height, image.width
-    motion_signal = []
-    masks = []
-
-    # Full frame mask for camera motion
-    full_mask = np.ones((h, w), dtype=np.uint8) * 255
-
-    for i in range(num_frames):
-        t = i / (num_frames - 1)
-        frame = np.array(image)
-
-        # Apply camera transformation based on type
-        if camera_movement.type == "zoom":
-            scale = 1 + t * camera_movement.params.get("amount", 0.5)
-            M = cv2.getRotationMatrix2D((w/2, h/2), 0, scale)
-            frame = cv2.warpAffine(frame, M, (w, h))
+    ratio = min(1.0, Config.DEFAULT_FPS / request.fps)
+    if request.interpolate:
+        ratio /= Config.INTERPOLATION_FACTOR
+    return diffused_frame_count(request.num_frames, ratio)
 
-        elif camera_movement.type == "pan":
-            dx = t * camera_movement.params.get("dx", 0) * w
-            dy = t * camera_movement.params.get("dy", 0) * h
-            M = np.float32([[1, 0, dx], [0, 1, dy]])
-            frame = cv2.warpAffine(frame, M, (w, h))
-
-        elif camera_movement.type == "orbit":
-            angle = t * camera_movement.params.get("angle", 30)
-            M = cv2.getRotationMatrix2D((w/2, h/2), angle, 1.0)
-            frame = cv2.warpAffine(frame, M, (w, h))
-
-        motion_signal.append(frame)
-        masks.append(full_mask)
+def generation_area(request: TTMRequest, image: Image.Image) -> int:
+    """
+    Largest area to generate a request at
 
-    return np.array(motion_signal), np.array(masks)
+    Requests with an output size are generated within UPSCALE_MAX_AREA, or
+    the output area when that is smaller, and upscaled afterwards.
+    """
+    if request.output_width is None and request.output_height is None:
+        return ttm_engine.max_area
+    aspect = image.width / image.height
+    width = request.output_width or request.output_height * aspect
+    height = request.output_height or request.output_width / aspect
+    return int(min(ttm_engine.max_area, Config.UPSCALE_MAX_AREA, width * height))
+
+def upscaled_size(request: TTMRequest, generated: Tuple[int, int]) -> Optional[Tuple[int, int]]:
+    """Output (width, height) of a request generated at `generated`, or None when it needs no resizing"""
+    if request.output_width is None and request.output_height is None:
+        return None
+    width, height = generated
+    output_width = request.output_width or round(request.output_height * width / height)
+    output_height = request.output_height or round(request.output_width * height / width)
+    size = (output_width // 2 * 2, output_height // 2 * 2)  # H.264 in yuv420p needs even sizes
+    return None if size == generated else size
+
+def generation_windows(request: TTMRequest) -> Optional[List[range]]:
+    """Overlapping windows of the generated frames when they exceed one pipeline call, else None"""
+    frames = diffused_frames(request)
+    if frames <= core.MAX_NUM_FRAMES:
+        return None
+    return plan_windows(frames, Config.LONG_WINDOW_FRAMES, Config.LONG_OVERLAP_FRAMES)
+
+def pipeline_calls(request: TTMRequest) -> int:
+    """Sequential pipeline calls a request needs: one, or one per window of a long video"""
+    windows = generation_windows(request)
+    return len(windows) if windows else 1
+
+def job_timeout(request: TTMRequest) -> float:
+    """Deadline of a job in seconds: the request's own, else JOB_TIMEOUT per pipeline call"""
+    return request.timeout_seconds or JOB_TIMEOUT * pipeline_calls(request)
+
+def job_cost(request: TTMRequest) -> float:
+    """GPU cost of a job in default-length videos, the unit of project quotas"""
+    windows = generation_windows(request)
+    frames = sum(len(window) for window in windows) if windows else diffused_frames(request)
+    return frames / Config.DEFAULT_NUM_FRAMES
 
-async def generate_ttm_video(
-    image: Image.Image,
+# Utility functions
+async def save_job_outputs(
+    job_id: str,
+    frames,
     request: TTMRequest,
-    job_id: str
-) -> TTMResponse:
+    timings: Dict[str, Any],
+    video_path: Optional[Path] = None,
+    previews: Optional[PreviewCollector] = None
+) -> Dict[str, Any]:
     """
-    Generate video using TTM pipeline
+    Encode frames to MP4, build the thumbnail and gallery previews, and hand everything to the storage backend
 
-    Args:
-        image: Input image
-        request: TTM request parameters
-        job_id: Job ID for tracking
+    With `video_path` the video was already encoded while it was decoded,
+    and `previews` holds the frames kept for previews along the way. If a
+    remote upload fails the local files are kept and their paths returned.
 
     Returns:
-        TTMResponse with video URL and metadata
+        URL fields of the TTMResponse
     """
-    global ttm_pipeline, generation_jobs
+    output_dir = Path(Config.OUTPUT_DIR)
+    output_path = video_path or output_dir / f"{job_id}.mp4"
+    if previews is None:
+        previews = PreviewCollector(len(frames), request.fps)
+        previews.add(frames)
+
+    async def timed(stage: str, fn, *args):
+        stage_start = time.perf_counter()
+        result = await asyncio.to_thread(fn, *args)
+        timings[stage] = time.perf_counter() - stage_start
+        return result
+
+    # Save output video, thumbnail and previews; the preview encoders run on their own thread pool
+    stages = [timed("previews", build_previews, previews, output_dir, job_id, preview_pool)]
+    if video_path is None:
+        stages.append(timed("export", export_video, frames, output_path, request.fps))
+    built = (await asyncio.gather(*stages))[0]
+    thumbnail_path = save_thumbnail(previews.keyframes[:1], output_dir / f"{job_id}_thumb.jpg")
+
+    files = [
+        (output_path, "video/mp4"),
+        (thumbnail_path, "image/jpeg"),
+        (built["preview"], "image/webp"),
+        (built["sprite"], "image/jpeg"),
+    ] + [(path, "image/jpeg") for path in built["keyframes"]]
+    urls = [str(path) for path, _ in files]
+
+    prefix = f"{request.project_id}/" if request.project_id else ""
+    keys = [prefix + path.name for path, _ in files]
+    try:
+        stage_start = time.perf_counter()
+        urls = await asyncio.gather(*(
+            asyncio.to_thread(storage.upload, path, key, content_type)
+            for (path, content_type), key in zip(files, keys)
+        ))
+        timings["upload"] = time.perf_counter() - stage_start
+        job_storage_keys[job_id] = keys
+        if not storage.is_local:
+            for path, _ in files:
+                path.unlink(missing_ok=True)
+    except Exception as e:
+        logger.error(f"Upload of {job_id} to {storage.name} storage failed: {e}")
 
-    # Check if TTM is properly installed
-    if ttm_components is None:
-        return TTMResponse(
-            status="failed",
-            error="TTM components not available. Please run: python ttm_api_fixes.py"
+    return {
+        "video_url": urls[0],
+        "thumbnail_url": urls[1],
+        "preview_url": urls[2],
+        "sprite_url": urls[3],
+        "sprite_layout": built["layout"],
+        "keyframe_urls": list(urls[4:]),
+    }
+
+def create_storage() -> StorageBackend:
+    """Output storage backend selected by Config.STORAGE_BACKEND"""
+    backend = Config.STORAGE_BACKEND or ("supabase" if supabase_client else "local")
+    if backend == "local":
+        return LocalStorage(Config.OUTPUT_DIR)
+    if backend == "supabase":
+        if supabase_client is None:
+            raise ValueError("Supabase storage needs VITE_SUPABASE_URL and VITE_SUPABASE_SERVICE_ROLE_KEY")
+        return SupabaseStorage(supabase_client, Config.SUPABASE_BUCKET)
+    if backend == "s3":
+        if not Config.S3_BUCKET:
+            raise ValueError("S3 storage needs TTM_S3_BUCKET")
+        return S3Storage(
+            Config.S3_BUCKET,
+            endpoint_url=Config.S3_ENDPOINT_URL,
+            region=Config.S3_REGION,
+            prefix=Config.S3_PREFIX,
+            part_size_mb=Config.S3_PART_SIZE_MB,
+            max_concurrency=Config.S3_MAX_CONCURRENCY,
+            presign_expiry=Config.S3_PRESIGN_EXPIRY
         )
+    raise ValueError(f"Unknown storage backend: {backend}")
+
+@dataclass
+class PreparedBatch:
+    """Jobs sharing one pipeline call, carried from preprocessing through inference to post-processing"""
+    image: Image.Image
+    requests: List[TTMRequest]
+    job_ids: List[str]
+    jobs: List[JobStatus]
+    controls: List[JobControl]
+    temp_dir: Path
+    start_time: datetime
+    parent_id: Optional[str] = None
+    motion_signal_path: Optional[Path] = None
+    mask_path: Optional[Path] = None
+    result: Optional[List[Any]] = None  # Frames, or an EncodedVideo when streamed, per job
+    timings: Dict[str, Any] = field(default_factory=dict)
+    diffused_frames: Optional[int] = None  # Set when fewer frames are generated than requested
+    output_size: Optional[Tuple[int, int]] = None  # Set when the video is upscaled after generation
+    windows: Optional[List[range]] = None  # Set when the video is too long for one pipeline call
+
+    @property
+    def spec(self) -> TTMRequest:
+        """The first request as the pipeline runs it, with the diffused frame count"""
+        if self.diffused_frames is None:
+            return self.requests[0]
+        return self.requests[0].model_copy(update={"num_frames": self.diffused_frames})
+
+    @property
+    def control(self) -> JobControlGroup:
+        return JobControlGroup(self.controls)
+
+    def set_progress(self, progress: float):
+        for job in self.jobs:
+            if job.status not in TERMINAL_STATUSES:
+                job.progress = progress
+
+@dataclass
+class EncodedVideo:
+    """A video already decoded chunk by chunk into an fMP4 file"""
+    path: Path
+    previews: PreviewCollector  # Frames kept for the thumbnail and gallery previews
+    seconds: float
+    timings: Dict[str, float] = field(default_factory=dict)  # Interpolation, upscaling and windowed generation seconds
+
+# GPU path: a running canary and its control, so a batch entering inference can preempt it
+canary_lock = asyncio.Lock()
+canary_control: Optional[JobControl] = None
+
+@asynccontextmanager
+async def exclusive_inference():
+    """
+    Keep a batch's inference off the GPU while the canary is on it
 
-    WanImageToVideoTTMPipeline, validate_inputs, compute_hw_from_area, export_to_video, load_image = ttm_components
+    The canary only starts when the inference stage is idle, but a job can
+    arrive while it runs. It is then cancelled at its next denoising step
+    and the batch waits for it to unwind, so the two never share the GPU.
+    CPU slots run on disjoint cores and need no exclusion.
+    """
+    if cpu_partition is not None:
+        yield
+        return
+    if canary_control is not None:
+        canary_control.cancel()
+    async with canary_lock:
+        yield
+
+async def run_inference(fn: Callable, *args, **kwargs):
+    """
+    Run `fn(engine, *args, **kwargs)` off the event loop
 
-    start_time = datetime.now()
+    In CPU mode it runs in a free inference slot, on that slot's view of
+    the engine; otherwise in a worker thread on the shared engine.
+    """
+    if cpu_partition is None:
+        return await asyncio.to_thread(fn, ttm_engine, *args, **kwargs)
+
+    def run(slot: int, *args, **kwargs):
+        if slot not in slot_engines:
+            slot_engines[slot] = ttm_engine.for_slot()
+        return fn(slot_engines[slot], *args, **kwargs)
+
+    return await cpu_partition.run_in_slot(run, *args, **kwargs)
+
+def encode_chunks(
+    job: JobStatus,
+    job_id: str,
+    chunks: Iterable[np.ndarray],
+    control: JobControlGroup,
+    num_frames: int,
+    fps: int,
+    chunk_frames: int,
+    diffused_frames: Optional[int] = None,
+    output_size: Optional[Tuple[int, int]] = None
+) -> EncodedVideo:
+    """
+    Pipe chunks of frames into a fragmented MP4, retiming and upscaling each chunk first
+
+    Runs in a worker thread. While it runs the growing file is served by
+    /stream/{job_id}. With `diffused_frames`, each chunk is retimed to the
+    `num_frames` output on the interpolation pool; with `output_size`, it
+    is then upscaled in tiles on the upscale pool. Only one chunk of output
+    frames is in memory at a time. In CPU mode each chunk is processed and
+    encoded on the worker cores while the slot produces the next one.
+    """
+    path = Path(Config.OUTPUT_DIR) / f"{job_id}.mp4"
+    previews = PreviewCollector(num_frames, fps)
+    interpolator = FrameInterpolator(diffused_frames, num_frames, interpolation_pool) if diffused_frames else None
+    tiled: Optional[TiledUpscaler] = None
+    start = time.perf_counter()
+    job_streams[job_id] = path
+
+    def encode(writer: FragmentedMP4Writer, chunk):
+        nonlocal tiled
+        if interpolator is not None:
+            chunk = interpolator.add(chunk)
+        if output_size is not None:
+            if tiled is None:
+                tiled = TiledUpscaler(upscaler, (chunk.shape[2], chunk.shape[1]), output_size, upscale_pool)
+            chunk = tiled.upscale_frames(chunk)
+        writer.append(chunk)
+        previews.add(chunk)
+        job.progress = 0.8 + 0.15 * writer.frames / num_frames
 
     try:
-        # Update job status
-        generation_jobs[job_id].status = "processing"
-        generation_jobs[job_id].progress = 0.1
-
-        # Set default indices based on motion type
-        if request.tweak_index is None:
-            request.tweak_index = (
-                Config.DEFAULT_TWEAK_INDEX_OBJECT if request.motion_type == MotionType.OBJECT
-                else Config.DEFAULT_TWEAK_INDEX_CAMERA
-            )
-        if request.tstrong_index is None:
-            request.tstrong_index = (
-                Config.DEFAULT_TSTRONG_INDEX_OBJECT if request.motion_type == MotionType.OBJECT
-                else Config.DEFAULT_TSTRONG_INDEX_CAMERA
-            )
+        # One fragment per input chunk, which interpolation stretches
+        fragment_frames = round(chunk_frames * num_frames / (diffused_frames or num_frames))
+        with FragmentedMP4Writer(path, fps, fragment_frames) as writer:
+            encoding = None
+            for chunk in chunks:
+                control.check()
+                if cpu_partition is None:
+                    encode(writer, chunk)
+                    continue
+                if encoding is not None:
+                    encoding.result()
+                encoding = cpu_partition.worker_pool.submit(encode, writer, chunk)
+            if encoding is not None:
+                encoding.result()
+    except Exception:
+        path.unlink(missing_ok=True)
+        raise
+    finally:
+        job_streams.pop(job_id, None)
+    timings = {}
+    if interpolator is not None:
+        timings["interpolate"] = interpolator.seconds
+    if tiled is not None:
+        timings["upscale"] = tiled.seconds
+    return EncodedVideo(path, previews, time.perf_counter() - start, timings)
+
+def encode_streamed_video(
+    engine: TTMEngine,
+    job: JobStatus,
+    job_id: str,
+    latents,
+    control: JobControlGroup,
+    num_frames: int,
+    fps: int,
+    diffused_frames: Optional[int] = None,
+    output_size: Optional[Tuple[int, int]] = None
+) -> EncodedVideo:
+    """
+    Decode one video's latents in chunks, piping each chunk into a fragmented MP4
 
-        # Create motion signals based on type
-        if request.motion_type == MotionType.OBJECT and request.trajectory:
-            motion_signal, mask = create_motion_signal_from_trajectory(
-                image, request.trajectory, request.num_frames
-            )
-        elif request.motion_type == MotionType.CAMERA and request.camera_movement:
-            motion_signal, mask = create_camera_motion_signal(
-                image, request.camera_movement, request.num_frames
-            )
+    The growing file is served by /stream/{job_id} while it is written, and
+    decoded frames never exceed one chunk in memory; see `encode_chunks`.
+    """
+    chunks = engine.decode_chunks(latents, Config.STREAM_CHUNK_FRAMES)
+    return encode_chunks(
+        job, job_id, chunks, control, num_frames, fps, Config.STREAM_CHUNK_FRAMES, diffused_frames, output_size
+    )
+
+def generate_long_video(
+    engine: TTMEngine,
+    job: JobStatus,
+    job_id: str,
+    batch: PreparedBatch,
+    request: TTMRequest
+) -> EncodedVideo:
+    """
+    Generate a video longer than one pipeline call window by window, straight into a fragmented MP4
+
+    Runs in a worker thread or inference slot. Each window renders only its
+    range of the motion signal; the frames it shares with the previous
+    window are replaced by that window's output, masked as fully
+    constrained, and the first of them becomes the conditioning image, so
+    every window continues where the last one left off. The shared frames
+    are cross-faded by `stitch_windows` and the result retimed, upscaled
+    and encoded by `encode_chunks`, so memory holds one window's motion
+    signal and latents however long the clip is.
+    """
+    spec = batch.spec
+    streamed = Config.STREAM_CHUNK_FRAMES > 0
+    chunk_frames = Config.STREAM_CHUNK_FRAMES or Config.DEFAULT_FPS
+    timings: Dict[str, float] = {}
+    generation_seconds = 0.0
+
+    def render(index: int, window: range, tail: Optional[np.ndarray]):
+        nonlocal generation_seconds
+        stage_start = time.perf_counter()
+        motion_signal, mask = render_motion_signal(batch.image, spec, window)
+        if tail is not None:
+            motion_signal[:len(tail)] = tail
+            mask[:len(tail)] = 255
+        window_dir = batch.temp_dir / f"{job_id}_window{index}"
+        motion_signal_path, mask_path = save_motion_signal(motion_signal, mask, window_dir, Config.DEFAULT_FPS)
+        del motion_signal, mask
+        timings["window_preprocess"] = timings.get("window_preprocess", 0.0) + time.perf_counter() - stage_start
+
+        window_timings: Dict[str, Any] = {}
+        generate = engine.generate_latents if streamed else engine.generate
+        output = generate(
+            batch.image if tail is None else Image.fromarray(tail[0]),
+            spec.prompt,
+            spec.model_copy(update={"num_frames": len(window)}),
+            [None if request.seed is None else request.seed + index],
+            guidance_scale=spec.guidance_scale,
+            motion_signal_path=motion_signal_path,
+            mask_path=mask_path,
+            callback=batch.control.step_callback,
+            timings=window_timings
+        )[0]
+        shutil.rmtree(window_dir, ignore_errors=True)
+        generation_seconds += time.perf_counter() - stage_start
+        for name, seconds in window_timings.items():
+            if isinstance(seconds, float):
+                timings[name] = timings.get(name, 0.0) + seconds
+
+        if streamed:
+            yield from engine.decode_chunks(output, chunk_frames)
         else:
-            raise ValueError(f"Invalid motion specification for {request.motion_type}")
+            yield from (output[k:k + chunk_frames] for k in range(0, len(output), chunk_frames))
 
-        generation_jobs[job_id].progress = 0.3
+    video = encode_chunks(
+        job, job_id, stitch_windows(batch.windows, render), batch.control, request.num_frames, request.fps,
+        chunk_frames, batch.diffused_frames, batch.output_size
+    )
+    # Generation ran inside the encode loop; report it separately from decode and encode
+    video.seconds -= generation_seconds
+    video.timings.update(timings)
+    return video
+
+def release_batch(batch: PreparedBatch):
+    """Drop a batch's frames and intermediate files and forget its job controls"""
+    batch.result = None
+    shutil.rmtree(batch.temp_dir, ignore_errors=True)
+    for job_id in batch.job_ids:
+        job_controls.pop(job_id, None)
+    if batch.parent_id in generation_jobs:
+        refresh_parent_status(generation_jobs[batch.parent_id])
+
+def fail_batch(batch: PreparedBatch, error: Exception):
+    """Record why a batch stopped and release it"""
+    if isinstance(error, JobInterrupted):
+        # Still pending/processing in the journal, so the next start runs it again
+        logger.info(f"Jobs {batch.job_ids} interrupted: {error}")
+        release_batch(batch)
+        return
+    if isinstance(error, (JobCancelled, JobTimedOut)):
+        status = "cancelled" if isinstance(error, JobCancelled) else "timed_out"
+        logger.info(f"Jobs {batch.job_ids} stopped: {error}")
+    else:
+        status = "failed"
+        logger.error(f"Jobs {batch.job_ids} failed: {error}")
+    for job in batch.jobs:
+        job.result = TTMResponse(status=status, error=str(error))
+        job.status = status
+    for video in batch.result or []:
+        if isinstance(video, EncodedVideo):
+            video.path.unlink(missing_ok=True)
+    release_batch(batch)
+
+def plan_batches(request: TTMRequest, job_id: str):
+    """
+    Split a queued job into pipeline calls, as (requests, job_ids) pairs
 
-        # Save temporary files for TTM
-        temp_dir = Path(Config.TEMP_DIR) / job_id
-        temp_dir.mkdir(parents=True, exist_ok=True)
+    A single job is a batch of one. Variants of a sweep that share a motion
+    signal and guidance scale run together in batches of up to
+    MAX_VARIANT_BATCH videos; children cancelled before their batch is
+    planned are skipped.
+    """
+    if not isinstance(request, TTMVariantsRequest):
+        yield [request], [job_id]
+        return
+
+    parent = generation_jobs[job_id]
+    groups: Dict[str, List[tuple[TTMRequest, str]]] = {}
+    for child_request, child_id in zip(request.child_requests(), parent.children):
+        groups.setdefault(variant_motion_key(child_request), []).append((child_request, child_id))
+
+    for members in groups.values():
+        for i in range(0, len(members), Config.MAX_VARIANT_BATCH):
+            batch = [
+                (r, child_id) for r, child_id in members[i:i + Config.MAX_VARIANT_BATCH]
+                if child_id in generation_jobs and generation_jobs[child_id].status not in TERMINAL_STATUSES
+            ]
+            if batch:
+                yield [r for r, _ in batch], [child_id for _, child_id in batch]
 
-        motion_signal_path = temp_dir / "motion_signal.mp4"
-        mask_path = temp_dir / "mask.mp4"
+async def preprocess_job(item):
+    """
+    Pipeline stage 1: prepare the image and motion signal of each batch of a queued job
 
-        imageio.mimwrite(motion_signal_path, motion_signal, fps=Config.DEFAULT_FPS)
-        imageio.mimwrite(mask_path, mask, fps=Config.DEFAULT_FPS)
+    Variant sweeps yield one batch at a time, so a sweep's later motion
+    signals are only rendered once inference is close to needing them.
+    """
+    job_id, image, request = item
+    job = generation_jobs.get(job_id)
+    if job is None or job.status in TERMINAL_STATUSES:
+        # Cancelled or deleted before it reached the pipeline
+        job_controls.pop(job_id, None)
+        return
+
+    for requests, job_ids in plan_batches(request, job_id):
+        batch = PreparedBatch(
+            image=image,
+            requests=requests,
+            job_ids=job_ids,
+            jobs=[generation_jobs[i] for i in job_ids],
+            controls=[job_controls[i] for i in job_ids],
+            temp_dir=Path(Config.TEMP_DIR) / job_ids[0],
+            start_time=datetime.now(),
+            parent_id=job_id if job_ids != [job_id] else None
+        )
+        try:
+            # Jobs can be cancelled or expire while still queued
+            batch.control.check()
+            for job in batch.jobs:
+                job.status = "processing"
+            batch.set_progress(0.1)
+
+            for r in requests:
+                apply_default_indices(r)
+            frames = diffused_frames(requests[0])
+            if frames < requests[0].num_frames:
+                batch.diffused_frames = frames
+            batch.windows = generation_windows(requests[0])
+
+            # Prepare image (stored image handles are already at target size) and motion signal
+            stage_start = time.perf_counter()
+            batch.image = await asyncio.to_thread(ttm_engine.prepare_image, image, generation_area(requests[0], image))
+            batch.output_size = upscaled_size(requests[0], batch.image.size)
+            if batch.windows is None:
+                # Long videos render each window's motion signal just before it is generated
+                batch.motion_signal_path, batch.mask_path = await asyncio.to_thread(
+                    write_motion_signal, batch.image, batch.spec, batch.temp_dir, Config.DEFAULT_FPS
+                )
+            batch.timings["preprocess"] = time.perf_counter() - stage_start
+            batch.set_progress(0.4)
+        except Exception as e:
+            fail_batch(batch, e)
+            continue
+        yield batch
 
-        generation_jobs[job_id].progress = 0.4
+    if job.children:
+        refresh_parent_status(job)
 
-        # Prepare image
-        mod_value = ttm_pipeline.vae_scale_factor_spatial * ttm_pipeline.transformer.config.patch_size[1]
-        height, width = compute_hw_from_area(
-            image.height, image.width, Config.DEFAULT_MAX_AREA, mod_value
-        )
-        image = image.resize((width, height))
-
-        # Generate with TTM
-        generator = None
-        if request.seed is not None:
-            gen_device = Config.DEVICE if Config.DEVICE.startswith("cuda") else "cpu"
-            generator = torch.Generator(device=gen_device).manual_seed(request.seed)
-
-        generation_jobs[job_id].progress = 0.5
-
-        with torch.inference_mode():
-            result = ttm_pipeline(
-                image=image,
-                prompt=request.prompt,
-                negative_prompt="",  # Could be configurable
-                height=height,
-                width=width,
-                num_frames=request.num_frames,
-                guidance_scale=request.guidance_scale,
-                num_inference_steps=Config.DEFAULT_NUM_INFERENCE_STEPS,
-                generator=generator,
-                motion_signal_video_path=str(motion_signal_path),
-                motion_signal_mask_path=str(mask_path),
-                tweak_index=request.tweak_index,
-                tstrong_index=request.tstrong_index,
+async def infer_batch(batch: PreparedBatch):
+    """
+    Pipeline stage 2: the only stage that touches the GPU
+
+    The batch runs as one pipeline call with one generator per video, off
+    the event loop so cancel/status requests are served meanwhile. With
+    STREAM_CHUNK_FRAMES set, the pipeline stops at the latents and each
+    video is decoded in chunks straight into a fragmented MP4 that clients
+    can play while the rest is decoding. In CPU mode the stage has one
+    worker per inference slot, so batches run side by side; on the GPU a
+    running canary is preempted first (see `exclusive_inference`). Interpolated
+    jobs are generated at `batch.diffused_frames`, and videos longer than
+    one pipeline call window by window with `generate_long_video`.
+    """
+    request = batch.spec
+    streamed = Config.STREAM_CHUNK_FRAMES > 0
+    try:
+        batch.control.check()
+        batch.set_progress(0.5)
+        # Time spent waiting behind other batches after preprocessing
+        batch.timings["queued_for_inference"] = (datetime.now() - batch.start_time).total_seconds() - batch.timings["preprocess"]
+        async with exclusive_inference():
+            if batch.windows is not None:
+                # Each video continues from its own previous window, so members run one after another
+                batch.result = []
+                for job_id, job, job_control, r in zip(batch.job_ids, batch.jobs, batch.controls, batch.requests):
+                    batch.result.append(None if job_control.cancelled else await run_inference(
+                        generate_long_video, job, job_id, batch, r
+                    ))
+            else:
+                output = await run_inference(
+                    TTMEngine.generate_latents if streamed else TTMEngine.generate,
+                    batch.image,
+                    request.prompt,
+                    request,
+                    [r.seed for r in batch.requests],
+                    guidance_scale=request.guidance_scale,
+                    motion_signal_path=batch.motion_signal_path,
+                    mask_path=batch.mask_path,
+                    callback=batch.control.step_callback,
+                    timings=batch.timings
+                )
+                batch.control.check()
+                batch.set_progress(0.8)
+
+                if not streamed:
+                    batch.result = output
+                else:
+                    batch.result = []
+                    for job_id, job, job_control, r, latents in zip(batch.job_ids, batch.jobs, batch.controls, batch.requests, output):
+                        # Members cancelled individually are not decoded
+                        batch.result.append(None if job_control.cancelled else await run_inference(
+                            encode_streamed_video, job, job_id, latents, batch.control, r.num_frames, r.fps,
+                            batch.diffused_frames, batch.output_size
+                        ))
+    except Exception as e:
+        fail_batch(batch, e)
+        return
+    finally:
+        # Release cached GPU blocks before the next batch
+        if Config.DEVICE == "cuda":
+            torch.cuda.empty_cache()
+    yield batch
+
+async def postprocess_batch(batch: PreparedBatch):
+    """Pipeline stage 3: interpolation, upscaling, encode, thumbnail, previews and upload of each video of a batch"""
+    try:
+        for i, (job_id, job, job_control, r) in enumerate(zip(batch.job_ids, batch.jobs, batch.controls, batch.requests)):
+            # Members of a batch can be cancelled individually; their output is discarded
+            if job_control.cancelled:
+                job.status = "cancelled"
+                job.result = TTMResponse(status="cancelled", error=f"Job {job_id} was cancelled")
+                continue
+
+            job_timings = dict(batch.timings)
+            video = batch.result[i]
+            if isinstance(video, EncodedVideo):
+                job_timings["decode_and_encode"] = video.seconds
+            elif batch.diffused_frames is not None or batch.output_size is not None:
+                # Retimed and upscaled a chunk at a time, so the output frames are never all in memory
+                frames, chunk_frames = video, Config.DEFAULT_FPS
+                video = await asyncio.to_thread(
+                    encode_chunks, job, job_id, (frames[k:k + chunk_frames] for k in range(0, len(frames), chunk_frames)),
+                    job_control, r.num_frames, r.fps, chunk_frames, batch.diffused_frames, batch.output_size
+                )
+                job_timings["export"] = video.seconds
+            if isinstance(video, EncodedVideo):
+                job_timings.update(video.timings)
+                outputs = await save_job_outputs(job_id, None, r, job_timings, video.path, video.previews)
+            else:
+                outputs = await save_job_outputs(job_id, video, r, job_timings)
+            job.progress = 1.0
+
+            job.result = TTMResponse(
+                status="completed",
+                **outputs,
+                duration_seconds=r.num_frames / r.fps,
+                frames=r.num_frames,
+                diffused_frames=batch.diffused_frames or r.num_frames,
+                width=(batch.output_size or batch.image.size)[0],
+                height=(batch.output_size or batch.image.size)[1],
+                upscaled=batch.output_size is not None,
+                windows=len(batch.windows) if batch.windows else 1,
+                generation_time=(datetime.now() - batch.start_time).total_seconds(),
+                timings=job_timings
             )
+            job.status = "completed"
+    except Exception as e:
+        fail_batch(batch, e)
+        return
+    release_batch(batch)
+
+def variant_motion_key(request: TTMRequest) -> str:
+    """Variants with equal keys share a motion signal and can be batched"""
+    return json.dumps({
+        "trajectory": request.trajectory.tobytes().hex() if request.trajectory is not None else None,
+        "objects": request.model_dump_json(include={"objects"}) if request.objects else None,
+        "camera_movement": request.camera_movement.model_dump(mode="json") if request.camera_movement else None,
+        "guidance_scale": request.guidance_scale,
+    }, sort_keys=True)
+
+def refresh_parent_status(parent: JobStatus):
+    """Derive a variant sweep's status and progress from its children"""
+    children = [generation_jobs[c] for c in parent.children if c in generation_jobs]
+    if not children:
+        return
+    parent.progress = sum(c.progress for c in children) / len(children)
+    statuses = {c.status for c in children}
+    if not statuses <= set(TERMINAL_STATUSES):
+        parent.status = "processing" if statuses != {"pending"} else "pending"
+    elif statuses == {"completed"}:
+        parent.status = "completed"
+    elif "completed" in statuses:
+        parent.status = "partial"
+    else:
+        parent.status = children[0].status if len(statuses) == 1 else "failed"
 
-        generation_jobs[job_id].progress = 0.8
-
-        # Save output video
-        output_path = Path(Config.OUTPUT_DIR) / f"{job_id}.mp4"
-        output_path.parent.mkdir(parents=True, exist_ok=True)
-        frames = result.frames[0]
-        export_to_video(frames, str(output_path), fps=Config.DEFAULT_FPS)
-
-        # Extract thumbnail
-        thumbnail = Image.fromarray(frames[0])
-        thumbnail_path = Path(Config.OUTPUT_DIR) / f"{job_id}_thumb.jpg"
-        thumbnail.save(thumbnail_path)
-
-        generation_jobs[job_id].progress = 0.9
-
-        # Upload to Supabase if configured
-        video_url = str(output_path)
-        thumbnail_url = str(thumbnail_path)
-
-        if supabase_client and request.project_id:
-            try:
-                # Upload video
-                with open(output_path, 'rb') as f:
-                    video_response = supabase_client.storage.from_(
-                        "ttm-videos"
-                    ).upload(
-                        f"{request.project_id}/{job_id}.mp4",
-                        f.read(),
-                        {"content-type": "video/mp4"}
-                    )
-                    video_url = supabase_client.storage.from_(
-                        "ttm-videos"
-                    ).get_public_url(f"{request.project_id}/{job_id}.mp4")
-
-                # Upload thumbnail
-                with open(thumbnail_path, 'rb') as f:
-                    thumb_response = supabase_client.storage.from_(
-                        "ttm-videos"
-                    ).upload(
-                        f"{request.project_id}/{job_id}_thumb.jpg",
-                        f.read(),
-                        {"content-type": "image/jpeg"}
-                    )
-                    thumbnail_url = supabase_client.storage.from_(
-                        "ttm-videos"
-                    ).get_public_url(f"{request.project_id}/{job_id}_thumb.jpg")
-            except Exception as e:
-                print(f"Supabase upload error: {e}")
-
-        # Clean up temp files
-        shutil.rmtree(temp_dir, ignore_errors=True)
+# Jobs flow from the fair queue through CPU preprocessing, GPU inference and encode/upload
+job_pipeline = StagedExecutor(job_queue, [
+    Stage("preprocess", preprocess_job, workers=Config.PREPROCESS_WORKERS),
+    Stage("inference", infer_batch, workers=len(cpu_partition.plan.slots) if cpu_partition else 1),
+    Stage("postprocess", postprocess_batch, workers=Config.POSTPROCESS_WORKERS),
+], queue_size=Config.STAGE_QUEUE_SIZE)
 
-        generation_jobs[job_id].progress = 1.0
+def restore_jobs(requeue: bool = True) -> int:
+    """
+    Rebuild jobs from the journal after a restart and queue the unfinished ones again
 
-        # Calculate generation time
-        generation_time = (datetime.now() - start_time).total_seconds()
+    Jobs that were queued or running when the server stopped are pending
+    again and start from the beginning; variants of a sweep that had
+    already finished are kept. Deadlines restart from the requeue.
 
-        response = TTMResponse(
-            status="completed",
-            video_url=video_url,
-            thumbnail_url=thumbnail_url,
-            duration_seconds=request.num_frames / Config.DEFAULT_FPS,
-            frames=request.num_frames,
-            generation_time=generation_time
+    Returns:
+        Number of jobs queued again
+    """
+    entries = journal.replay()
+    for entry in entries.values():
+        if not entry.finished:
+            entry.status = "pending"
+    entries = journal.compact(entries)
+
+    for entry in entries.values():
+        generation_jobs[entry.job_id] = JobStatus(
+            job_id=entry.job_id,
+            status=entry.status,
+            progress=1.0 if entry.status == "completed" else 0.0,
+            result=TTMResponse.model_validate(entry.result) if entry.result else None,
+            project_id=entry.project_id,
+            parent_id=entry.parent_id,
+            children=entry.children
         )
+        if entry.storage_keys:
+            job_storage_keys[entry.job_id] = entry.storage_keys
+
+    requeued = 0
+    for entry in list(entries.values()):
+        submission = entry.submission
+        if not requeue or submission is None or entry.finished:
+            continue
+        try:
+            if submission["kind"] == "variants":
+                request = TTMVariantsRequest.model_validate(decode_json_request(submission["request"]))
+                for child_id, child_request in zip(entry.children, request.child_requests()):
+                    job_controls[child_id] = JobControl(child_id, job_timeout(child_request))
+            else:
+                request = TTMRequest.model_validate(decode_json_request(submission["request"]))
+                job_controls[entry.job_id] = JobControl(entry.job_id, job_timeout(request))
+            image = journal.load_input(submission["input"])
+        except Exception as e:
+            logger.error(f"Cannot resume job {entry.job_id}: {e}")
+            for job_id in [entry.job_id] + (entry.children or []):
+                job = generation_jobs.get(job_id)
+                if job is not None and job.status not in FINISHED_STATUSES:
+                    job.result = TTMResponse(status="failed", error=f"Could not be resumed after restart: {e}")
+                    job.status = "failed"
+            continue
+        job_queue.put_nowait(submission["project"], (entry.job_id, image, request), submission["cost"])
+        requeued += 1
+    return requeued
+
+# Canary: a tiny job through the same engine, motion-signal and decode/encode code as real jobs
+CANARY_PROMPT = "a red ball rolls from left to right"
+
+def canary_image() -> Image.Image:
+    """Deterministic input with some structure, so the canary always hits the same caches"""
+    ramp = np.linspace(0, 255, 256, dtype=np.uint8)
+    return Image.fromarray(np.stack([np.tile(ramp, (256, 1)), np.tile(ramp[:, None], (1, 256)), np.full((256, 256), 96, np.uint8)], -1))
+
+def canary_infer(
+    engine: TTMEngine,
+    image: Image.Image,
+    request: TTMRequest,
+    motion_signal_path: Path,
+    mask_path: Path,
+    control: JobControl,
+    output_path: Path,
+    timings: Dict[str, Any]
+):
+    """Inference half of the canary, run like `infer_batch` but at the canary's size and step count"""
+    view = engine.with_limits(Config.CANARY_MAX_AREA, Config.CANARY_STEPS)
+    kwargs = dict(
+        guidance_scale=request.guidance_scale,
+        motion_signal_path=motion_signal_path,
+        mask_path=mask_path,
+        callback=control.step_callback,
+        timings=timings
+    )
+    if Config.STREAM_CHUNK_FRAMES > 0:
+        latents = view.generate_latents(image, request.prompt, request, [request.seed], **kwargs)[0]
+        stage_start = time.perf_counter()
+        with FragmentedMP4Writer(output_path, Config.DEFAULT_FPS, Config.STREAM_CHUNK_FRAMES) as writer:
+            for chunk in view.decode_chunks(latents, Config.STREAM_CHUNK_FRAMES):
+                control.check()
+                writer.append(chunk)
+    else:
+        frames = view.generate(image, request.prompt, request, [request.seed], **kwargs)[0]
+        stage_start = time.perf_counter()
+        export_video(frames, output_path, Config.DEFAULT_FPS)
+    timings["decode_and_encode"] = time.perf_counter() - stage_start
 
-        generation_jobs[job_id].status = "completed"
-        generation_jobs[job_id].result = response
+async def run_canary_inference(
+    image: Image.Image,
+    request: TTMRequest,
+    motion_signal_path: Path,
+    mask_path: Path,
+    control: JobControl,
+    output_path: Path,
+    timings: Dict[str, Any]
+):
+    """Run `canary_infer`, giving way to any batch that enters inference meanwhile"""
+    global canary_control
+    args = (image, request, motion_signal_path, mask_path, control, output_path, timings)
+    if cpu_partition is not None:
+        return await run_inference(canary_infer, *args)
+    if canary_lock.locked():
+        raise ProbeSkipped("a job entered inference first")
+    async with canary_lock:
+        canary_control = control
+        try:
+            return await run_inference(canary_infer, *args)
+        except JobCancelled:
+            raise ProbeSkipped("preempted by a job entering inference") from None
+        finally:
+            canary_control = None
 
-        return response
+async def run_canary() -> Dict[str, Any]:
+    """
+    One canary generation; returns per-step seconds and raises on any failure
 
-    except Exception as e:
-        generation_jobs[job_id].status = "failed"
-        generation_jobs[job_id].result = TTMResponse(
-            status="failed",
-            error=str(e)
+    Nothing is uploaded or journaled, and the files are removed afterwards.
+    The canary has its own deadline, enforced at each denoising step like
+    a job's.
+    """
+    request = TTMRequest(
+        motion_type="object",
+        prompt=CANARY_PROMPT,
+        trajectory=[[0.3, 0.5], [0.7, 0.5]],
+        num_frames=Config.CANARY_NUM_FRAMES,
+        seed=0
+    )
+    apply_default_indices(request)
+    control = JobControl("canary", Config.CANARY_TIMEOUT)
+    temp_dir = Path(Config.TEMP_DIR) / f"canary-{uuid.uuid4().hex[:8]}"
+    timings: Dict[str, Any] = {}
+    try:
+        stage_start = time.perf_counter()
+        image = ttm_engine.with_limits(Config.CANARY_MAX_AREA, Config.CANARY_STEPS).prepare_image(canary_image())
+        motion_signal_path, mask_path = await asyncio.to_thread(
+            write_motion_signal, image, request, temp_dir, Config.DEFAULT_FPS
         )
-        raise
+        timings["preprocess"] = time.perf_counter() - stage_start
+        await run_canary_inference(image, request, motion_signal_path, mask_path, control, temp_dir / "canary.mp4", timings)
+        if (temp_dir / "canary.mp4").stat().st_size == 0:
+            raise RuntimeError("Canary video is empty")
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        if Config.DEVICE == "cuda":
+            torch.cuda.empty_cache()
+    return {k: v for k, v in timings.items() if isinstance(v, float)}
+
+def canary_ready() -> bool:
+    """Probe only with a loaded model and an idle inference worker, so real jobs never wait on the canary"""
+    inference = job_pipeline.stats_by_stage["inference"]
+    workers = next(stage.workers for stage in job_pipeline.stages if stage.name == "inference")
+    return ttm_engine is not None and not draining and inference.active < workers
+
+canary = CanaryProber(
+    run_canary,
+    Config.CANARY_INTERVAL,
+    window=Config.CANARY_WINDOW,
+    ready=canary_ready,
+    degraded_factor=Config.CANARY_DEGRADED_FACTOR
+)
 
 # API Endpoints
 @app.on_event("startup")
 async def startup_event():
     """Initialize TTM pipeline and Supabase client on startup"""
-    global ttm_pipeline, supabase_client
+    global ttm_engine, supabase_client, storage, upscaler
 
     print(f"Initializing TTM API server...")
     print(f"Device: {Config.DEVICE}")
@@ -478,6 +1257,13 @@ async def startup_event():
     Path(Config.TEMP_DIR).mkdir(parents=True, exist_ok=True)
     Path(Config.OUTPUT_DIR).mkdir(parents=True, exist_ok=True)
 
+    # Start the job pipeline
+    job_pipeline.start()
+    if cpu_partition is not None:
+        # Preprocessing, encoding and uploads stay off the inference cores
+        asyncio.get_running_loop().set_default_executor(cpu_partition.worker_pool)
+        print(f"CPU inference slots: {cpu_partition.plan.slots}, worker cores: {cpu_partition.plan.workers}")
+
     # Initialize Supabase if configured
     if Config.SUPABASE_URL and Config.SUPABASE_KEY:
         try:
@@ -486,46 +1272,86 @@ async def startup_event():
         except Exception as e:
             print(f"Supabase initialization failed: {e}")
 
-    # Load TTM pipeline
+    # Select output storage
     try:
-        print(f"Loading TTM model: {Config.MODEL_ID}")
+        storage = create_storage()
+        print(f"Output storage: {storage.name}")
+    except Exception as e:
+        print(f"Storage initialization failed, keeping outputs local: {e}")
 
-        # Check if components are available
-        if ttm_components is None:
-            print("❌ Cannot load TTM - components not available")
-            print("Please run: python ttm_api_fixes.py")
-            return
+    # Select the upscaler for requests with an output size
+    try:
+        upscaler = load_upscaler(Config.UPSCALER)
+        print(f"Upscaler: {upscaler.name}")
+    except Exception as e:
+        print(f"Upscaler {Config.UPSCALER} failed to load, using lanczos: {e}")
+
+    # Load TTM pipeline from the local weights snapshot
+    try:
+        print(f"Loading TTM model: {Config.MODEL_ID}")
 
-        # Load with better error handling
-        ttm_pipeline = WanImageToVideoTTMPipeline.from_pretrained(
+        ttm_engine = TTMEngine.from_snapshot(
             Config.MODEL_ID,
-            torch_dtype=Config.DTYPE,
-            device_map="auto" if Config.DEVICE == "cuda" else None
+            local_path=Config.MODEL_PATH,
+            device=Config.DEVICE,
+            dtype=Config.DTYPE,
+            cpu_int8=Config.CPU_INT8,
+            quantized_cache_dir=Config.QUANTIZED_CACHE_DIR,
+            prompt_cache_bytes=Config.PROMPT_CACHE_MB * 1024**2,
+            conditioning_cache_bytes=Config.CONDITIONING_CACHE_MB * 1024**2,
+            conditioning_disk_dir=Config.CONDITIONING_CACHE_DIR,
+            conditioning_disk_bytes=Config.CONDITIONING_CACHE_DISK_MB * 1024**2
         )
-        ttm_pipeline.vae.enable_tiling()
-        ttm_pipeline.vae.enable_slicing()
 
-        # Enable attention slicing if available
-        if hasattr(ttm_pipeline.transformer, 'enable_attention_slicing'):
-            ttm_pipeline.transformer.enable_attention_slicing()
-
-        ttm_pipeline.to(Config.DEVICE)
-
-        print("✅ TTM pipeline loaded successfully")
+        print(f"✅ TTM pipeline loaded in {ttm_engine.load_timings['cold_start']:.1f}s")
+        if cpu_partition is not None and Config.CPU_CHANNELS_LAST:
+            to_channels_last(ttm_engine.pipeline)
+        slot_engines.clear()
 
         # Log GPU info
         if Config.DEVICE == "cuda":
-            import torch
-            if torch.cuda.is_available():
-                props = torch.cuda.get_device_properties(0)
-                print(f"GPU: {props.name} ({props.total_memory / 1024**3:.1f}GB)")
-                allocated = torch.cuda.memory_allocated() / 1024**3
-                cached = torch.cuda.memory_reserved() / 1024**3
-                print(f"GPU Memory: {allocated:.1f}GB allocated, {cached:.1fGB cached")
+            props = torch.cuda.get_device_properties(0)
+            print(f"GPU: {props.name} ({props.total_memory / 1024**3:.1f}GB)")
+            allocated = torch.cuda.memory_allocated() / 1024**3
+            cached = torch.cuda.memory_reserved() / 1024**3
+            print(f"GPU Memory: {allocated:.1f}GB allocated, {cached:.1f}GB cached")
     except Exception as e:
         print(f"Failed to load TTM pipeline: {e}")
         print("The API will start but generation will not work until the model is loaded")
 
+    # Resume jobs from before the last shutdown or crash
+    try:
+        requeued = restore_jobs(requeue=ttm_engine is not None)
+        print(f"Journal: {len(generation_jobs)} jobs restored, {requeued} queued again")
+    except Exception as e:
+        logger.error(f"Journal replay failed: {e}")
+
+    # Background health: canary generations and the cached /health/detailed report
+    canary.start()
+    health_snapshot.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """
+    Drain on SIGTERM, after the server has stopped accepting connections
+
+    New submissions are refused and running jobs get DRAIN_TIMEOUT seconds
+    to finish. Whatever is still queued or running stays pending in the
+    journal and is resumed by the next start.
+    """
+    global draining
+    draining = True
+    await canary.stop()
+    await health_snapshot.stop()
+    drained = await job_pipeline.drain(Config.DRAIN_TIMEOUT)
+    await job_pipeline.stop()
+    if not drained:
+        # Abort pipeline threads at their next step so the process can exit
+        for control in job_controls.values():
+            control.interrupt()
+        logger.info(f"Shut down with jobs in flight; {job_queue.qsize()} queued jobs and the running ones resume on restart")
+    await asyncio.to_thread(journal.close)
+
 @app.get("/")
 async def root():
     """Health check endpoint"""
@@ -534,15 +1360,16 @@ async def root():
         "status": "running",
         "version": "1.0.0",
         "device": Config.DEVICE,
-        "pipeline_loaded": ttm_pipeline is not None,
-        "components_available": ttm_components is not None,
+        "pipeline_loaded": ttm_engine is not None,
+        "components_available": core.WanImageToVideoTTMPipeline is not None,
         "supabase_configured": supabase_client is not None,
-        "gpu_available": torch.cuda.is_available() if torch else False
+        "storage_backend": storage.name,
+        "gpu_available": torch.cuda.is_available() if torch else False,
+        "health": health_snapshot.report.get("canary", {}).get("status", "unknown")
     }
 
-@app.get("/health/detailed")
-async def detailed_health():
-    """Detailed health check with diagnostics"""
+def build_health_report() -> Dict[str, Any]:
+    """Detailed diagnostics, rebuilt in the background for /health/detailed"""
     health_info = {
         "service": "TTM API for Alkemy",
         "status": "running",
@@ -558,14 +1385,20 @@ async def detailed_health():
         },
         "components": {
             "ttm_core_installed": False,
-            "pipeline_loaded": ttm_pipeline is not None,
-            "model_id": Config.MODEL_ID
+            "pipeline_loaded": ttm_engine is not None,
+            "model_id": Config.MODEL_ID,
+            "load_timings": ttm_engine.load_timings if ttm_engine else None
         },
         "storage": {
             "temp_dir_exists": Path(Config.TEMP_DIR).exists(),
             "output_dir_exists": Path(Config.OUTPUT_DIR).exists(),
-            "supabase_connected": supabase_client is not None
-        }
+            "supabase_connected": supabase_client is not None,
+            "backend": storage.name
+        },
+        "submissions": submission_index.stats(),
+        "queue": job_queue.stats(),
+        "pipeline": job_pipeline.stats(),
+        "cpu": cpu_partition.stats() if cpu_partition else None
     }
 
     # Add GPU info if available
@@ -595,66 +1428,334 @@ async def detailed_health():
     except Exception:
         pass
 
-    # Model check
-    if ttm_pipeline is not None:
-        try:
-            # Simple inference test
-            dummy_image = Image.new('RGB', (64, 64), color='black')
+    # Model check: the latest canary generations
+    canary_summary = canary.summary()
+    health_info["canary"] = canary_summary
+    if ttm_engine is not None:
+        if canary_summary["status"] == "ok":
             health_info["model_test"] = "passed"
-        except Exception as e:
-            health_info["model_test"] = f"failed: {str(e)}"
+        elif canary_summary["status"] == "unknown":
+            health_info["model_test"] = "not run"
+        else:
+            health_info["model_test"] = f"{canary_summary['status']}: {'; '.join(canary_summary['reasons'])}"
 
     return health_info
 
+health_snapshot = CachedSnapshot(build_health_report, Config.HEALTH_REFRESH_SECONDS)
+
+@app.get("/health/detailed")
+async def detailed_health():
+    """
+    Detailed health check with diagnostics
+
+    Served from a snapshot at most HEALTH_REFRESH_SECONDS old, so frequent
+    probes do no filesystem or device work.
+    """
+    return health_snapshot.get()
+
+@app.get(f"{Config.API_PREFIX}/cache/stats")
+async def cache_stats():
+    """Hit rates and estimated encoder time saved by the embedding caches"""
+    return {
+        "prompt_embeddings": ttm_engine.prompt_cache.stats() if ttm_engine else None,
+        "conditioning": ttm_engine.conditioning_cache.stats() if ttm_engine else None,
+    }
+
+@app.get(f"{Config.API_PREFIX}/queue/stats")
+async def queue_stats():
+    """Per-project queue depth, wait times, remaining quota and rejections, plus pipeline stage utilization"""
+    return {**job_queue.stats(), "pipeline": job_pipeline.stats()}
+
+@app.post(f"{Config.API_PREFIX}/images", response_model=ImageHandle)
+async def upload_image(image: UploadFile = File(...)):
+    """
+    Store an image once for repeated generations
+
+    The image is decoded and resized to the generation resolution on upload.
+    Identical uploads share one handle; handles expire after
+    IMAGE_HANDLE_TTL seconds without use.
+    """
+    if not ttm_engine:
+        raise HTTPException(status_code=503, detail="TTM pipeline not loaded")
+
+    data = await image.read()
+    try:
+        stored, deduplicated = await asyncio.to_thread(image_store.put, data, ttm_engine.target_size)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid image: {e}")
+
+    return ImageHandle(
+        image_id=stored.image_id,
+        width=stored.width,
+        height=stored.height,
+        expires_at=datetime.fromtimestamp(stored.expires_at).isoformat(),
+        deduplicated=deduplicated
+    )
+
+async def parse_ttm_request(
+    model: type[TTMRequest],
+    request_json: Optional[str],
+    request_msgpack: Optional[UploadFile]
+) -> TTMRequest:
+    """Validate request parameters sent either as JSON or as msgpack"""
+    if request_msgpack is not None:
+        return model.model_validate(decode_msgpack_request(await request_msgpack.read()))
+    if request_json is not None:
+        return model.model_validate(decode_json_request(request_json))
+    raise ValueError("Either request_json or request_msgpack is required")
+
+def load_request_image(image_data: Optional[bytes], image_id: Optional[str]) -> Image.Image:
+    """Resolve the input image from a stored handle or uploaded bytes"""
+    if image_id:
+        img = image_store.get(image_id)
+        if img is None:
+            raise HTTPException(status_code=404, detail="Image handle not found or expired")
+        return img
+    if image_data is not None:
+        return Image.open(io.BytesIO(image_data)).convert("RGB")
+    raise ValueError("Either an image file or image_id is required")
+
+async def submit_job(
+    response: Response,
+    idempotency_key: Optional[str],
+    image: Optional[UploadFile],
+    request: TTMRequest,
+    create_job
+) -> JobStatus:
+    """
+    Create a job unless the submission is a retry or duplicate of an existing one
+
+    `await create_job(image)` creates and queues the job for the decoded
+    image and returns its ID. It only runs, and the image is only decoded
+    (in a worker thread), when no existing job can be reused; reused jobs
+    are marked with an
+    `Idempotent-Replayed: true` response header. New jobs are charged to
+    their project's quota, and a project over quota gets a 429.
+    """
+    if draining:
+        raise HTTPException(status_code=503, detail="Server is shutting down", headers={"Retry-After": "30"})
+    if idempotency_key is not None and not 0 < len(idempotency_key) <= 255:
+        raise HTTPException(status_code=400, detail="Idempotency-Key must be 1-255 characters")
+
+    image_data = await image.read() if image is not None and not request.image_id else None
+    image_digest = hashlib.sha256(image_data).hexdigest() if image_data is not None else f"image_id:{request.image_id}"
+
+    def job_status(job_id: str) -> Optional[str]:
+        job = generation_jobs.get(job_id)
+        if job is not None and job.children:
+            refresh_parent_status(job)
+        return job.status if job is not None else None
+
+    async def create() -> str:
+        return await create_job(await asyncio.to_thread(load_request_image, image_data, request.image_id))
+
+    try:
+        job_id, reused = await submission_index.submit(
+            idempotency_key,
+            request_fingerprint(image_digest, request),
+            job_status,
+            create
+        )
+    except IdempotencyKeyConflict as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except AdmissionRejected as e:
+        raise HTTPException(
+            status_code=429,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)} if e.retry_after is not None else None
+        )
+
+    if reused:
+        response.headers["Idempotent-Replayed"] = "true"
+    return generation_jobs[job_id]
+
 @app.post(f"{Config.API_PREFIX}/generate", response_model=JobStatus)
 async def generate_video(
-    background_tasks: BackgroundTasks,
-    image: UploadFile = File(...),
-    request_json: str = Form(...)
+    response: Response,
+    image: Optional[UploadFile] = File(None),
+    request_json: Optional[str] = Form(None),
+    request_msgpack: Optional[UploadFile] = File(None),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
 ):
     """
     Generate motion-controlled video from image
 
     Args:
-        image: Input image file
+        image: Input image file, omitted when the request carries an image_id
         request_json: JSON string with TTM parameters
+        request_msgpack: Alternative msgpack encoding of the parameters, where
+            the trajectory may be packed float32 bytes
+        idempotency_key: Client-chosen key; retries with the same key return
+            the original job. Identical submissions while a job is still
+            running attach to that job even without a key.
 
     Returns:
         Job status with job_id for tracking
     """
-    if not ttm_pipeline:
+    if not ttm_engine:
         raise HTTPException(status_code=503, detail="TTM pipeline not loaded")
 
     try:
         # Parse request
-        request = TTMRequest.parse_raw(request_json)
+        request = await parse_ttm_request(TTMRequest, request_json, request_msgpack)
+
+        async def create_job(img: Image.Image) -> str:
+            project = request.project_id or Config.DEFAULT_PROJECT
+            job_queue.admit(project, job_cost(request))
+
+            # Durable before the job is visible or queued
+            job_id = str(uuid.uuid4())
+            input_path = await asyncio.to_thread(journal.save_input, job_id, img)
+            await asyncio.to_thread(
+                journal.submitted, job_id, "generate", request.model_dump_json(), input_path,
+                project, job_cost(request), project_id=request.project_id
+            )
 
-        # Load image
-        img = Image.open(image.file).convert("RGB")
+            generation_jobs[job_id] = JobStatus(
+                job_id=job_id,
+                status="pending",
+                progress=0.0,
+                project_id=request.project_id
+            )
+            job_controls[job_id] = JobControl(job_id, job_timeout(request))
 
-        # Create job
-        job_id = str(uuid.uuid4())
-        generation_jobs[job_id] = JobStatus(
-            job_id=job_id,
-            status="pending",
-            progress=0.0
-        )
+            # Queue for the GPU worker
+            job_queue.put_nowait(project, (job_id, img, request), job_cost(request))
+            return job_id
 
-        # Start generation in background
-        background_tasks.add_task(generate_ttm_video, img, request, job_id)
+        return await submit_job(response, idempotency_key, image, request, create_job)
 
-        return generation_jobs[job_id]
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post(f"{Config.API_PREFIX}/generate_variants", response_model=JobStatus)
+async def generate_variants(
+    response: Response,
+    image: Optional[UploadFile] = File(None),
+    request_json: Optional[str] = Form(None),
+    request_msgpack: Optional[UploadFile] = File(None),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
+):
+    """
+    Generate several variants of one image and prompt in a single job
+
+    Args:
+        image: Input image file, omitted when the request carries an image_id
+        request_json: JSON string with TTM parameters plus a `variants` list of
+            seed/trajectory/camera_movement/guidance_scale overrides
+        request_msgpack: Alternative msgpack encoding of the parameters
+        idempotency_key: Client-chosen key; retries with the same key return
+            the original sweep
 
+    Returns:
+        Parent job status; each variant is also a regular job listed in `children`
+    """
+    if not ttm_engine:
+        raise HTTPException(status_code=503, detail="TTM pipeline not loaded")
+
+    try:
+        # Parse request; expanding it validates every variant up front
+        request = await parse_ttm_request(TTMVariantsRequest, request_json, request_msgpack)
+        child_requests = request.child_requests()
+
+        async def create_job(img: Image.Image) -> str:
+            project = request.project_id or Config.DEFAULT_PROJECT
+            cost = sum(job_cost(child_request) for child_request in child_requests)
+            job_queue.admit(project, cost)
+
+            # Durable before the jobs are visible or queued
+            parent_id = str(uuid.uuid4())
+            child_ids = [str(uuid.uuid4()) for _ in child_requests]
+            input_path = await asyncio.to_thread(journal.save_input, parent_id, img)
+            await asyncio.to_thread(
+                journal.submitted, parent_id, "variants", request.model_dump_json(), input_path,
+                project, cost, project_id=request.project_id, children=child_ids
+            )
+
+            # Create parent and child jobs
+            for child_id, child_request in zip(child_ids, child_requests):
+                generation_jobs[child_id] = JobStatus(
+                    job_id=child_id,
+                    status="pending",
+                    progress=0.0,
+                    project_id=request.project_id,
+                    parent_id=parent_id
+                )
+                job_controls[child_id] = JobControl(child_id, job_timeout(child_request))
+            generation_jobs[parent_id] = JobStatus(
+                job_id=parent_id,
+                status="pending",
+                progress=0.0,
+                project_id=request.project_id,
+                children=child_ids
+            )
+
+            # Queue the whole sweep for the GPU worker
+            job_queue.put_nowait(project, (parent_id, img, request), cost)
+            return parent_id
+
+        return await submit_job(response, idempotency_key, image, request, create_job)
+
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+def job_view(job: JobStatus) -> JobStatus:
+    """A job as returned by the API; variant sweeps include their children's statuses"""
+    if job.children:
+        refresh_parent_status(job)
+        return job.model_copy(update={
+            "variants": [generation_jobs[c] for c in job.children if c in generation_jobs]
+        })
+    return job
+
 @app.get(f"{Config.API_PREFIX}/status/{{job_id}}", response_model=JobStatus)
 async def get_job_status(job_id: str):
     """Get status of a generation job"""
     if job_id not in generation_jobs:
         raise HTTPException(status_code=404, detail="Job not found")
 
-    return generation_jobs[job_id]
+    return job_view(generation_jobs[job_id])
+
+@app.post(f"{Config.API_PREFIX}/status:batch", response_model=BatchStatusResponse)
+async def get_job_statuses(request: BatchStatusRequest):
+    """Get the status of up to 500 jobs in one request"""
+    jobs, missing = [], []
+    for job_id in request.job_ids:
+        job = generation_jobs.get(job_id)
+        if job is None:
+            missing.append(job_id)
+        else:
+            jobs.append(job_view(job))
+    return BatchStatusResponse(jobs=jobs, missing=missing)
+
+@app.get(f"{Config.API_PREFIX}/jobs", response_model=JobPage)
+async def list_jobs(
+    project_id: Optional[str] = None,
+    status: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200)
+):
+    """
+    List jobs, newest first, optionally for one project and/or status
+
+    Served from the project/status index, so the cost depends on the page
+    size rather than on the number of jobs held.
+    """
+    try:
+        position = int(cursor) if cursor is not None else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    jobs, next_cursor, total = generation_jobs.query(project_id, status, position, limit)
+    return JobPage(
+        jobs=[job_view(job) for job in jobs],
+        next_cursor=str(next_cursor) if next_cursor is not None else None,
+        total=total
+    )
 
 @app.get(f"{Config.API_PREFIX}/download/{{job_id}}")
 async def download_video(job_id: str):
@@ -673,30 +1774,109 @@ async def download_video(job_id: str):
         # It's a URL, redirect to it
         return JSONResponse({"url": job.result.video_url})
 
+@app.get(f"{Config.API_PREFIX}/stream/{{job_id}}")
+async def stream_video(job_id: str):
+    """
+    Stream a video while it is still being generated
+
+    While the job is decoding, the fragmented MP4 is sent as it grows, so
+    playback can start after the first fragment. Once the job has finished
+    this behaves like /download.
+    """
+    if job_id not in generation_jobs:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    path = job_streams.get(job_id)
+    # The encoder creates the file with its first frame
+    while path is not None and not path.exists() and job_id in job_streams:
+        await asyncio.sleep(Config.STREAM_POLL_SECONDS)
+    if path is None or not path.exists():
+        return await download_video(job_id)
+
+    async def fragments():
+        # The open handle keeps working if the file is moved or deleted after upload
+        with open(path, "rb") as f:
+            while True:
+                data = f.read(1024 * 1024)
+                if data:
+                    yield data
+                elif job_id in job_streams:
+                    await asyncio.sleep(Config.STREAM_POLL_SECONDS)
+                else:
+                    # Writer closed; send whatever it flushed last
+                    while data := f.read(1024 * 1024):
+                        yield data
+                    break
+
+    return StreamingResponse(fragments(), media_type="video/mp4")
+
+@app.post(f"{Config.API_PREFIX}/cancel/{{job_id}}", response_model=JobStatus)
+async def cancel_job(job_id: str):
+    """
+    Cancel a pending or running job
+
+    Pending jobs are dropped before they reach the GPU. Running jobs abort
+    at the next denoising step and end up in the "cancelled" state.
+    """
+    if job_id not in generation_jobs:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    job = generation_jobs[job_id]
+    if job.status in TERMINAL_STATUSES + ("partial",):
+        raise HTTPException(status_code=409, detail=f"Job already {job.status}")
+
+    # Cancelling a variant sweep cancels all of its children
+    for target_id in [job_id] + (job.children or []):
+        target = generation_jobs.get(target_id)
+        control = job_controls.get(target_id)
+        if control:
+            control.cancel()
+        if target is not None and target.status == "pending":
+            target.result = TTMResponse(status="cancelled", error="Cancelled before start")
+            target.status = "cancelled"
+
+    if job.children:
+        refresh_parent_status(job)
+
+    # The cancellation is on disk before it is acknowledged
+    await asyncio.wrap_future(journal.barrier())
+    return job
+
 @app.delete(f"{Config.API_PREFIX}/job/{{job_id}}")
 async def delete_job(job_id: str):
     """Clean up job and associated files"""
     if job_id not in generation_jobs:
         raise HTTPException(status_code=404, detail="Job not found")
 
-    # Clean up files
-    try:
-        output_path = Path(Config.OUTPUT_DIR) / f"{job_id}.mp4"
-        thumb_path = Path(Config.OUTPUT_DIR) / f"{job_id}_thumb.jpg"
-        temp_dir = Path(Config.TEMP_DIR) / job_id
-
-        if output_path.exists():
-            output_path.unlink()
-        if thumb_path.exists():
-            thumb_path.unlink()
-        if temp_dir.exists():
-            shutil.rmtree(temp_dir)
-    except Exception as e:
-        print(f"Error cleaning up files for {job_id}: {e}")
+    # A variant sweep is deleted together with its children
+    target_ids = [job_id] + (generation_jobs[job_id].children or [])
+
+    for target_id in target_ids:
+        # Stop the job first so it does not keep running on the GPU
+        control = job_controls.get(target_id)
+        if control:
+            control.cancel()
+
+        # Clean up files
+        try:
+            for key in job_storage_keys.pop(target_id, []):
+                await asyncio.to_thread(storage.delete, key)
+
+            # Video, thumbnail and previews are all named after the job
+            for output_path in Path(Config.OUTPUT_DIR).glob(f"{target_id}*"):
+                output_path.unlink()
+            temp_dir = Path(Config.TEMP_DIR) / target_id
+            if temp_dir.exists():
+                shutil.rmtree(temp_dir)
+        except Exception as e:
+            print(f"Error cleaning up files for {target_id}: {e}")
 
-    # Remove from jobs
-    del generation_jobs[job_id]
+        # Remove from jobs
+        if generation_jobs.pop(target_id, None) is not None:
+            journal.defer(journal.deleted, target_id)
+            journal.defer(journal.release_input, target_id)
 
+    await asyncio.wrap_future(journal.barrier())
     return {"status": "deleted"}
 
 if __name__ == "__main__":
@@ -0,0 +1,320 @@
+"""
+Caches for expensive encoder work in the TTM pipeline
+"""
+
+import hashlib
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Dict, Optional, Tuple
+
+import torch
+from PIL import Image
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Normalize prompt text so trivially different spellings share a cache entry"""
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFC", prompt)).strip()
+
+
+def tensor_nbytes(value) -> int:
+    """Size in bytes of a tensor or a tuple/list of tensors"""
+    if value is None:
+        return 0
+    if isinstance(value, (tuple, list)):
+        return sum(tensor_nbytes(v) for v in value)
+    return value.numel() * value.element_size()
+
+
+class LRUTensorCache:
+    """
+    Thread-safe LRU cache of tensors bounded by total size in bytes
+
+    Tracks hits, misses and the time spent computing misses, so the time saved
+    by hits can be estimated from the average miss cost.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Any, Tuple[Any, int]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.miss_seconds = 0.0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, compute_seconds: float = 0.0):
+        """Store a freshly computed value and record the miss that produced it"""
+        size = tensor_nbytes(value)
+        with self._lock:
+            self.misses += 1
+            self.miss_seconds += compute_seconds
+            if size > self.max_bytes:
+                return
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def get_or_compute(self, key, compute):
+        value = self.get(key)
+        if value is not None:
+            return value
+        start = time.perf_counter()
+        value = compute()
+        self.put(key, value, time.perf_counter() - start)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            avg_miss = self.miss_seconds / self.misses if self.misses else 0.0
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "avg_encode_seconds": avg_miss,
+                "estimated_saved_seconds": self.hits * avg_miss,
+            }
+
+
+class PromptEmbeddingCache:
+    """
+    Text-encoder embeddings keyed by (model id, normalized prompt)
+
+    The empty negative prompt is encoded once by `warm_up` and kept outside
+    the LRU so it is never evicted.
+    """
+
+    def __init__(self, model_id: str, max_bytes: int):
+        self.model_id = model_id
+        self.cache = LRUTensorCache(max_bytes)
+        self.negative_prompt_embeds: Optional[torch.Tensor] = None
+
+    def _encode(self, pipeline, prompt: str) -> torch.Tensor:
+        prompt_embeds, _ = pipeline.encode_prompt(
+            prompt=prompt,
+            do_classifier_free_guidance=False,
+            num_videos_per_prompt=1,
+            device=pipeline._execution_device,
+        )
+        return prompt_embeds
+
+    def warm_up(self, pipeline):
+        """Precompute the (always empty) negative prompt embedding"""
+        with torch.inference_mode():
+            self.negative_prompt_embeds = self._encode(pipeline, "")
+
+    def get(self, pipeline, prompt: str) -> torch.Tensor:
+        """Return embeddings for `prompt`, running the text encoder only on a miss"""
+        key = (self.model_id, normalize_prompt(prompt))
+        with torch.inference_mode():
+            return self.cache.get_or_compute(key, lambda: self._encode(pipeline, key[1]))
+
+    def stats(self) -> Dict[str, Any]:
+        return {"model_id": self.model_id, **self.cache.stats()}
+
+
+class DiskTensorCache:
+    """
+    On-disk tensor cache bounded by total file size, evicting least recently used files
+
+    Recency is tracked with file mtimes, which are refreshed on every hit.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.hits = 0
+
+    def _path(self, key) -> Path:
+        digest = hashlib.sha256(repr(key).encode()).hexdigest()
+        return self.directory / f"{digest}.pt"
+
+    def get(self, key, device):
+        path = self._path(key)
+        try:
+            value = torch.load(path, map_location=device, weights_only=True)
+        except (FileNotFoundError, RuntimeError, EOFError):
+            return None
+        path.touch()
+        with self._lock:
+            self.hits += 1
+        return value
+
+    def put(self, key, value):
+        if tensor_nbytes(value) > self.max_bytes:
+            return
+        path = self._path(key)
+        tmp_path = path.with_suffix(".tmp")
+        torch.save(value.detach().cpu(), tmp_path)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._evict()
+
+    def _evict(self):
+        files = sorted(self.directory.glob("*.pt"), key=lambda p: p.stat().st_mtime)
+        total = sum(p.stat().st_size for p in files)
+        while files and total > self.max_bytes:
+            oldest = files.pop(0)
+            total -= oldest.stat().st_size
+            oldest.unlink(missing_ok=True)
+
+    def stats(self) -> Dict[str, Any]:
+        files = list(self.directory.glob("*.pt"))
+        return {
+            "entries": len(files),
+            "bytes": sum(p.stat().st_size for p in files),
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+        }
+
+
+class ConditioningCache:
+    """
+    Image-conditioning embeddings and conditioning-frame VAE latents
+
+    Entries are keyed by a content hash of the already resized input image and
+    the target (height, width), so re-running the same still with a different
+    trajectory or camera move skips the image encoder and the VAE encode.
+    A memory LRU sits in front of an optional on-disk tier.
+    """
+
+    def __init__(
+        self,
+        model_id: str,
+        max_bytes: int,
+        disk_dir: Optional[str] = None,
+        disk_max_bytes: int = 0
+    ):
+        self.model_id = model_id
+        self.memory = LRUTensorCache(max_bytes)
+        self.disk = DiskTensorCache(disk_dir, disk_max_bytes) if disk_dir and disk_max_bytes > 0 else None
+
+    @staticmethod
+    def image_key(image: Image.Image, height: int, width: int) -> str:
+        """Content hash of the resized image plus target resolution"""
+        digest = hashlib.sha256(image.tobytes())
+        digest.update(f"{image.mode}:{image.width}x{image.height}->{width}x{height}".encode())
+        return digest.hexdigest()
+
+    def _lookup(self, key, compute, device):
+        """Return (value, hit), consulting memory, then disk, then `compute`"""
+        full_key = (self.model_id,) + key
+        value = self.memory.get(full_key)
+        if value is not None:
+            return value, True
+        if self.disk is not None:
+            value = self.disk.get(full_key, device)
+            if value is not None:
+                self.memory.put(full_key, value)
+                return value, True
+        start = time.perf_counter()
+        value = compute()
+        self.memory.put(full_key, value, time.perf_counter() - start)
+        if self.disk is not None:
+            self.disk.put(full_key, value)
+        return value, False
+
+    def image_embeds(self, pipeline, image: Image.Image, key: str):
+        """
+        Image-encoder embeddings for pipelines that have an image encoder
+
+        Returns (embeds, hit). Wan2.2 A14B has no image encoder, in which case
+        (None, False) is returned and the pipeline conditions on latents only.
+        """
+        if getattr(pipeline, "image_encoder", None) is None:
+            return None, False
+        device = pipeline._execution_device
+        with torch.inference_mode():
+            return self._lookup(
+                ("image_embeds", key),
+                lambda: pipeline.encode_image(image, device),
+                device
+            )
+
+    @contextmanager
+    def vae_condition(self, pipeline, key: str, timings: Dict[str, Any]):
+        """
+        Serve the conditioning-frame VAE encode from the cache while the pipeline runs
+
+        `prepare_latents` is wrapped so that the first `vae.encode` of each
+        call, which encodes the conditioning frame, is looked up by `key` and
+        the input shape. Batched calls with a list of generators encode the
+        same tensor once per video; those repeats reuse the first result. Any
+        other encode is passed through to the VAE uncached, as `key` does not
+        describe its input. On exit `timings` holds the first encode's time
+        and whether it was a hit.
+        """
+        original_prepare = pipeline.prepare_latents
+        original_encode = pipeline.vae.encode
+
+        def cached_encode(x, *args, **kwargs):
+            if cached_encode.first is not None:
+                first, latents = cached_encode.first
+                if x is first:
+                    return SimpleNamespace(latents=latents)
+                return original_encode(x, *args, **kwargs)
+            start = time.perf_counter()
+            latents, hit = self._lookup(
+                ("vae_latents", key, tuple(x.shape), str(x.dtype)),
+                lambda: original_encode(x, *args, **kwargs).latent_dist.mode(),
+                x.device
+            )
+            cached_encode.first = (x, latents)
+            timings["vae_condition_encode"] = time.perf_counter() - start
+            timings["vae_condition_cache_hit"] = hit
+            # retrieve_latents() accepts any object exposing `.latents`
+            return SimpleNamespace(latents=latents)
+
+        def prepare_latents(*args, **kwargs):
+            cached_encode.first = None
+            pipeline.vae.encode = cached_encode
+            try:
+                return original_prepare(*args, **kwargs)
+            finally:
+                cached_encode.first = None
+                pipeline.vae.__dict__.pop("encode", None)
+
+        pipeline.prepare_latents = prepare_latents
+        try:
+            yield
+        finally:
+            pipeline.__dict__.pop("prepare_latents", None)
+
+    def stats(self) -> Dict[str, Any]:
+        stats = {"model_id": self.model_id, "memory": self.memory.stats()}
+        if self.disk is not None:
+            stats["disk"] = self.disk.stats()
+        return stats
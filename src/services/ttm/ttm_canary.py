@@ -0,0 +1,245 @@
+"""
+Background health checks for the TTM API
+A canary generation runs periodically through the real inference path, and health reports are served from a cached snapshot
+"""
+
+import asyncio
+import logging
+import statistics
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ProbeSkipped(Exception):
+    """Raised by a probe that gave way to real work; the run is counted as skipped, not failed"""
+
+
+@dataclass
+class ProbeResult:
+    """Outcome of one canary run"""
+    finished_at: float
+    seconds: float
+    ok: bool
+    error: Optional[str] = None
+    timings: Dict[str, float] = field(default_factory=dict)  # Per-step seconds reported by the probe
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(q * (len(ordered) - 1))))]
+
+
+class CanaryProber:
+    """
+    Runs `probe()` every `interval` seconds and keeps a rolling window of results
+
+    The probe is a coroutine returning per-step timings; raising marks the
+    run as failed. Runs are skipped while `ready()` is False, e.g. before
+    the model is loaded or while every inference worker is busy with real
+    jobs, so the canary never queues behind or slows down user work. A
+    probe that is preempted by a job raises ProbeSkipped and is left out.
+
+    Latency is judged against a baseline, the median of the first
+    `baseline_probes` successful runs after the warm-up run, since kernels
+    and caches make the very first run slow. The canary is degraded when
+    the median of the last `recent_probes` successes exceeds the baseline
+    by `degraded_factor`, or when more than `max_error_rate` of the window
+    failed, and failing after `failing_after` consecutive failures.
+    """
+
+    def __init__(
+        self,
+        probe: Callable[[], Awaitable[Dict[str, float]]],
+        interval: float,
+        window: int = 30,
+        ready: Optional[Callable[[], bool]] = None,
+        baseline_probes: int = 5,
+        recent_probes: int = 3,
+        degraded_factor: float = 1.5,
+        max_error_rate: float = 0.2,
+        failing_after: int = 2
+    ):
+        self.probe = probe
+        self.interval = interval
+        self.ready = ready or (lambda: True)
+        self.baseline_probes = baseline_probes
+        self.recent_probes = recent_probes
+        self.degraded_factor = degraded_factor
+        self.max_error_rate = max_error_rate
+        self.failing_after = failing_after
+        self.results: Deque[ProbeResult] = deque(maxlen=window)
+        self.baseline_samples: List[float] = []
+        self.warmed_up = False
+        self.consecutive_failures = 0
+        self.skipped = 0
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def baseline(self) -> Optional[float]:
+        if len(self.baseline_samples) < self.baseline_probes:
+            return None
+        return statistics.median(self.baseline_samples)
+
+    async def run_once(self) -> Optional[ProbeResult]:
+        """Run the probe now unless the service is not ready; returns None when skipped"""
+        if not self.ready():
+            self.skipped += 1
+            return None
+        start = time.perf_counter()
+        try:
+            timings = await self.probe()
+            result = ProbeResult(time.time(), time.perf_counter() - start, True, timings=timings or {})
+        except asyncio.CancelledError:
+            raise
+        except ProbeSkipped as e:
+            self.skipped += 1
+            logger.info(f"Canary skipped: {e}")
+            return None
+        except Exception as e:
+            result = ProbeResult(time.time(), time.perf_counter() - start, False, error=f"{type(e).__name__}: {e}")
+            logger.warning(f"Canary failed after {result.seconds:.1f}s: {result.error}")
+
+        if not result.ok:
+            self.consecutive_failures += 1
+        else:
+            self.consecutive_failures = 0
+            if not self.warmed_up:
+                self.warmed_up = True  # Kept in the window, left out of the baseline
+            elif len(self.baseline_samples) < self.baseline_probes:
+                self.baseline_samples.append(result.seconds)
+        self.results.append(result)
+        return result
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Canary loop error: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        """Start probing on the running event loop; an interval of 0 disables the canary"""
+        if self.interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        Health verdict and latency statistics over the window
+
+        `status` is "unknown" until the first run, then "ok", "degraded" or
+        "failing"; `reasons` says why it is not "ok".
+        """
+        results = list(self.results)
+        successes = [r.seconds for r in results if r.ok]
+        failures = [r for r in results if not r.ok]
+        baseline = self.baseline
+        error_rate = len(failures) / len(results) if results else 0.0
+        recent = statistics.median(successes[-self.recent_probes:]) if successes else None
+
+        reasons = []
+        if self.consecutive_failures >= self.failing_after:
+            reasons.append(f"{self.consecutive_failures} consecutive canary failures")
+        if results and error_rate > self.max_error_rate:
+            reasons.append(f"canary error rate {error_rate:.0%} over the last {len(results)} runs")
+        if baseline and recent and recent > baseline * self.degraded_factor:
+            reasons.append(f"canary latency {recent:.2f}s is {recent / baseline:.1f}x the {baseline:.2f}s baseline")
+
+        if not results:
+            status = "unknown"
+        elif self.consecutive_failures >= self.failing_after:
+            status = "failing"
+        elif reasons:
+            status = "degraded"
+        else:
+            status = "ok"
+
+        steps: Dict[str, List[float]] = {}
+        for r in results:
+            for name, seconds in r.timings.items():
+                if isinstance(seconds, (int, float)) and not isinstance(seconds, bool):
+                    steps.setdefault(name, []).append(seconds)
+        last = results[-1] if results else None
+        return {
+            "status": status,
+            "reasons": reasons,
+            "enabled": self.interval > 0,
+            "interval_seconds": self.interval,
+            "runs": len(results),
+            "failures": len(failures),
+            "skipped": self.skipped,
+            "consecutive_failures": self.consecutive_failures,
+            "error_rate": error_rate,
+            "latency_seconds": {
+                "last": last.seconds if last and last.ok else None,
+                "p50": statistics.median(successes) if successes else None,
+                "p95": percentile(successes, 0.95) if successes else None,
+                "max": max(successes) if successes else None,
+                "recent": recent,
+                "baseline": baseline,
+            },
+            "step_seconds_p50": {name: statistics.median(values) for name, values in steps.items()},
+            "last_run_at": last.finished_at if last else None,
+            "last_error": failures[-1].error if failures else None,
+        }
+
+
+class CachedSnapshot:
+    """
+    A report rebuilt in the background every `interval` seconds
+
+    Readers get the last built report without doing any work, so health
+    checks and load-balancer probes cost a dictionary lookup however often
+    they come. `build` runs in a worker thread, so it may block on
+    filesystem or device queries.
+    """
+
+    def __init__(self, build: Callable[[], Dict[str, Any]], interval: float):
+        self.build = build
+        self.interval = interval
+        self.report: Dict[str, Any] = {}
+        self.built_at: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def refresh(self) -> Dict[str, Any]:
+        self.report = await asyncio.to_thread(self.build)
+        self.built_at = time.time()
+        return self.report
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Health snapshot failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def get(self) -> Dict[str, Any]:
+        """The last report, with its age in seconds"""
+        age = time.time() - self.built_at if self.built_at else None
+        return {**self.report, "snapshot_age_seconds": age}
@@ -0,0 +1,261 @@
+"""
+ROI compositing engine for object motion signals
+Cuts objects out of the source image and pastes them along their trajectories
+"""
+
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+
+def resample_trajectory(trajectory: np.ndarray, num_frames: int) -> np.ndarray:
+    """
+    Linearly interpolate an (N, 2) trajectory to `num_frames` points
+
+    Trajectories with at least `num_frames` points are truncated, matching the
+    original behaviour of the API.
+    """
+    if len(trajectory) >= num_frames:
+        return trajectory[:num_frames]
+    t = np.linspace(0, len(trajectory) - 1, num_frames)
+    knots = np.arange(len(trajectory))
+    return np.stack([
+        np.interp(t, knots, trajectory[:, 0]),
+        np.interp(t, knots, trajectory[:, 1]),
+    ], axis=1)
+
+
+@dataclass
+class Sprite:
+    """A cut-out object with premultiplied colour and precomputed alpha"""
+    color: np.ndarray  # (h, w, 3) float32, premultiplied by alpha
+    alpha: np.ndarray  # (h, w, 1) float32 in [0, 1]
+    inv_alpha: np.ndarray  # (h, w, 1) float32, 1 - alpha
+    mask: np.ndarray  # (h, w) uint8, 255 where alpha >= 0.5
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        return self.alpha.shape[1], self.alpha.shape[0]
+
+    @classmethod
+    def from_arrays(cls, color: np.ndarray, alpha: np.ndarray) -> "Sprite":
+        alpha = alpha.astype(np.float32)[..., None]
+        return cls(
+            color=color.astype(np.float32) * alpha,
+            alpha=alpha,
+            inv_alpha=1.0 - alpha,
+            mask=np.where(alpha[..., 0] >= 0.5, 255, 0).astype(np.uint8),
+        )
+
+
+@dataclass
+class MotionObject:
+    """
+    An object to move: its source region and per-frame placement
+
+    Attributes:
+        sprite: Cut-out at source scale and orientation
+        positions: (T, 2) sprite centre per frame, in pixels
+        scales: (T,) scale factor per frame
+        rotations: (T,) rotation per frame, in degrees counter-clockwise
+    """
+    sprite: Sprite
+    positions: np.ndarray
+    scales: np.ndarray
+    rotations: np.ndarray
+    _transformed: Dict[Tuple[float, float], Sprite] = field(default_factory=dict)
+
+    def sprite_at(self, t: int) -> Sprite:
+        """Sprite for frame t, transforming (and caching) only when scale/rotation differ"""
+        key = (round(float(self.scales[t]), 3), round(float(self.rotations[t]), 1))
+        if key == (1.0, 0.0):
+            return self.sprite
+        sprite = self._transformed.get(key)
+        if sprite is None:
+            sprite = transform_sprite(self.sprite, *key)
+            self._transformed[key] = sprite
+        return sprite
+
+
+def extract_sprite(image: np.ndarray, mask: np.ndarray) -> Tuple[Sprite, Tuple[float, float]]:
+    """
+    Cut the masked region out of an image
+
+    Args:
+        image: (H, W, 3) uint8 source image
+        mask: (H, W) array, non-zero (or soft 0-255 alpha) where the object is
+
+    Returns:
+        (sprite, centre of the object's bounding box in image pixels)
+    """
+    rows = np.flatnonzero(mask.any(axis=1))
+    cols = np.flatnonzero(mask.any(axis=0))
+    if len(rows) == 0:
+        raise ValueError("object mask is empty")
+    y0, y1 = rows[0], rows[-1] + 1
+    x0, x1 = cols[0], cols[-1] + 1
+
+    roi_mask = mask[y0:y1, x0:x1]
+    if roi_mask.dtype == np.bool_:
+        alpha = roi_mask.astype(np.float32)
+    else:
+        alpha = roi_mask.astype(np.float32) / max(float(roi_mask.max()), 1.0)
+
+    sprite = Sprite.from_arrays(image[y0:y1, x0:x1], alpha)
+    return sprite, ((x0 + x1) / 2.0, (y0 + y1) / 2.0)
+
+
+def transform_sprite(sprite: Sprite, scale: float, rotation: float) -> Sprite:
+    """Scale and rotate a sprite about its centre into a tight new bounding box"""
+    w, h = sprite.size
+    theta = np.deg2rad(rotation)
+    cos, sin = abs(np.cos(theta)) * scale, abs(np.sin(theta)) * scale
+    new_w = max(1, int(np.ceil(w * cos + h * sin)))
+    new_h = max(1, int(np.ceil(w * sin + h * cos)))
+
+    M = cv2.getRotationMatrix2D((w / 2.0, h / 2.0), rotation, scale)
+    M[0, 2] += new_w / 2.0 - w / 2.0
+    M[1, 2] += new_h / 2.0 - h / 2.0
+
+    # Colour is premultiplied, so it can be resampled alongside alpha
+    color = cv2.warpAffine(sprite.color, M, (new_w, new_h), flags=cv2.INTER_LINEAR)
+    alpha = cv2.warpAffine(sprite.alpha[..., 0], M, (new_w, new_h), flags=cv2.INTER_LINEAR)
+    alpha = np.clip(alpha, 0.0, 1.0)[..., None]
+    return Sprite(
+        color=color,
+        alpha=alpha,
+        inv_alpha=1.0 - alpha,
+        mask=np.where(alpha[..., 0] >= 0.5, 255, 0).astype(np.uint8),
+    )
+
+
+def make_motion_object(
+    image: np.ndarray,
+    trajectory: np.ndarray,
+    num_frames: int,
+    mask: Optional[np.ndarray] = None,
+    bbox: Optional[Tuple[float, float, float, float]] = None,
+    scale: float = 1.0,
+    scale_end: Optional[float] = None,
+    rotation: float = 0.0,
+    rotation_end: Optional[float] = None
+) -> MotionObject:
+    """
+    Build a MotionObject from a source mask or normalized bbox and a trajectory
+
+    Args:
+        image: (H, W, 3) uint8 source image
+        trajectory: (N, 2) normalized positions of the object centre
+        num_frames: Number of frames
+        mask: (H, W) source mask; takes precedence over bbox
+        bbox: Normalized (x0, y0, x1, y1) source box
+        scale, scale_end: Scale at the first and last frame
+        rotation, rotation_end: Rotation in degrees at the first and last frame
+    """
+    h, w = image.shape[:2]
+    if mask is None:
+        if bbox is None:
+            raise ValueError("object needs a mask or a bbox")
+        x0, y0, x1, y1 = bbox
+        mask = np.zeros((h, w), dtype=np.uint8)
+        mask[int(y0 * h):max(int(y1 * h), int(y0 * h) + 1), int(x0 * w):max(int(x1 * w), int(x0 * w) + 1)] = 255
+    elif mask.shape[:2] != (h, w):
+        mask = cv2.resize(mask, (w, h), interpolation=cv2.INTER_NEAREST)
+
+    sprite, _ = extract_sprite(image, mask)
+    positions = resample_trajectory(trajectory, num_frames) * np.array([w, h], dtype=np.float32)
+
+    ramp = np.linspace(0.0, 1.0, num_frames, dtype=np.float32)
+    scale_end = scale if scale_end is None else scale_end
+    rotation_end = rotation if rotation_end is None else rotation_end
+    return MotionObject(
+        sprite=sprite,
+        positions=positions,
+        scales=scale + (scale_end - scale) * ramp,
+        rotations=rotation + (rotation_end - rotation) * ramp,
+    )
+
+
+def composite_objects(
+    image: np.ndarray,
+    objects: List[MotionObject],
+    num_frames: int,
+    frames: Optional[range] = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Composite moving objects over a static background
+
+    The output buffers are allocated once; the background is broadcast into
+    them in a single copy and all per-frame work happens inside each sprite's
+    clipped ROI, so cost scales with object area rather than frame area.
+    Objects are drawn in list order, later objects on top. With `frames`,
+    only that range of the `num_frames` clip is rendered.
+
+    Returns:
+        motion_signal: (T, H, W, 3) uint8 frames
+        mask: (T, H, W) uint8, 255 where an object was composited
+    """
+    frames = frames if frames is not None else range(num_frames)
+    h, w = image.shape[:2]
+    output = np.empty((len(frames), h, w, 3), dtype=np.uint8)
+    output[:] = image
+    masks = np.zeros((len(frames), h, w), dtype=np.uint8)
+
+    # Scratch buffer reused for every blend
+    max_area = max(
+        (max(obj.sprite_at(t).alpha.size for t in frames) for obj in objects),
+        default=0
+    )
+    scratch = np.empty(max_area * 3, dtype=np.float32)
+
+    for i, t in enumerate(frames):
+        for obj in objects:
+            sprite = obj.sprite_at(t)
+            sw, sh = sprite.size
+            left = int(round(obj.positions[t, 0] - sw / 2.0))
+            top = int(round(obj.positions[t, 1] - sh / 2.0))
+
+            # Clip the sprite ROI against the frame
+            x0, y0 = max(left, 0), max(top, 0)
+            x1, y1 = min(left + sw, w), min(top + sh, h)
+            if x0 >= x1 or y0 >= y1:
+                continue
+            sx0, sy0 = x0 - left, y0 - top
+            sx1, sy1 = sx0 + (x1 - x0), sy0 + (y1 - y0)
+
+            dst = output[i, y0:y1, x0:x1]
+            blend = scratch[:dst.size].reshape(dst.shape)
+            np.multiply(dst, sprite.inv_alpha[sy0:sy1, sx0:sx1], out=blend)
+            blend += sprite.color[sy0:sy1, sx0:sx1]
+            np.rint(blend, out=blend)
+            dst[:] = blend
+
+            roi_mask = masks[i, y0:y1, x0:x1]
+            np.maximum(roi_mask, sprite.mask[sy0:sy1, sx0:sx1], out=roi_mask)
+
+    return output, masks
+
+
+if __name__ == "__main__":
+    # Compositing cost versus object size at the default resolution
+    height, width, num_frames = 480, 832, 81
+    image = np.random.randint(0, 255, (height, width, 3), dtype=np.uint8)
+    trajectory = np.array([[0.2, 0.3], [0.8, 0.7]], dtype=np.float32)
+
+    print(f"{'objects':>8} {'size px':>8} {'rotating':>9} {'ms':>8}")
+    for num_objects, size, rotating in [(1, 50, False), (1, 200, False), (4, 100, False), (4, 100, True)]:
+        objects = [
+            make_motion_object(
+                image, trajectory + i * 0.02, num_frames,
+                bbox=(0.1, 0.1, 0.1 + size / width, 0.1 + size / height),
+                rotation_end=45.0 if rotating else None
+            )
+            for i in range(num_objects)
+        ]
+        start = time.perf_counter()
+        composite_objects(image, objects, num_frames)
+        elapsed = (time.perf_counter() - start) * 1000
+        print(f"{num_objects:>8} {size:>8} {str(rotating):>9} {elapsed:>8.1f}")
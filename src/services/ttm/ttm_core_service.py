@@ -0,0 +1,821 @@
+"""
+Shared TTM engine for the FastAPI server and the Modal deployment
+Motion signals, weight loading, inference and encoding live here so both entry points stay in sync
+"""
+
+import copy
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import logging
+import cv2
+import imageio
+import numpy as np
+import torch
+from enum import Enum
+from PIL import Image
+from pydantic import BaseModel, Field, field_validator, model_validator
+
+from ttm_cache import PromptEmbeddingCache, ConditioningCache
+from ttm_compositing import make_motion_object, composite_objects
+from ttm_quantize import quantize_pipeline
+from ttm_reprojection import DEFAULT_FOV, ForwardWarper, camera_path, decode_depth, heuristic_depth
+from ttm_snapshot import MODEL_ID, MODEL_PATH, ALLOW_DOWNLOAD, resolve_snapshot, verify_snapshot
+from ttm_wire import Binary, Trajectory
+
+logger = logging.getLogger(__name__)
+
+# Add TTM core to path
+sys.path.append(os.path.join(os.path.dirname(__file__), 'ttm-core'))
+
+# TTM components; the engine can still run a stock diffusers pipeline without them
+try:
+    from pipelines.wan_pipeline import WanImageToVideoTTMPipeline
+except ImportError as e:
+    WanImageToVideoTTMPipeline = None
+    logger.warning(f"TTM pipeline not installed: {e}")
+
+try:
+    from pipelines.utils import compute_hw_from_area
+except ImportError:
+    def compute_hw_from_area(image_height, image_width, max_area, mod_value):
+        """Largest (height, width) within max_area keeping aspect ratio, rounded down to mod_value"""
+        aspect_ratio = image_height / image_width
+        height = round(np.sqrt(max_area * aspect_ratio)) // mod_value * mod_value
+        width = round(np.sqrt(max_area / aspect_ratio)) // mod_value * mod_value
+        return int(height), int(width)
+
+# Model settings
+DTYPE = torch.bfloat16
+DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+
+# Generation defaults
+DEFAULT_NUM_FRAMES = 81
+DEFAULT_FPS = 16
+DEFAULT_GUIDANCE_SCALE = 3.5
+DEFAULT_NUM_INFERENCE_STEPS = 50
+DEFAULT_MAX_AREA = 480 * 832
+MAX_NUM_FRAMES = 161  # Longest clip in one pipeline call
+
+# Motion control defaults
+DEFAULT_TWEAK_INDEX_OBJECT = 3
+DEFAULT_TSTRONG_INDEX_OBJECT = 7
+DEFAULT_TWEAK_INDEX_CAMERA = 2
+DEFAULT_TSTRONG_INDEX_CAMERA = 5
+
+MAX_MOTION_OBJECTS = 8
+
+
+# Motion specification
+class MotionType(str, Enum):
+    OBJECT = "object"
+    CAMERA = "camera"
+
+CAMERA_MOVEMENT_TYPES = ("pan", "zoom", "orbit", "dolly", "path")
+DEPTH_CAMERA_MOVEMENTS = ("orbit", "dolly", "path")  # Rendered by depth-based reprojection
+
+class CameraMovement(BaseModel):
+    type: str = Field(..., description="Type of camera movement: pan, zoom, orbit, dolly, path")
+    params: Dict[str, Any] = Field(..., description="Movement-specific parameters")
+    depth: Optional[Binary] = Field(None, description="Depth image for orbit/dolly/path, brighter = nearer, base64 in JSON and raw bytes in msgpack; estimated when omitted")
+
+    @field_validator('type')
+    @classmethod
+    def validate_type(cls, v):
+        if v not in CAMERA_MOVEMENT_TYPES:
+            raise ValueError(f"camera movement type must be one of {', '.join(CAMERA_MOVEMENT_TYPES)}")
+        return v
+
+class MotionObjectSpec(BaseModel):
+    """One object to cut out of the image and move along its own trajectory"""
+    trajectory: Trajectory = Field(..., description="Normalized positions of the object centre")
+    bbox: Optional[List[float]] = Field(None, description="Normalized source box [x0, y0, x1, y1]")
+    mask: Optional[Binary] = Field(None, description="Source mask image (non-zero = object), base64 in JSON and raw bytes in msgpack")
+    scale: float = Field(1.0, description="Scale at the first frame")
+    scale_end: Optional[float] = Field(None, description="Scale at the last frame")
+    rotation: float = Field(0.0, description="Rotation in degrees at the first frame")
+    rotation_end: Optional[float] = Field(None, description="Rotation in degrees at the last frame")
+
+    @field_validator('bbox')
+    @classmethod
+    def validate_bbox(cls, v):
+        if v is not None and (len(v) != 4 or not 0 <= v[0] < v[2] <= 1 or not 0 <= v[1] < v[3] <= 1):
+            raise ValueError('bbox must be [x0, y0, x1, y1] with 0 <= x0 < x1 <= 1 and 0 <= y0 < y1 <= 1')
+        return v
+
+    @field_validator('scale', 'scale_end')
+    @classmethod
+    def validate_scale(cls, v):
+        if v is not None and (v <= 0 or v > 10):
+            raise ValueError('scale must be between 0 and 10')
+        return v
+
+    @model_validator(mode='after')
+    def validate_source(self):
+        if self.bbox is None and self.mask is None:
+            raise ValueError('object needs a bbox or a mask')
+        return self
+
+class MotionSpec(BaseModel):
+    """Motion control parameters shared by every entry point"""
+    motion_type: MotionType = Field(..., description="Type of motion control")
+    trajectory: Optional[Trajectory] = Field(None, description="Object motion trajectory points, as {x, y} dicts, [x, y] pairs or packed float32")
+    objects: Optional[List[MotionObjectSpec]] = Field(None, description="Multiple objects, each with its own source region and trajectory")
+    camera_movement: Optional[CameraMovement] = Field(None, description="Camera movement specification")
+    tweak_index: Optional[int] = Field(None, description="When to start denoising outside mask")
+    tstrong_index: Optional[int] = Field(None, description="When to start denoising inside mask")
+    num_frames: int = Field(DEFAULT_NUM_FRAMES, description="Number of frames to generate")
+
+    @field_validator('tweak_index')
+    @classmethod
+    def validate_tweak_index(cls, v):
+        if v is not None and (v < 0 or v > 50):
+            raise ValueError('tweakIndex must be between 0 and 50')
+        return v
+
+    @field_validator('tstrong_index')
+    @classmethod
+    def validate_tstrong_index(cls, v):
+        if v is not None and (v < 0 or v > 50):
+            raise ValueError('tstrongIndex must be between 0 and 50')
+        return v
+
+    @field_validator('num_frames')
+    @classmethod
+    def validate_num_frames(cls, v):
+        if v < 16 or v > MAX_NUM_FRAMES:
+            raise ValueError(f'numFrames must be between 16 and {MAX_NUM_FRAMES}')
+        return v
+
+    @field_validator('objects')
+    @classmethod
+    def validate_objects(cls, v):
+        if v is not None and not 1 <= len(v) <= MAX_MOTION_OBJECTS:
+            raise ValueError(f'objects must contain between 1 and {MAX_MOTION_OBJECTS} entries')
+        return v
+
+
+# Motion signals
+def create_motion_signal_from_trajectory(
+    image: Image.Image,
+    trajectory: np.ndarray,
+    num_frames: int,
+    frames: Optional[range] = None
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Create motion signal video and mask from trajectory points
+
+    The region within 50px of the first trajectory point is cut out and moved
+    along the trajectory.
+
+    Args:
+        image: Input image
+        trajectory: (N, 2) array of x, y coordinates (normalized 0-1)
+        num_frames: Number of frames to generate
+        frames: Only render this range of the frames
+
+    Returns:
+        motion_signal: Video showing object motion
+        mask: Binary mask of moving region
+    """
+    frame = np.asarray(image)
+    h, w = frame.shape[:2]
+    source_mask = np.zeros((h, w), dtype=np.uint8)
+    cx, cy = int(trajectory[0, 0] * w), int(trajectory[0, 1] * h)
+    cv2.circle(source_mask, (cx, cy), 50, 255, -1)
+
+    obj = make_motion_object(frame, trajectory, num_frames, mask=source_mask)
+    return composite_objects(frame, [obj], num_frames, frames)
+
+def create_motion_signal_from_objects(
+    image: Image.Image,
+    objects: List[MotionObjectSpec],
+    num_frames: int,
+    frames: Optional[range] = None
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Create motion signal video and mask for several independently moving objects
+
+    Args:
+        image: Input image
+        objects: Objects with source region, trajectory and optional scale/rotation
+        num_frames: Number of frames to generate
+        frames: Only render this range of the frames
+
+    Returns:
+        motion_signal: Video showing object motion
+        mask: Union of the moving regions per frame
+    """
+    frame = np.asarray(image)
+    motion_objects = []
+    for spec in objects:
+        source_mask = None
+        if spec.mask is not None:
+            source_mask = cv2.imdecode(np.frombuffer(spec.mask, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+            if source_mask is None:
+                raise ValueError("object mask is not a valid image")
+        motion_objects.append(make_motion_object(
+            frame,
+            spec.trajectory,
+            num_frames,
+            mask=source_mask,
+            bbox=spec.bbox,
+            scale=spec.scale,
+            scale_end=spec.scale_end,
+            rotation=spec.rotation,
+            rotation_end=spec.rotation_end
+        ))
+    return composite_objects(frame, motion_objects, num_frames, frames)
+
+def create_camera_motion_signal(
+    image: Image.Image,
+    camera_movement: CameraMovement,
+    num_frames: int,
+    frames: Optional[range] = None
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Create motion signal for camera movement
+
+    Zoom and pan are 2D warps of the whole frame. Orbit, dolly and free
+    6-DoF paths use depth-based reprojection (see `ttm_reprojection`), with
+    the client's depth image or a ground-plane estimate: parallax moves
+    near and far content differently, and regions the new viewpoint
+    uncovers are left out of the mask.
+
+    Args:
+        image: Input image
+        camera_movement: Camera movement specification
+        num_frames: Number of frames
+        frames: Only render this range of the frames
+
+    Returns:
+        motion_signal: Video showing camera motion
+        mask: 255 where the signal shows the input image; full frame for 2D moves
+    """
+    h, w = image.height, image.width
+    params = camera_movement.params
+    frames = frames if frames is not None else range(num_frames)
+
+    if camera_movement.type in DEPTH_CAMERA_MOVEMENTS:
+        frame = np.asarray(image.convert("RGB"))
+        depth = decode_depth(camera_movement.depth, h, w) if camera_movement.depth else heuristic_depth(h, w)
+        poses = camera_path(camera_movement.type, params, num_frames, depth)
+        warper = ForwardWarper(frame, depth, fov=float(params.get("fov", DEFAULT_FOV)))
+        return warper.render_path(poses[frames.start:frames.stop])
+
+    motion_signal = []
+    masks = []
+
+    # Full frame mask for camera motion
+    full_mask = np.ones((h, w), dtype=np.uint8) * 255
+
+    for i in frames:
+        t = i / (num_frames - 1)
+        frame = np.array(image)
+
+        # Apply camera transformation based on type
+        if camera_movement.type == "zoom":
+            scale = 1 + t * params.get("amount", 0.5)
+            M = cv2.getRotationMatrix2D((w/2, h/2), 0, scale)
+            frame = cv2.warpAffine(frame, M, (w, h))
+
+        elif camera_movement.type == "pan":
+            dx = t * params.get("dx", 0) * w
+            dy = t * params.get("dy", 0) * h
+            M = np.float32([[1, 0, dx], [0, 1, dy]])
+            frame = cv2.warpAffine(frame, M, (w, h))
+
+        motion_signal.append(frame)
+        masks.append(full_mask)
+
+    return np.array(motion_signal), np.array(masks)
+
+def apply_default_indices(spec: MotionSpec):
+    """Fill in tweak/tstrong indices based on motion type"""
+    if spec.tweak_index is None:
+        spec.tweak_index = (
+            DEFAULT_TWEAK_INDEX_OBJECT if spec.motion_type == MotionType.OBJECT
+            else DEFAULT_TWEAK_INDEX_CAMERA
+        )
+    if spec.tstrong_index is None:
+        spec.tstrong_index = (
+            DEFAULT_TSTRONG_INDEX_OBJECT if spec.motion_type == MotionType.OBJECT
+            else DEFAULT_TSTRONG_INDEX_CAMERA
+        )
+
+def render_motion_signal(
+    image: Image.Image,
+    spec: MotionSpec,
+    frames: Optional[range] = None
+) -> tuple[np.ndarray, np.ndarray]:
+    """Motion signal frames and mask for a motion specification, or for a range of its frames"""
+    if spec.motion_type == MotionType.OBJECT and spec.objects:
+        return create_motion_signal_from_objects(image, spec.objects, spec.num_frames, frames)
+    if spec.motion_type == MotionType.OBJECT and spec.trajectory is not None:
+        return create_motion_signal_from_trajectory(image, spec.trajectory, spec.num_frames, frames)
+    if spec.motion_type == MotionType.CAMERA and spec.camera_movement:
+        return create_camera_motion_signal(image, spec.camera_movement, spec.num_frames, frames)
+    raise ValueError(f"Invalid motion specification for {spec.motion_type}")
+
+def write_motion_signal(
+    image: Image.Image,
+    spec: MotionSpec,
+    temp_dir: Path,
+    fps: int = DEFAULT_FPS
+) -> tuple[Path, Path]:
+    """Render the motion signal and mask for a specification and write them as MP4s"""
+    motion_signal, mask = render_motion_signal(image, spec)
+    return save_motion_signal(motion_signal, mask, temp_dir, fps)
+
+def save_motion_signal(
+    motion_signal: np.ndarray,
+    mask: np.ndarray,
+    temp_dir: Path,
+    fps: int = DEFAULT_FPS
+) -> tuple[Path, Path]:
+    """Write rendered motion signal frames and mask as the MP4s the pipeline reads"""
+    temp_dir.mkdir(parents=True, exist_ok=True)
+    motion_signal_path = temp_dir / "motion_signal.mp4"
+    mask_path = temp_dir / "mask.mp4"
+
+    imageio.mimwrite(motion_signal_path, motion_signal, fps=fps)
+    imageio.mimwrite(mask_path, mask, fps=fps)
+
+    return motion_signal_path, mask_path
+
+
+# Output encoding
+def to_uint8_frames(frames) -> np.ndarray:
+    """Pipeline output (float in [0, 1] or uint8) as a (T, H, W, 3) uint8 array"""
+    frames = np.asarray(frames)
+    if frames.dtype != np.uint8:
+        frames = (np.clip(frames, 0.0, 1.0) * 255).round().astype(np.uint8)
+    return frames
+
+def export_video(frames, output_path: Path, fps: int = DEFAULT_FPS) -> Path:
+    """Encode frames to an MP4"""
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    # Any even size encodes as is; ffmpeg's default would rescale to a multiple of 16
+    imageio.mimwrite(output_path, to_uint8_frames(frames), fps=fps, macro_block_size=2)
+    return output_path
+
+class FragmentedMP4Writer:
+    """
+    Incremental H.264 encoder writing fragmented MP4 (fMP4)
+
+    Frames are piped to ffmpeg as they arrive and a fragment is written at
+    every keyframe, so the file on disk is playable while it is still
+    growing. Keyframes are forced every `fragment_frames` frames.
+    """
+
+    def __init__(self, output_path: Path, fps: int = DEFAULT_FPS, fragment_frames: int = DEFAULT_FPS):
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = output_path
+        self.frames = 0
+        self._writer = imageio.get_writer(
+            output_path,
+            format="FFMPEG",
+            fps=fps,
+            codec="libx264",
+            pixelformat="yuv420p",
+            macro_block_size=2,
+            output_params=[
+                "-movflags", "frag_keyframe+empty_moov+default_base_moof",
+                "-flush_packets", "1",  # Write each fragment out instead of buffering it
+                "-g", str(fragment_frames),
+                "-keyint_min", str(fragment_frames),
+                "-sc_threshold", "0",
+                # Keep the encoder from holding back more than one fragment
+                "-x264-params", f"rc-lookahead={min(fragment_frames, 40)}",
+            ]
+        )
+
+    def append(self, frames: np.ndarray):
+        for frame in to_uint8_frames(frames):
+            self._writer.append_data(frame)
+            self.frames += 1
+
+    def close(self):
+        self._writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def save_thumbnail(frames, output_path: Path) -> Path:
+    """Save the first frame as a JPEG"""
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    Image.fromarray(to_uint8_frames(frames[:1])[0]).save(output_path)
+    return output_path
+
+
+class TTMEngine:
+    """
+    A loaded pipeline plus everything needed to turn a request into frames
+
+    Holds the prompt and conditioning caches for the pipeline. `generate`
+    blocks for the whole denoising run, so async callers should run it in a
+    worker thread.
+    """
+
+    def __init__(
+        self,
+        pipeline,
+        model_id: str = MODEL_ID,
+        device: str = DEVICE,
+        max_area: int = DEFAULT_MAX_AREA,
+        num_inference_steps: int = DEFAULT_NUM_INFERENCE_STEPS,
+        prompt_cache_bytes: int = 512 * 1024**2,
+        conditioning_cache_bytes: int = 1024 * 1024**2,
+        conditioning_disk_dir: Optional[str] = None,
+        conditioning_disk_bytes: int = 0,
+        load_timings: Optional[Dict[str, Any]] = None
+    ):
+        self.pipeline = pipeline
+        self.model_id = model_id
+        self.device = device
+        self.max_area = max_area
+        self.num_inference_steps = num_inference_steps
+        self.prompt_cache = PromptEmbeddingCache(model_id, prompt_cache_bytes)
+        self.conditioning_cache = ConditioningCache(
+            model_id,
+            conditioning_cache_bytes,
+            disk_dir=conditioning_disk_dir,
+            disk_max_bytes=conditioning_disk_bytes
+        )
+        self.load_timings = load_timings or {}
+
+        # Encode the empty negative prompt once for all jobs
+        stage_start = time.perf_counter()
+        self.prompt_cache.warm_up(pipeline)
+        self.load_timings["warm_up"] = time.perf_counter() - stage_start
+
+    @classmethod
+    def from_snapshot(
+        cls,
+        model_id: str = MODEL_ID,
+        local_path: Optional[str] = MODEL_PATH,
+        device: str = DEVICE,
+        dtype: torch.dtype = DTYPE,
+        pipeline_cls=None,
+        allow_download: bool = ALLOW_DOWNLOAD,
+        cpu_int8: bool = False,
+        quantized_cache_dir: Optional[str] = None,
+        **engine_kwargs
+    ) -> "TTMEngine":
+        """
+        Load the pipeline from a verified local safetensors snapshot
+
+        Shard sizes are checked against their safetensors headers in parallel
+        before loading. Weights are loaded with `low_cpu_mem_usage`, so each safetensors file
+        is memory-mapped and tensors are materialized lazily as components are
+        built, instead of being read through a pickled state dict. Every stage
+        from resolving the snapshot to the warmed-up engine is timed and kept
+        in `load_timings`.
+
+        With `cpu_int8` on a CPU device, the transformer and text encoder
+        linear layers are quantized to int8 (see `ttm_quantize`), reusing
+        converted weights from `quantized_cache_dir` when present.
+        """
+        cold_start = time.perf_counter()
+        timings: Dict[str, Any] = {}
+
+        pipeline_cls = pipeline_cls or WanImageToVideoTTMPipeline
+        if pipeline_cls is None:
+            raise RuntimeError("TTM components not available. Please run: python ttm_api_fixes.py")
+
+        stage_start = time.perf_counter()
+        path = resolve_snapshot(model_id, local_path, allow_download)
+        timings["resolve_snapshot"] = time.perf_counter() - stage_start
+
+        stage_start = time.perf_counter()
+        timings.update(verify_snapshot(path))
+        timings["verify_snapshot"] = time.perf_counter() - stage_start
+
+        stage_start = time.perf_counter()
+        pipeline = pipeline_cls.from_pretrained(
+            str(path),
+            torch_dtype=dtype,
+            use_safetensors=True,
+            low_cpu_mem_usage=True,
+            local_files_only=True
+        )
+        pipeline.vae.enable_tiling()
+        pipeline.vae.enable_slicing()
+
+        # Enable attention slicing if available
+        if hasattr(pipeline.transformer, 'enable_attention_slicing'):
+            pipeline.transformer.enable_attention_slicing()
+        timings["load_weights"] = time.perf_counter() - stage_start
+
+        if cpu_int8:
+            if device == "cpu":
+                stage_start = time.perf_counter()
+                timings["int8"] = quantize_pipeline(pipeline, path, quantized_cache_dir)
+                timings["quantize_int8"] = time.perf_counter() - stage_start
+            else:
+                logger.warning(f"CPU int8 mode ignored on device {device}")
+
+        stage_start = time.perf_counter()
+        pipeline.to(device)
+        if device.startswith("cuda"):
+            torch.cuda.synchronize()
+        timings["to_device"] = time.perf_counter() - stage_start
+
+        engine = cls(pipeline, model_id=model_id, device=device, load_timings=timings, **engine_kwargs)
+        timings["snapshot"] = str(path)
+        timings["cold_start"] = time.perf_counter() - cold_start
+        logger.info(f"Loaded {model_id} from {path} in {timings['cold_start']:.1f}s")
+        return engine
+
+    def for_slot(self) -> "TTMEngine":
+        """
+        A view of this engine that can run concurrently with it
+
+        Weights and caches are shared. The pipeline object, its scheduler
+        and the VAE wrapper are per view, because the pipeline and scheduler
+        keep per-run state and the VAE holds its decode cache and the
+        conditioning cache's patched `encode` as attributes.
+        """
+        view = copy.copy(self)
+        view.pipeline = copy.copy(self.pipeline)
+        view.pipeline.scheduler = copy.deepcopy(self.pipeline.scheduler)
+        view.pipeline.vae = copy.copy(self.pipeline.vae)
+        return view
+
+    def with_limits(self, max_area: int, num_inference_steps: int) -> "TTMEngine":
+        """A view like `for_slot` that generates at another resolution and step count"""
+        view = self.for_slot()
+        view.max_area = max_area
+        view.num_inference_steps = num_inference_steps
+        return view
+
+    def target_size(self, width: int, height: int, max_area: Optional[int] = None) -> tuple[int, int]:
+        """Generation (width, height) for an input of the given size, within `max_area` if given"""
+        mod_value = self.pipeline.vae_scale_factor_spatial * self.pipeline.transformer.config.patch_size[1]
+        target_height, target_width = compute_hw_from_area(height, width, max_area or self.max_area, mod_value)
+        return target_width, target_height
+
+    def prepare_image(self, image: Image.Image, max_area: Optional[int] = None) -> Image.Image:
+        """Resize to the generation resolution (stored image handles already are)"""
+        size = self.target_size(image.width, image.height, max_area)
+        return image if image.size == size else image.resize(size)
+
+    def make_generators(self, seeds: List[Optional[int]]) -> List[Optional[torch.Generator]]:
+        """One generator per video; a single unseeded video uses the pipeline default"""
+        if len(seeds) == 1 and seeds[0] is None:
+            return [None]
+        gen_device = self.device if self.device.startswith("cuda") else "cpu"
+        generators = []
+        for seed in seeds:
+            generator = torch.Generator(device=gen_device)
+            if seed is not None:
+                generator.manual_seed(seed)
+            else:
+                generator.seed()
+            generators.append(generator)
+        return generators
+
+    def _run_pipeline(
+        self,
+        image: Image.Image,
+        prompt: str,
+        spec: MotionSpec,
+        seeds: List[Optional[int]],
+        guidance_scale: float,
+        motion_signal_path: Optional[Path],
+        mask_path: Optional[Path],
+        callback: Optional[Callable],
+        timings: Dict[str, Any],
+        output_type: str
+    ):
+        pipeline = self.pipeline
+        batch_size = len(seeds)
+        generators = self.make_generators(seeds)
+        condition_key = self.conditioning_cache.image_key(image, image.height, image.width)
+
+        stage_start = time.perf_counter()
+        prompt_embeds = self.prompt_cache.get(pipeline, prompt)
+        negative_prompt_embeds = self.prompt_cache.negative_prompt_embeds
+        timings["prompt_encode"] = time.perf_counter() - stage_start
+
+        stage_start = time.perf_counter()
+        image_embeds, image_embeds_hit = self.conditioning_cache.image_embeds(pipeline, image, condition_key)
+        timings["image_encode"] = time.perf_counter() - stage_start
+        timings["image_embeds_cache_hit"] = image_embeds_hit
+
+        extra_kwargs = {}
+        if image_embeds is not None:
+            # Expanded to the batch size by the pipeline
+            extra_kwargs["image_embeds"] = image_embeds
+        if motion_signal_path is not None:
+            extra_kwargs.update(
+                motion_signal_video_path=str(motion_signal_path),
+                motion_signal_mask_path=str(mask_path),
+                tweak_index=spec.tweak_index,
+                tstrong_index=spec.tstrong_index,
+            )
+        if callback is not None:
+            extra_kwargs["callback_on_step_end"] = callback
+        if output_type != "np":
+            extra_kwargs["output_type"] = output_type
+
+        if batch_size > 1:
+            # Precomputed prompt embeddings are not expanded by the pipeline
+            prompt_embeds = prompt_embeds.repeat_interleave(batch_size, dim=0)
+            negative_prompt_embeds = negative_prompt_embeds.repeat_interleave(batch_size, dim=0)
+
+        stage_start = time.perf_counter()
+        with torch.inference_mode(), self.conditioning_cache.vae_condition(pipeline, condition_key, timings):
+            output = pipeline(
+                image=image,
+                prompt_embeds=prompt_embeds,
+                negative_prompt_embeds=negative_prompt_embeds,
+                height=image.height,
+                width=image.width,
+                num_frames=spec.num_frames,
+                guidance_scale=guidance_scale,
+                num_inference_steps=self.num_inference_steps,
+                generator=generators if batch_size > 1 else generators[0],
+                **extra_kwargs,
+            )
+        timings["inference"] = time.perf_counter() - stage_start
+        return output.frames
+
+    def generate(
+        self,
+        image: Image.Image,
+        prompt: str,
+        spec: MotionSpec,
+        seeds: List[Optional[int]],
+        guidance_scale: float = DEFAULT_GUIDANCE_SCALE,
+        motion_signal_path: Optional[Path] = None,
+        mask_path: Optional[Path] = None,
+        callback: Optional[Callable] = None,
+        timings: Optional[Dict[str, Any]] = None
+    ) -> List[np.ndarray]:
+        """
+        Run one pipeline call producing a video per seed
+
+        Args:
+            image: Input image, already at the generation resolution
+            prompt: Text prompt shared by the batch
+            spec: Motion specification with tweak/tstrong indices filled in
+            seeds: Seed per video; the batch size is len(seeds)
+            guidance_scale: Classifier-free guidance scale
+            motion_signal_path, mask_path: Motion signal MP4s from
+                `write_motion_signal`; omitted for plain image-to-video
+            callback: `callback_on_step_end` hook, e.g. for cancellation
+            timings: Filled with per-stage seconds and cache hits
+
+        Returns:
+            (T, H, W, 3) frames per video, in seed order
+        """
+        frames = self._run_pipeline(
+            image, prompt, spec, seeds, guidance_scale, motion_signal_path, mask_path, callback,
+            timings if timings is not None else {}, output_type="np"
+        )
+        return [to_uint8_frames(video) for video in frames]
+
+    def generate_latents(
+        self,
+        image: Image.Image,
+        prompt: str,
+        spec: MotionSpec,
+        seeds: List[Optional[int]],
+        guidance_scale: float = DEFAULT_GUIDANCE_SCALE,
+        motion_signal_path: Optional[Path] = None,
+        mask_path: Optional[Path] = None,
+        callback: Optional[Callable] = None,
+        timings: Optional[Dict[str, Any]] = None
+    ) -> List[torch.Tensor]:
+        """
+        Like `generate`, but stop before the VAE decode
+
+        Returns:
+            Normalized (C, T, h, w) latents per video, for `decode_chunks`
+        """
+        latents = self._run_pipeline(
+            image, prompt, spec, seeds, guidance_scale, motion_signal_path, mask_path, callback,
+            timings if timings is not None else {}, output_type="latent"
+        )
+        return list(latents)
+
+    @torch.inference_mode()
+    def decode_chunks(self, latents: torch.Tensor, chunk_frames: int = DEFAULT_FPS) -> Iterator[np.ndarray]:
+        """
+        Decode one video's latents a few frames at a time
+
+        The Wan VAE decoder is causal and decodes one latent frame at a time
+        with a cache of the previous frames' features, so stopping between
+        latent frames gives exactly the frames a full decode would. Each
+        yielded chunk is about `chunk_frames` uint8 (t, H, W, 3) frames,
+        which bounds decoded frame memory by the chunk rather than the clip.
+        Spatial VAE tiling is not applied on this path.
+        """
+        vae = self.pipeline.vae
+        z = latents.unsqueeze(0).to(vae.dtype)
+        latents_mean = torch.tensor(vae.config.latents_mean).view(1, vae.config.z_dim, 1, 1, 1).to(z.device, z.dtype)
+        # Divided by the reciprocal as the pipeline does, so the rounding matches a full decode
+        latents_std = 1.0 / torch.tensor(vae.config.latents_std).view(1, vae.config.z_dim, 1, 1, 1).to(z.device, z.dtype)
+        z = z / latents_std + latents_mean
+
+        latent_chunk = max(1, chunk_frames // self.pipeline.vae_scale_factor_temporal)
+        vae.clear_cache()
+        try:
+            x = vae.post_quant_conv(z)
+            for start in range(0, x.shape[2], latent_chunk):
+                decoded = []
+                for i in range(start, min(start + latent_chunk, x.shape[2])):
+                    vae._conv_idx = [0]
+                    decoded.append(vae.decoder(
+                        x[:, :, i:i + 1], feat_cache=vae._feat_map, feat_idx=vae._conv_idx, first_chunk=i == 0
+                    ))
+                chunk = torch.cat(decoded, 2)
+                if vae.config.patch_size is not None:
+                    from diffusers.models.autoencoders.autoencoder_kl_wan import unpatchify
+                    chunk = unpatchify(chunk, patch_size=vae.config.patch_size)
+                # Same mapping as the pipeline's video postprocessing
+                chunk = (chunk[0].float().clamp(-1.0, 1.0) / 2 + 0.5).permute(1, 2, 3, 0)
+                yield (chunk * 255).round().to(torch.uint8).cpu().numpy()
+        finally:
+            vae.clear_cache()
+
+
+def build_tiny_snapshot(
+    path: Path,
+    attention_head_dim: int = 12,
+    num_heads: int = 2,
+    ffn_dim: int = 32,
+    num_layers: int = 2,
+    text_dim: int = 16
+):
+    """
+    Save a tiny randomly initialised Wan image-to-video pipeline to `path`
+
+    Mirrors the real snapshot layout with a few thousand parameters per
+    component by default, so loading and inference can be exercised on CPU;
+    the transformer and text encoder sizes can be raised for benchmarks.
+    """
+    from diffusers import AutoencoderKLWan, FlowMatchEulerDiscreteScheduler, WanImageToVideoPipeline, WanTransformer3DModel
+    from tokenizers import Tokenizer, models, pre_tokenizers
+    from transformers import PreTrainedTokenizerFast, UMT5Config, UMT5EncoderModel
+
+    vocab = {"<pad>": 0, "</s>": 1, "<unk>": 2}
+    vocab.update({word: i + 3 for i, word in enumerate("a the cat dog ball walks rolls left right".split())})
+    tokenizer = Tokenizer(models.WordLevel(vocab, unk_token="<unk>"))
+    tokenizer.pre_tokenizer = pre_tokenizers.Whitespace()
+
+    torch.manual_seed(0)
+    pipeline = WanImageToVideoPipeline(
+        tokenizer=PreTrainedTokenizerFast(tokenizer_object=tokenizer, pad_token="<pad>", eos_token="</s>", unk_token="<unk>"),
+        text_encoder=UMT5EncoderModel(UMT5Config(
+            vocab_size=32, d_model=text_dim, d_kv=text_dim // 4, d_ff=2 * text_dim, num_layers=1, num_heads=2
+        )),
+        vae=AutoencoderKLWan(base_dim=3, z_dim=16, dim_mult=[1, 1, 1, 1], num_res_blocks=1, temperal_downsample=[False, True, True]),
+        scheduler=FlowMatchEulerDiscreteScheduler(shift=7.0),
+        transformer=WanTransformer3DModel(
+            patch_size=(1, 2, 2), num_attention_heads=num_heads, attention_head_dim=attention_head_dim,
+            in_channels=36, out_channels=16, text_dim=text_dim, freq_dim=256, ffn_dim=ffn_dim, num_layers=num_layers,
+            cross_attn_norm=True,
+            qk_norm="rms_norm_across_heads", rope_max_seq_len=32
+        ),
+    )
+    pipeline.save_pretrained(str(path), safe_serialization=True)
+
+
+if __name__ == "__main__":
+    # Cold start and a short generation with a tiny random model on CPU
+    import tempfile
+    from diffusers import WanImageToVideoPipeline
+
+    logging.basicConfig(level=logging.INFO)
+    with tempfile.TemporaryDirectory() as tmp:
+        snapshot = Path(tmp) / "snapshot"
+        build_tiny_snapshot(snapshot)
+
+        engine = TTMEngine.from_snapshot(
+            "tiny-random-wan",
+            local_path=str(snapshot),
+            device="cpu",
+            dtype=torch.float32,
+            pipeline_cls=WanImageToVideoPipeline,
+            max_area=64 * 64,
+            num_inference_steps=2
+        )
+        print("Cold start (s):")
+        for stage, value in engine.load_timings.items():
+            print(f"  {stage:>18}: {value:.4f}" if isinstance(value, float) else f"  {stage:>18}: {value}")
+
+        image = engine.prepare_image(Image.new("RGB", (96, 64), "red"))
+        spec = MotionSpec(motion_type="object", trajectory=[[0.3, 0.5], [0.7, 0.5]], num_frames=17)
+        apply_default_indices(spec)
+        timings: Dict[str, Any] = {}
+        videos = engine.generate(image, "a cat walks left", spec, seeds=[0, 1], timings=timings)
+        print(f"Generated {len(videos)} videos of shape {videos[0].shape}")
+        print("Generation (s):", {k: round(v, 4) if isinstance(v, float) else v for k, v in timings.items()})
@@ -0,0 +1,231 @@
+"""
+CPU execution mode for the TTM service
+Cores are partitioned between concurrent inference slots and a reserved pool for OpenCV, PIL and ffmpeg work
+"""
+
+import asyncio
+import functools
+import itertools
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import cv2
+import torch
+from torch import nn
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CorePlan:
+    """CPU cores of each inference slot, and the cores left to the worker pool"""
+    slots: List[List[int]]
+    workers: List[int]
+
+
+def available_cores() -> List[int]:
+    return sorted(os.sched_getaffinity(0))
+
+
+def sibling_order(cores: List[int]) -> List[int]:
+    """
+    Cores ordered so hyperthread siblings are adjacent
+
+    Contiguous ranges of the result then cover whole physical cores, and a
+    slot never shares a physical core with another slot.
+    """
+    groups: Dict[str, List[int]] = {}
+    for core in cores:
+        try:
+            siblings = Path(f"/sys/devices/system/cpu/cpu{core}/topology/thread_siblings_list").read_text().strip()
+        except OSError:
+            siblings = str(core)
+        groups.setdefault(siblings, []).append(core)
+    return [core for group in groups.values() for core in group]
+
+
+def plan_cores(slots: int, worker_cores: int, cores: Optional[List[int]] = None) -> CorePlan:
+    """
+    Split cores into `slots` equal inference slots plus `worker_cores` for the worker pool
+
+    At least one core is always left for inference, and there are never
+    more slots than inference cores. With no worker cores the worker pool
+    is not pinned.
+    """
+    cores = sibling_order(cores or available_cores())
+    worker_cores = max(0, min(worker_cores, len(cores) - 1))
+    inference = cores[:len(cores) - worker_cores]
+    workers = cores[len(cores) - worker_cores:] if worker_cores else []
+    slots = max(1, min(slots, len(inference)))
+    return CorePlan(
+        slots=[inference[i * len(inference) // slots:(i + 1) * len(inference) // slots] for i in range(slots)],
+        workers=workers
+    )
+
+
+def to_channels_last(pipeline) -> int:
+    """
+    Store a pipeline's convolution weights channels-last (NHWC / NDHWC)
+
+    oneDNN convolutions on CPU are fastest in channels-last layouts and
+    produce channels-last outputs when their weights are, so the Wan VAE
+    and the transformer patch embedding stop converting layouts per call.
+
+    Returns:
+        Number of convolutions converted
+    """
+    converted = 0
+    for component in pipeline.components.values():
+        if not isinstance(component, nn.Module):
+            continue
+        for child in component.modules():
+            if isinstance(child, nn.Conv3d):
+                child.weight.data = child.weight.data.contiguous(memory_format=torch.channels_last_3d)
+                converted += 1
+            elif isinstance(child, nn.Conv2d):
+                child.weight.data = child.weight.data.contiguous(memory_format=torch.channels_last)
+                converted += 1
+    return converted
+
+
+class CPUPartition:
+    """
+    Inference slots and a worker pool, each pinned to its own cores
+
+    Every slot is one thread with its own core set and intra-op thread
+    count, so K jobs denoise side by side instead of one job spreading
+    over every core with poor scaling. OpenMP teams are created by the
+    thread that first runs a parallel op and inherit its affinity, so a
+    slot's intra-op threads stay on the slot's cores.
+
+    Image preparation, motion-signal rendering, preview and video encoding
+    run on the worker pool, pinned to the remaining cores; ffmpeg processes
+    started from it inherit that affinity. OpenCV's own thread pool is
+    disabled so each OpenCV call stays on the thread that made it.
+    """
+
+    def __init__(self, plan: CorePlan, bf16_autocast: bool = False):
+        self.plan = plan
+        self.bf16_autocast = bf16_autocast
+        self._slot_ids = itertools.count()
+        self._local = threading.local()
+        self._busy = 0
+        self._lock = threading.Lock()
+        self.inference_pool = ThreadPoolExecutor(
+            max_workers=len(plan.slots), thread_name_prefix="ttm-slot", initializer=self._init_slot
+        )
+        self.worker_pool = ThreadPoolExecutor(
+            max_workers=len(plan.workers) + 4, thread_name_prefix="ttm-cpu", initializer=self.pin_worker
+        )
+        cv2.setNumThreads(1)
+
+    def _init_slot(self):
+        slot = next(self._slot_ids)
+        self._local.slot = slot
+        cores = self.plan.slots[slot]
+        os.sched_setaffinity(0, cores)
+        # Torch applies its process-wide thread count to a thread on first use;
+        # trigger that now so this slot's own count below sticks
+        torch.get_num_threads()
+        torch.set_num_threads(len(cores))
+
+    def pin_worker(self):
+        """Thread-pool initializer pinning the calling thread to the worker cores"""
+        if self.plan.workers:
+            os.sched_setaffinity(0, self.plan.workers)
+
+    def _run_slot(self, fn: Callable, args, kwargs):
+        with self._lock:
+            self._busy += 1
+        try:
+            with torch.autocast("cpu", dtype=torch.bfloat16, enabled=self.bf16_autocast):
+                return fn(self._local.slot, *args, **kwargs)
+        finally:
+            with self._lock:
+                self._busy -= 1
+
+    async def run_in_slot(self, fn: Callable, *args, **kwargs) -> Any:
+        """Run `fn(slot, *args, **kwargs)` in a free inference slot"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.inference_pool, functools.partial(self._run_slot, fn, args, kwargs))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "slots": self.plan.slots,
+            "worker_cores": self.plan.workers,
+            "busy_slots": self._busy,
+            "bf16_autocast": self.bf16_autocast,
+        }
+
+    def shutdown(self):
+        self.inference_pool.shutdown(wait=False)
+        self.worker_pool.shutdown(wait=False)
+
+
+if __name__ == "__main__":
+    # Throughput for each number of inference slots on this machine, with a
+    # small random Wan checkpoint; pick the K with the most videos per minute
+    import argparse
+    import tempfile
+    import time
+
+    from diffusers import WanImageToVideoPipeline
+    from PIL import Image
+
+    from ttm_core_service import MotionSpec, TTMEngine, apply_default_indices, build_tiny_snapshot
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--worker-cores", type=int, default=2)
+    parser.add_argument("--jobs", type=int, default=0, help="Videos per setting (default: 2 per slot of the largest K)")
+    parser.add_argument("--bf16-autocast", action="store_true")
+    parser.add_argument("--channels-last", action="store_true")
+    args = parser.parse_args()
+
+    cores = available_cores()
+    inference_cores = len(cores) - max(0, min(args.worker_cores, len(cores) - 1))
+    sweep = [k for k in (1, 2, 3, 4, 6, 8, 12, 16, 24, 32) if k <= inference_cores]
+    jobs = args.jobs or 2 * sweep[-1]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        snapshot = Path(tmp) / "snapshot"
+        build_tiny_snapshot(snapshot, attention_head_dim=64, num_heads=8, ffn_dim=2048, num_layers=4, text_dim=512)
+        engine = TTMEngine.from_snapshot(
+            "small-random-wan", local_path=str(snapshot), device="cpu", dtype=torch.float32,
+            pipeline_cls=WanImageToVideoPipeline, max_area=128 * 128, num_inference_steps=4
+        )
+        if args.channels_last:
+            to_channels_last(engine.pipeline)
+        image = engine.prepare_image(Image.new("RGB", (128, 128), "red"))
+        spec = MotionSpec(motion_type="object", trajectory=[[0.3, 0.5], [0.7, 0.5]], num_frames=17)
+        apply_default_indices(spec)
+
+        async def run(k: int) -> float:
+            partition = CPUPartition(plan_cores(k, args.worker_cores, cores), bf16_autocast=args.bf16_autocast)
+            slot_engines = {}
+
+            def generate(slot: int, seed: int):
+                engine_view = slot_engines.setdefault(slot, engine.for_slot())
+                return engine_view.generate(image, "a cat walks left", spec, seeds=[seed])
+
+            # Warm every slot up once, then time `jobs` videos
+            await asyncio.gather(*(partition.run_in_slot(generate, seed) for seed in range(k)))
+            start = time.perf_counter()
+            await asyncio.gather(*(partition.run_in_slot(generate, seed) for seed in range(jobs)))
+            elapsed = time.perf_counter() - start
+            partition.shutdown()
+            return elapsed
+
+        print(f"{len(cores)} cores, {args.worker_cores} reserved for workers, {jobs} videos per setting")
+        print(f"{'K':>3} {'threads/slot':>13} {'seconds':>8} {'videos/min':>11}")
+        best = None
+        for k in sweep:
+            elapsed = asyncio.run(run(k))
+            throughput = jobs * 60 / elapsed
+            best = max(best or (throughput, k), (throughput, k))
+            print(f"{k:>3} {len(plan_cores(k, args.worker_cores, cores).slots[0]):>13} {elapsed:>8.2f} {throughput:>11.1f}")
+        print(f"Best: TTM_CPU_SLOTS={best[1]} TTM_CPU_WORKER_CORES={args.worker_cores}")
@@ -0,0 +1,121 @@
+"""
+Idempotent job submission for the TTM API
+Retried submissions return the original job instead of starting another GPU run
+"""
+
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional, Tuple
+
+import numpy as np
+from pydantic import BaseModel
+
+from ttm_jobs import TERMINAL_STATUSES
+
+
+class IdempotencyKeyConflict(Exception):
+    """Raised when an Idempotency-Key is reused for a different request"""
+
+
+def request_fingerprint(image_digest: str, request: BaseModel) -> str:
+    """
+    Content hash of a submission: the input image plus every request parameter
+
+    Trajectories are hashed as raw float32 bytes rather than through their
+    JSON form, which keeps this cheap for dense paths.
+    """
+    digest = hashlib.sha256(image_digest.encode())
+    digest.update(type(request).__name__.encode())
+    digest.update(request.model_dump_json(exclude={"trajectory"}).encode())
+    trajectory = getattr(request, "trajectory", None)
+    if trajectory is not None:
+        digest.update(np.ascontiguousarray(trajectory, dtype="<f4").tobytes())
+    return digest.hexdigest()
+
+
+class SubmissionIndex:
+    """
+    Maps Idempotency-Key headers and request fingerprints to job IDs
+
+    A repeated Idempotency-Key returns its original job for `ttl_seconds`,
+    whatever state that job is in, unless it has been deleted. Independently,
+    a submission whose fingerprint matches a job that is still in flight
+    (single-flight) is attached to that job instead of being queued again.
+    Both maps are bounded by TTL and by `max_entries`, oldest first.
+
+    Submissions are resolved one at a time under an asyncio lock, which is
+    held while `create_job` awaits its disk writes; the event loop stays
+    free for everything else.
+    """
+
+    def __init__(self, ttl_seconds: int, max_entries: int = 10_000):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._keys: "OrderedDict[str, Tuple[str, str, float]]" = OrderedDict()  # key -> (fingerprint, job_id, expiry)
+        self._in_flight: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()  # fingerprint -> (job_id, expiry)
+        self._lock = asyncio.Lock()
+        self.replayed = 0
+        self.coalesced = 0
+
+    def _purge(self, now: float):
+        for entries in (self._keys, self._in_flight):
+            while entries and (next(iter(entries.values()))[-1] < now or len(entries) > self.max_entries):
+                entries.popitem(last=False)
+
+    async def submit(
+        self,
+        idempotency_key: Optional[str],
+        fingerprint: str,
+        job_status: Callable[[str], Optional[str]],
+        create_job: Callable[[], Awaitable[str]]
+    ) -> Tuple[str, bool]:
+        """
+        Resolve a submission to a job, creating one only when needed
+
+        Args:
+            idempotency_key: Client-supplied key, if any
+            fingerprint: `request_fingerprint` of the submission
+            job_status: Current status of a job ID, None once it has been deleted
+            create_job: Creates and queues a new job, returning its ID
+
+        Returns:
+            (job_id, reused) where reused is True for replays and coalesced submissions
+
+        Raises:
+            IdempotencyKeyConflict: If the key was used for a different request
+        """
+        async with self._lock:
+            now = time.time()
+            self._purge(now)
+
+            if idempotency_key is not None and idempotency_key in self._keys:
+                key_fingerprint, job_id, _ = self._keys[idempotency_key]
+                if key_fingerprint != fingerprint:
+                    raise IdempotencyKeyConflict("Idempotency-Key was already used for a different request")
+                if job_status(job_id) is not None:
+                    self.replayed += 1
+                    return job_id, True
+
+            entry = self._in_flight.get(fingerprint)
+            if entry is not None and job_status(entry[0]) not in TERMINAL_STATUSES + (None, "partial"):
+                job_id, reused = entry[0], True
+                self.coalesced += 1
+            else:
+                job_id, reused = await create_job(), False
+                self._in_flight[fingerprint] = (job_id, now + self.ttl_seconds)
+                self._in_flight.move_to_end(fingerprint)
+
+            if idempotency_key is not None:
+                self._keys[idempotency_key] = (fingerprint, job_id, now + self.ttl_seconds)
+                self._keys.move_to_end(idempotency_key)
+            return job_id, reused
+
+    def stats(self):
+        return {
+            "keys": len(self._keys),
+            "in_flight": len(self._in_flight),
+            "replayed": self.replayed,
+            "coalesced": self.coalesced,
+        }
@@ -0,0 +1,107 @@
+"""
+Upload-once image handles for the TTM API
+Images are decoded and resized once, stored as raw RGB arrays and referenced by id
+"""
+
+import hashlib
+import io
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+
+@dataclass
+class StoredImage:
+    """Metadata for an image held by the store"""
+    image_id: str
+    path: Path
+    width: int
+    height: int
+    expires_at: float
+
+
+class ImageStore:
+    """
+    Content-addressed store of decoded, resized source images with a sliding TTL
+
+    The image id is derived from the uploaded bytes, so re-uploading the same
+    file only refreshes the existing handle and skips decoding entirely.
+    Pixels are kept as uint8 `.npy` files at the generation resolution and
+    memory-mapped on load.
+    """
+
+    def __init__(self, directory: str, ttl_seconds: int):
+        self.directory = Path(directory)
+        self.ttl_seconds = ttl_seconds
+        self._images: Dict[str, StoredImage] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def content_id(data: bytes) -> str:
+        return hashlib.sha256(data).hexdigest()[:32]
+
+    def put(
+        self,
+        data: bytes,
+        target_size: Callable[[int, int], Tuple[int, int]]
+    ) -> Tuple[StoredImage, bool]:
+        """
+        Store an uploaded image, returning (handle, deduplicated)
+
+        Args:
+            data: Encoded image bytes as uploaded
+            target_size: Maps (width, height) to the generation (width, height)
+        """
+        self.purge_expired()
+        image_id = self.content_id(data)
+
+        with self._lock:
+            stored = self._images.get(image_id)
+            if stored is not None:
+                stored.expires_at = time.time() + self.ttl_seconds
+                return stored, True
+
+        image = Image.open(io.BytesIO(data)).convert("RGB")
+        width, height = target_size(image.width, image.height)
+        if image.size != (width, height):
+            image = image.resize((width, height))
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / f"{image_id}.npy"
+        np.save(path, np.asarray(image))
+
+        stored = StoredImage(
+            image_id=image_id,
+            path=path,
+            width=width,
+            height=height,
+            expires_at=time.time() + self.ttl_seconds
+        )
+        with self._lock:
+            self._images[image_id] = stored
+        return stored, False
+
+    def get(self, image_id: str) -> Optional[Image.Image]:
+        """Load a stored image and extend its TTL; None if unknown or expired"""
+        with self._lock:
+            stored = self._images.get(image_id)
+            if stored is None or stored.expires_at < time.time():
+                return None
+            stored.expires_at = time.time() + self.ttl_seconds
+        pixels = np.load(stored.path, mmap_mode="r")
+        return Image.fromarray(np.ascontiguousarray(pixels))
+
+    def purge_expired(self):
+        """Drop expired handles and their files"""
+        now = time.time()
+        with self._lock:
+            expired = [s for s in self._images.values() if s.expires_at < now]
+            for stored in expired:
+                del self._images[stored.image_id]
+        for stored in expired:
+            stored.path.unlink(missing_ok=True)
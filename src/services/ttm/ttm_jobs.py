@@ -0,0 +1,223 @@
+"""
+Job control for the TTM API
+Cooperative cancellation and per-job deadlines checked inside the denoising loop
+"""
+
+import bisect
+import threading
+import time
+from collections.abc import MutableMapping
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from ttm_api_fixes import JOB_TIMEOUT, check_job_timeout
+
+# Job states that will never change again
+TERMINAL_STATUSES = ("completed", "failed", "cancelled", "timed_out")
+
+
+class JobCancelled(Exception):
+    """Raised when a job was cancelled by the client"""
+
+
+class JobTimedOut(Exception):
+    """Raised when a job has exceeded its deadline"""
+
+
+class JobInterrupted(Exception):
+    """Raised when the server is shutting down; the job is resumed from the journal on restart"""
+
+
+class JobControl:
+    """
+    Cancellation flag and deadline for a single generation job
+
+    The flag is a threading.Event so it can be set from the event loop while
+    the pipeline runs in a worker thread. The deadline counts from submission,
+    so time spent waiting in the queue is included.
+    """
+
+    def __init__(self, job_id: str, timeout: Optional[float] = None):
+        self.job_id = job_id
+        self.timeout = timeout or JOB_TIMEOUT
+        self.submitted_at = time.time()
+        self._cancelled = threading.Event()
+        self._interrupted = threading.Event()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    @property
+    def expired(self) -> bool:
+        return check_job_timeout(self.submitted_at, self.timeout)
+
+    @property
+    def interrupted(self) -> bool:
+        return self._interrupted.is_set()
+
+    def cancel(self):
+        """Request cancellation; the running job aborts at its next check"""
+        self._cancelled.set()
+
+    def interrupt(self):
+        """Abort the running job at its next check without finishing it, for shutdown"""
+        self._interrupted.set()
+
+    def check(self):
+        """Raise if the job was cancelled, interrupted or has run past its deadline"""
+        if self.interrupted:
+            raise JobInterrupted(f"Job {self.job_id} was interrupted by shutdown")
+        if self.cancelled:
+            raise JobCancelled(f"Job {self.job_id} was cancelled")
+        if self.expired:
+            raise JobTimedOut(f"Job {self.job_id} exceeded its {self.timeout:.0f}s deadline")
+
+    def step_callback(self, pipeline, step: int, timestep, callback_kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        `callback_on_step_end` hook for diffusers pipelines
+
+        Raising here unwinds the denoising loop immediately, so the job stops
+        after the current step instead of running all remaining steps.
+        """
+        self.check()
+        return callback_kwargs
+
+
+class JobControlGroup:
+    """
+    Combined control for jobs that share one batched pipeline call
+
+    The batch is only aborted once every member has been cancelled, or as
+    soon as any member passes its deadline. Members cancelled individually
+    keep running inside the batch and have their output discarded.
+    """
+
+    def __init__(self, controls: List[JobControl]):
+        self.controls = controls
+
+    def check(self):
+        if len(self.controls) == 1:
+            return self.controls[0].check()
+        if any(control.interrupted for control in self.controls):
+            raise JobInterrupted(f"Jobs {[c.job_id for c in self.controls]} were interrupted by shutdown")
+        if all(control.cancelled for control in self.controls):
+            raise JobCancelled(f"Jobs {[c.job_id for c in self.controls]} were cancelled")
+        for control in self.controls:
+            if control.expired:
+                raise JobTimedOut(f"Job {control.job_id} exceeded its {control.timeout:.0f}s deadline")
+
+    def step_callback(self, pipeline, step: int, timestep, callback_kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        """`callback_on_step_end` hook for diffusers pipelines"""
+        self.check()
+        return callback_kwargs
+
+
+class JobIndex(MutableMapping):
+    """
+    Jobs by ID, with secondary indexes by project and by status
+
+    Behaves like the plain dict it replaces. Each job is also filed under
+    (project, status), (project, any), (any, status) and (any, any) as a
+    sorted list of insertion sequence numbers, so listing one project's or
+    one status's jobs never scans the rest. Jobs report status changes
+    through their `_status_listener`, which the index sets on insertion, so
+    the indexes follow every state transition.
+
+    Listings are newest first; the cursor is the sequence number of the
+    last job returned. `on_status_change(job, previous)`, if set, is called
+    after every transition.
+    """
+
+    ANY = "*"
+
+    def __init__(self, on_status_change: Optional[Callable[[Any, str], None]] = None):
+        self.on_status_change = on_status_change
+        self._jobs: Dict[str, Any] = {}
+        self._seqs: Dict[str, int] = {}
+        self._job_ids: Dict[int, str] = {}
+        self._filed: Dict[str, Tuple[Optional[str], str]] = {}  # job_id -> (project, status) it is filed under
+        self._buckets: Dict[Tuple[Optional[str], str], List[int]] = {}
+        self._next_seq = 0
+        self._lock = threading.RLock()
+
+    def _bucket_keys(self, project: Optional[str], status: str):
+        return [(project, status), (project, self.ANY), (self.ANY, status), (self.ANY, self.ANY)]
+
+    def _file(self, job_id: str, project: Optional[str], status: str):
+        seq = self._seqs[job_id]
+        for key in self._bucket_keys(project, status):
+            bisect.insort(self._buckets.setdefault(key, []), seq)
+        self._filed[job_id] = (project, status)
+
+    def _unfile(self, job_id: str):
+        seq = self._seqs[job_id]
+        for key in self._bucket_keys(*self._filed.pop(job_id)):
+            bucket = self._buckets[key]
+            del bucket[bisect.bisect_left(bucket, seq)]
+            if not bucket:
+                del self._buckets[key]
+
+    def _on_status_change(self, job, previous: str):
+        with self._lock:
+            if self._jobs.get(job.job_id) is not job:
+                return  # A copy, or a job that was deleted meanwhile
+            self._unfile(job.job_id)
+            self._file(job.job_id, job.project_id, job.status)
+        if self.on_status_change is not None:
+            self.on_status_change(job, previous)
+
+    def __setitem__(self, job_id: str, job):
+        with self._lock:
+            if job_id in self._jobs:
+                del self[job_id]
+            self._jobs[job_id] = job
+            self._seqs[job_id] = self._next_seq
+            self._job_ids[self._next_seq] = job_id
+            self._next_seq += 1
+            self._file(job_id, job.project_id, job.status)
+            job._status_listener = self._on_status_change
+
+    def __delitem__(self, job_id: str):
+        with self._lock:
+            job = self._jobs.pop(job_id)
+            job._status_listener = None
+            self._unfile(job_id)
+            del self._job_ids[self._seqs.pop(job_id)]
+
+    def __getitem__(self, job_id: str):
+        return self._jobs[job_id]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._jobs)
+
+    def __len__(self) -> int:
+        return len(self._jobs)
+
+    def query(
+        self,
+        project_id: Optional[str] = None,
+        status: Optional[str] = None,
+        cursor: Optional[int] = None,
+        limit: int = 50
+    ) -> Tuple[List[Any], Optional[int], int]:
+        """
+        One page of jobs matching the filters, newest first
+
+        Returns:
+            (jobs, next_cursor or None on the last page, total matching jobs)
+        """
+        with self._lock:
+            bucket = self._buckets.get((project_id or self.ANY, status or self.ANY), [])
+            end = bisect.bisect_left(bucket, cursor) if cursor is not None else len(bucket)
+            start = max(0, end - limit)
+            jobs = [self._jobs[self._job_ids[seq]] for seq in reversed(bucket[start:end])]
+            return jobs, bucket[start] if start > 0 else None, len(bucket)
+
+    def counts(self, project_id: Optional[str] = None) -> Dict[str, int]:
+        """Number of jobs per status, for one project or all"""
+        project = project_id or self.ANY
+        with self._lock:
+            return {
+                status: len(bucket) for (bucket_project, status), bucket in self._buckets.items()
+                if bucket_project == project and status != self.ANY
+            }
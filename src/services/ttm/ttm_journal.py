@@ -0,0 +1,267 @@
+"""
+Crash-safe job journal for the TTM API
+Submissions, state transitions and input images are appended to disk and replayed on startup
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from PIL import Image
+
+from ttm_jobs import TERMINAL_STATUSES
+
+logger = logging.getLogger(__name__)
+
+# Jobs in these states never run again; their input images are no longer needed
+FINISHED_STATUSES = TERMINAL_STATUSES + ("partial",)
+
+
+@dataclass
+class JournaledJob:
+    """State of one job rebuilt from the journal"""
+    job_id: str
+    status: str = "pending"
+    project_id: Optional[str] = None
+    parent_id: Optional[str] = None
+    children: Optional[List[str]] = None
+    submission: Optional[Dict[str, Any]] = None  # Top-level jobs only: what is needed to run it again
+    result: Optional[Dict[str, Any]] = None
+    storage_keys: Optional[List[str]] = None
+    updated_at: float = field(default_factory=time.time)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATUSES
+
+
+class JobJournal:
+    """
+    Append-only JSON-lines log of job submissions and state transitions
+
+    Every record is flushed and fsynced before the call returns, so a job
+    the API has acknowledged survives a crash. Input images are saved next
+    to the log when a job is submitted and removed once it has finished.
+    On startup `replay` rebuilds the jobs, tolerating a last line cut short
+    by a crash, and `compact` rewrites the log with only the jobs still
+    worth keeping.
+
+    Callers on an event loop hand writes to `defer`, which makes them on
+    the journal's own thread in call order, so the loop never waits for
+    an fsync.
+    """
+
+    def __init__(self, directory: str, retention_seconds: float = 24 * 3600):
+        self.directory = Path(directory)
+        self.retention_seconds = retention_seconds
+        self._file = None
+        self._lock = threading.Lock()
+        self._writer: Optional[ThreadPoolExecutor] = None
+
+    @property
+    def path(self) -> Path:
+        return self.directory / "journal.jsonl"
+
+    @property
+    def inputs_dir(self) -> Path:
+        return self.directory / "inputs"
+
+    def _append(self, record: Dict[str, Any]):
+        line = json.dumps({**record, "ts": time.time()}, separators=(",", ":")) + "\n"
+        with self._lock:
+            if self._file is None:
+                self.directory.mkdir(parents=True, exist_ok=True)
+                self._file = open(self.path, "a", encoding="utf-8")
+            self._file.write(line)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def defer(self, fn: Callable[..., Any], *args, **kwargs) -> Future:
+        """Run `fn(*args, **kwargs)` on the journal thread, after every write deferred before it"""
+        with self._lock:
+            if self._writer is None:
+                # One thread, so records reach the log in the order they were deferred
+                self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="journal")
+            return self._writer.submit(fn, *args, **kwargs)
+
+    def barrier(self) -> Future:
+        """Resolves once every write deferred so far has been made"""
+        return self.defer(lambda: None)
+
+    def save_input(self, job_id: str, image: Image.Image) -> str:
+        """Persist a job's input image; returns its path relative to the journal"""
+        self.inputs_dir.mkdir(parents=True, exist_ok=True)
+        path = self.inputs_dir / f"{job_id}.png"
+        image.save(path, format="PNG", compress_level=1)
+        return str(path.relative_to(self.directory))
+
+    def load_input(self, relative_path: str) -> Image.Image:
+        with Image.open(self.directory / relative_path) as image:
+            return image.convert("RGB")
+
+    def release_input(self, job_id: str):
+        (self.inputs_dir / f"{job_id}.png").unlink(missing_ok=True)
+
+    def submitted(
+        self,
+        job_id: str,
+        kind: str,
+        request_json: str,
+        input_path: str,
+        project: str,
+        cost: float,
+        project_id: Optional[str] = None,
+        children: Optional[List[str]] = None
+    ):
+        """Record a new top-level job (and its children, for a variant sweep)"""
+        self._append({
+            "op": "submit",
+            "job_id": job_id,
+            "kind": kind,
+            "request": request_json,
+            "input": input_path,
+            "project": project,
+            "cost": cost,
+            "project_id": project_id,
+            "children": children,
+        })
+
+    def status(
+        self,
+        job_id: str,
+        status: str,
+        result: Optional[Dict[str, Any]] = None,
+        storage_keys: Optional[List[str]] = None
+    ):
+        """Record a state transition, with the job's result once it is final"""
+        record: Dict[str, Any] = {"op": "status", "job_id": job_id, "status": status}
+        if result is not None:
+            record["result"] = result
+        if storage_keys:
+            record["storage_keys"] = storage_keys
+        self._append(record)
+
+    def deleted(self, job_id: str):
+        self._append({"op": "delete", "job_id": job_id})
+
+    def replay(self) -> Dict[str, JournaledJob]:
+        """
+        Rebuild every journaled job, in submission order
+
+        Unreadable lines are skipped; only the last one can be partial,
+        since records are appended whole and fsynced one at a time.
+        """
+        jobs: Dict[str, JournaledJob] = {}
+        if not self.path.exists():
+            return jobs
+        with open(self.path, encoding="utf-8") as f:
+            for number, line in enumerate(f, 1):
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning(f"Skipping unreadable journal line {number}")
+                    continue
+                self._apply(jobs, record)
+        return jobs
+
+    @staticmethod
+    def _apply(jobs: Dict[str, JournaledJob], record: Dict[str, Any]):
+        job_id, op = record["job_id"], record["op"]
+        if op == "submit":
+            submission = {k: record[k] for k in ("kind", "request", "input", "project", "cost")}
+            children = record.get("children")
+            jobs[job_id] = JournaledJob(
+                job_id, project_id=record.get("project_id"), children=children,
+                submission=submission, updated_at=record["ts"]
+            )
+            for child_id in children or []:
+                jobs[child_id] = JournaledJob(
+                    child_id, project_id=record.get("project_id"), parent_id=job_id, updated_at=record["ts"]
+                )
+        elif op == "status" and job_id in jobs:
+            job = jobs[job_id]
+            job.status = record["status"]
+            job.result = record.get("result", job.result)
+            job.storage_keys = record.get("storage_keys", job.storage_keys)
+            job.updated_at = record["ts"]
+        elif op == "delete":
+            job = jobs.pop(job_id, None)
+            for child_id in (job.children or []) if job else []:
+                jobs.pop(child_id, None)
+
+    def compact(self, jobs: Dict[str, JournaledJob]) -> Dict[str, JournaledJob]:
+        """
+        Rewrite the journal as the current state of the jobs worth keeping
+
+        Finished jobs are kept for `retention_seconds` so clients can still
+        fetch their results after a restart; older ones, and input images
+        nobody needs any more, are dropped. The new log replaces the old one
+        atomically.
+
+        Returns:
+            The jobs kept
+        """
+        now = time.time()
+
+        def expired(job: JournaledJob) -> bool:
+            family = [job] + [jobs[c] for c in job.children or [] if c in jobs]
+            return all(j.finished for j in family) and now - max(j.updated_at for j in family) > self.retention_seconds
+
+        top_level = [job for job in jobs.values() if job.parent_id is None]
+        kept: Dict[str, JournaledJob] = {}
+        records = []
+        for job in top_level:
+            if expired(job):
+                continue
+            family = [job] + [jobs[c] for c in job.children or [] if c in jobs]
+            submission = job.submission or {}
+            records.append({
+                "op": "submit", "job_id": job.job_id, "project_id": job.project_id, "children": job.children,
+                **submission, "ts": job.updated_at
+            })
+            for member in family:
+                kept[member.job_id] = member
+                record = {"op": "status", "job_id": member.job_id, "status": member.status, "ts": member.updated_at}
+                if member.result is not None:
+                    record["result"] = member.result
+                if member.storage_keys:
+                    record["storage_keys"] = member.storage_keys
+                records.append(record)
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        partial = self.path.with_suffix(".partial")
+        with open(partial, "w", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record, separators=(",", ":")) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            partial.replace(self.path)
+
+        # Input images of jobs that are gone from the journal
+        wanted = {job.submission["input"] for job in kept.values() if job.submission and not job.finished}
+        if self.inputs_dir.exists():
+            for path in self.inputs_dir.iterdir():
+                if str(path.relative_to(self.directory)) not in wanted:
+                    path.unlink(missing_ok=True)
+        return kept
+
+    def close(self):
+        """Finish deferred writes and close the log"""
+        with self._lock:
+            writer, self._writer = self._writer, None
+        if writer is not None:
+            writer.shutdown(wait=True)
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
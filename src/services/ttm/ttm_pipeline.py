@@ -0,0 +1,207 @@
+"""
+Staged job execution for the TTM API
+Preprocessing, inference and post-processing run as separate worker pools joined by bounded queues
+"""
+
+import asyncio
+import inspect
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Stage:
+    """
+    One step of the pipeline
+
+    `fn(item)` is either an async generator yielding zero or more items for
+    the next stage, or, for the last stage, a coroutine. Stage functions
+    handle their own job failures; an exception escaping one is logged and
+    the item is dropped.
+    """
+    name: str
+    fn: Callable[[Any], Any]
+    workers: int = 1
+
+
+@dataclass
+class StageStats:
+    items: int = 0
+    busy: float = 0.0  # Running the stage function
+    blocked: float = 0.0  # Waiting for room in the next stage's queue
+    active: int = 0
+
+
+class StagedExecutor:
+    """
+    Runs items from `source` through a chain of stages
+
+    Every stage has its own workers, and consecutive stages are joined by
+    queues of `queue_size` items, so while one job is in inference the next
+    is being preprocessed and the previous one encoded and uploaded. The
+    bounded queues apply backpressure: preprocessing never runs more than
+    a few jobs ahead of inference, and jobs stay in `source`, which decides
+    their order, until the first stage has room.
+    """
+
+    def __init__(self, source, stages: List[Stage], queue_size: int = 2):
+        self.source = source
+        self.stages = stages
+        self.queue_size = queue_size
+        self.queues: List[asyncio.Queue] = []
+        self.stats_by_stage: Dict[str, StageStats] = {stage.name: StageStats() for stage in stages}
+        self.tasks: List[asyncio.Task] = []
+        self.started_at: Optional[float] = None
+        self.draining = False
+        self._waiting: Set[asyncio.Task] = set()  # First-stage workers waiting on the source
+
+    def start(self):
+        """Start every stage's workers on the running event loop"""
+        self.queues = [asyncio.Queue(self.queue_size) for _ in self.stages[1:]]
+        self.started_at = time.perf_counter()
+        for index, stage in enumerate(self.stages):
+            for _ in range(stage.workers):
+                self.tasks.append(asyncio.create_task(self._worker(index)))
+
+    async def drain(self, timeout: float) -> bool:
+        """
+        Stop taking items from the source and wait for items in flight
+
+        Items still in `source` stay there. Returns False if items were
+        still in flight after `timeout` seconds.
+        """
+        self.draining = True
+        for task in list(self._waiting):
+            task.cancel()
+        deadline = time.perf_counter() + timeout
+        while any(stats.active for stats in self.stats_by_stage.values()) or any(q.qsize() for q in self.queues):
+            if time.perf_counter() > deadline:
+                return False
+            await asyncio.sleep(0.1)
+        return True
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+    async def _worker(self, index: int):
+        stage = self.stages[index]
+        stats = self.stats_by_stage[stage.name]
+        inbox = self.source if index == 0 else self.queues[index - 1]
+        outbox = self.queues[index] if index < len(self.queues) else None
+
+        while True:
+            if index == 0:
+                if self.draining:
+                    return
+                task = asyncio.current_task()
+                self._waiting.add(task)
+                try:
+                    item = await inbox.get()
+                finally:
+                    self._waiting.discard(task)
+            else:
+                item = await inbox.get()
+            stats.active += 1
+            start = time.perf_counter()
+            try:
+                outputs = stage.fn(item)
+                if not inspect.isasyncgen(outputs):
+                    await outputs
+                    continue
+                while True:
+                    try:
+                        output = await outputs.__anext__()
+                    except StopAsyncIteration:
+                        break
+                    stats.busy += time.perf_counter() - start
+                    start = time.perf_counter()
+                    if outbox is not None:
+                        await outbox.put(output)
+                    stats.blocked += time.perf_counter() - start
+                    start = time.perf_counter()
+            except Exception as e:
+                logger.error(f"Stage {stage.name} failed on an item: {e}")
+            finally:
+                stats.busy += time.perf_counter() - start
+                stats.items += 1
+                stats.active -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Per-stage throughput and utilization since start
+
+        Utilization is the fraction of worker time spent running the stage
+        function; for the single inference worker it is the share of wall
+        time the GPU had work.
+        """
+        elapsed = time.perf_counter() - self.started_at if self.started_at else 0.0
+        report = {}
+        for index, stage in enumerate(self.stages):
+            stats = self.stats_by_stage[stage.name]
+            capacity = elapsed * stage.workers
+            report[stage.name] = {
+                "workers": stage.workers,
+                "active": stats.active,
+                "items": stats.items,
+                "queued": self.queues[index - 1].qsize() if index else None,
+                "busy_seconds": stats.busy,
+                "blocked_seconds": stats.blocked,
+                "utilization": stats.busy / capacity if capacity else 0.0,
+            }
+        return {"uptime_seconds": elapsed, "stages": report}
+
+
+if __name__ == "__main__":
+    # Serial vs staged execution of jobs with a CPU-bound preprocessing
+    # phase, a GPU phase and an encode/upload phase, simulated with sleeps
+    PREPROCESS, INFERENCE, POSTPROCESS = 0.06, 0.2, 0.12
+    JOBS = 20
+
+    async def preprocess(job):
+        await asyncio.sleep(PREPROCESS)
+        yield job
+
+    async def infer(job):
+        await asyncio.sleep(INFERENCE)
+        yield job
+
+    async def run_staged():
+        source: asyncio.Queue = asyncio.Queue()
+        done = asyncio.Event()
+        finished = []
+
+        async def postprocess(job):
+            await asyncio.sleep(POSTPROCESS)
+            finished.append(job)
+            if len(finished) == JOBS:
+                done.set()
+
+        executor = StagedExecutor(source, [
+            Stage("preprocess", preprocess, workers=2),
+            Stage("inference", infer),
+            Stage("postprocess", postprocess, workers=2),
+        ])
+        executor.start()
+        start = time.perf_counter()
+        for job in range(JOBS):
+            source.put_nowait(job)
+        await done.wait()
+        elapsed = time.perf_counter() - start
+        stats = executor.stats()
+        await executor.stop()
+        return elapsed, stats
+
+    serial = JOBS * (PREPROCESS + INFERENCE + POSTPROCESS)
+    elapsed, stats = asyncio.run(run_staged())
+    print(f"{JOBS} jobs, per job: preprocess {PREPROCESS}s, inference {INFERENCE}s, postprocess {POSTPROCESS}s")
+    print(f"serial: {serial:.2f}s, inference utilization {JOBS * INFERENCE / serial:.0%}")
+    print(f"staged: {elapsed:.2f}s, inference utilization {stats['stages']['inference']['utilization']:.0%}")
+    for name, stage in stats["stages"].items():
+        print(f"  {name:>12}: {stage['items']} items, busy {stage['busy_seconds']:.2f}s, blocked {stage['blocked_seconds']:.2f}s")
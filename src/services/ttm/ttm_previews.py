@@ -0,0 +1,178 @@
+"""
+Lightweight gallery previews for generated videos
+Animated WebP, a sprite sheet for hover scrubbing and keyframe JPEGs, built without re-reading the MP4
+"""
+
+import math
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import cv2
+import numpy as np
+from PIL import Image
+
+PREVIEW_WIDTH = 256  # Animated WebP
+PREVIEW_FPS = 8
+MAX_PREVIEW_FRAMES = 120  # Longer clips are sped up in the preview rather than kept frame for frame
+SPRITE_COLUMNS = 4
+SPRITE_ROWS = 4
+SPRITE_TILE_WIDTH = 160
+KEYFRAME_COUNT = 4
+
+
+def sample_indices(num_frames: int, count: int) -> List[int]:
+    """`count` frame indices spread evenly over the clip, first and last included"""
+    if count <= 1 or num_frames <= 1:
+        return [0]
+    return sorted({round(i * (num_frames - 1) / (count - 1)) for i in range(count)})
+
+
+def downsample(frames: np.ndarray, max_width: int) -> np.ndarray:
+    """
+    Shrink (T, H, W, 3) uint8 frames by an integer factor with a box filter
+
+    The stack is resized as one tall image in a single call instead of frame
+    by frame; cropping the height to a multiple of the factor keeps every
+    averaged block inside one frame. The result is at most `max_width` wide.
+    """
+    factor = max(1, math.ceil(frames.shape[2] / max_width))
+    if factor == 1:
+        return frames
+    t, h, w, c = frames.shape
+    h, w = h - h % factor, w - w % factor
+    stacked = np.ascontiguousarray(frames[:, :h, :w]).reshape(t * h, w, c)
+    small = cv2.resize(stacked, (w // factor, t * h // factor), interpolation=cv2.INTER_AREA)
+    return small.reshape(t, h // factor, w // factor, c)
+
+
+class PreviewCollector:
+    """
+    Keeps just the frames previews need while a video streams past
+
+    Frames can be added in chunks as they are decoded: the collector keeps
+    downsampled frames for the animated preview and sprite sheet and the
+    few full-resolution keyframes, so the whole clip never has to be held.
+    At most MAX_PREVIEW_FRAMES are kept whatever the clip length.
+    """
+
+    def __init__(self, num_frames: int, fps: int):
+        self.num_frames = num_frames
+        self.preview_step = max(1, round(fps / PREVIEW_FPS), math.ceil(num_frames / MAX_PREVIEW_FRAMES))
+        self.sprite_indices = sample_indices(num_frames, SPRITE_COLUMNS * SPRITE_ROWS)
+        self.keyframe_indices = sample_indices(num_frames, KEYFRAME_COUNT)
+        self.preview_frames: List[np.ndarray] = []
+        self.sprite_tiles: List[np.ndarray] = []
+        self.keyframes: List[np.ndarray] = []
+        self.seen = 0
+
+    def add(self, frames: np.ndarray):
+        indices = np.arange(self.seen, self.seen + len(frames))
+        self.seen += len(frames)
+
+        preview = frames[indices % self.preview_step == 0]
+        if len(preview):
+            self.preview_frames.extend(downsample(preview, PREVIEW_WIDTH))
+        sprites = frames[np.isin(indices, self.sprite_indices)]
+        if len(sprites):
+            self.sprite_tiles.extend(downsample(sprites, SPRITE_TILE_WIDTH))
+        self.keyframes.extend(frames[np.isin(indices, self.keyframe_indices)].copy())
+
+
+def write_animated_webp(frames: List[np.ndarray], path: Path, fps: int = PREVIEW_FPS) -> Path:
+    images = [Image.fromarray(frame) for frame in frames]
+    images[0].save(path, format="WEBP", save_all=True, append_images=images[1:], duration=round(1000 / fps), loop=0, quality=70, method=4)
+    return path
+
+
+def write_sprite_sheet(tiles: List[np.ndarray], path: Path) -> Path:
+    """Tiles left to right, top to bottom, on a SPRITE_COLUMNS x SPRITE_ROWS grid"""
+    tile_h, tile_w = tiles[0].shape[:2]
+    sheet = np.zeros((SPRITE_ROWS * tile_h, SPRITE_COLUMNS * tile_w, 3), np.uint8)
+    for i, tile in enumerate(tiles[:SPRITE_COLUMNS * SPRITE_ROWS]):
+        row, column = divmod(i, SPRITE_COLUMNS)
+        sheet[row * tile_h:(row + 1) * tile_h, column * tile_w:(column + 1) * tile_w] = tile
+    Image.fromarray(sheet).save(path, format="JPEG", quality=80)
+    return path
+
+
+def write_keyframe(frame: np.ndarray, path: Path) -> Path:
+    Image.fromarray(frame).save(path, format="JPEG", quality=85)
+    return path
+
+
+def build_previews(
+    collector: PreviewCollector,
+    output_dir: Path,
+    name: str,
+    pool: Optional[ThreadPoolExecutor] = None
+) -> Dict[str, Any]:
+    """
+    Encode every preview for a video, in parallel on `pool`
+
+    Pillow releases the GIL while encoding, so the WebP, the sprite sheet
+    and the keyframes encode concurrently.
+
+    Returns:
+        Paths of "preview", "sprite" and "keyframes", plus the sprite "layout"
+    """
+    output_dir.mkdir(parents=True, exist_ok=True)
+    own_pool = pool is None
+    pool = pool or ThreadPoolExecutor(max_workers=2 + len(collector.keyframes))
+    try:
+        preview = pool.submit(write_animated_webp, collector.preview_frames, output_dir / f"{name}_preview.webp")
+        sprite = pool.submit(write_sprite_sheet, collector.sprite_tiles, output_dir / f"{name}_sprite.jpg")
+        keyframes = [
+            pool.submit(write_keyframe, frame, output_dir / f"{name}_key{index}.jpg")
+            for index, frame in zip(collector.keyframe_indices, collector.keyframes)
+        ]
+        tile_h, tile_w = collector.sprite_tiles[0].shape[:2]
+        return {
+            "preview": preview.result(),
+            "sprite": sprite.result(),
+            "keyframes": [future.result() for future in keyframes],
+            "layout": {
+                "columns": SPRITE_COLUMNS,
+                "rows": SPRITE_ROWS,
+                "tile_width": tile_w,
+                "tile_height": tile_h,
+                "frame_indices": collector.sprite_indices,
+                "keyframe_indices": collector.keyframe_indices,
+            },
+        }
+    finally:
+        if own_pool:
+            pool.shutdown()
+
+
+if __name__ == "__main__":
+    # Preview cost for a default-length clip: vectorized vs per-frame
+    # downsampling, and serial vs threaded encoding
+    import tempfile
+    import time
+
+    rng = np.random.default_rng(0)
+    base = rng.integers(0, 256, (60, 104, 3), dtype=np.uint8)
+    frames = np.stack([np.kron(np.roll(base, t, axis=1), np.ones((8, 8, 1), np.uint8)) for t in range(81)])
+    print(f"{frames.shape[0]} frames of {frames.shape[2]}x{frames.shape[1]}")
+
+    start = time.perf_counter()
+    small = downsample(frames, PREVIEW_WIDTH)
+    vectorized = time.perf_counter() - start
+    start = time.perf_counter()
+    [np.asarray(Image.fromarray(f).resize((small.shape[2], small.shape[1]), Image.BOX)) for f in frames]
+    per_frame = time.perf_counter() - start
+    print(f"downsample: whole stack {vectorized * 1000:.1f} ms, per-frame PIL {per_frame * 1000:.1f} ms")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        collector = PreviewCollector(len(frames), fps=16)
+        for chunk in np.array_split(frames, 6):
+            collector.add(chunk)
+        for workers in (1, 6):
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                start = time.perf_counter()
+                previews = build_previews(collector, Path(tmp), f"w{workers}", pool)
+                print(f"encode with {workers} thread(s): {(time.perf_counter() - start) * 1000:.1f} ms")
+        for path in [previews["preview"], previews["sprite"], *previews["keyframes"]]:
+            print(f"  {path.name}: {path.stat().st_size / 1024:.0f} KB")
+        print(f"  layout: {previews['layout']}")
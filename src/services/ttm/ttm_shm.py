@@ -0,0 +1,276 @@
+"""
+Shared-memory frame transport between the API process and inference worker processes
+Frames live in shared ring buffers; only small descriptors cross the control channel
+"""
+
+import itertools
+import os
+import sys
+import weakref
+from collections import OrderedDict
+from dataclasses import dataclass
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from typing import Optional, Tuple
+
+import numpy as np
+
+ALIGNMENT = 64  # Cache-line aligned allocations
+
+
+class RingFull(Exception):
+    """Raised when a ring buffer has no contiguous free space for an allocation"""
+
+
+@dataclass(frozen=True)
+class FrameDescriptor:
+    """Location of an array in a ring buffer; this is all that gets pickled"""
+    segment: str
+    offset: int
+    shape: Tuple[int, ...]
+    dtype: str
+    alloc_id: int
+
+    @property
+    def nbytes(self) -> int:
+        return int(np.prod(self.shape)) * np.dtype(self.dtype).itemsize
+
+
+def _attach_untracked(name: str) -> SharedMemory:
+    """
+    Attach to an existing segment without registering it for cleanup
+
+    Before Python 3.13 every process that opens a segment registers it with
+    the resource tracker, which unlinks it when that process exits, so a
+    worker exiting would destroy a segment the API process still owns.
+    """
+    if sys.version_info >= (3, 13):
+        return SharedMemory(name=name, track=False)
+    register = resource_tracker.register
+    resource_tracker.register = lambda *args, **kwargs: None
+    try:
+        return SharedMemory(name=name)
+    finally:
+        resource_tracker.register = register
+
+
+def _release_segment(shm: SharedMemory, unlink: bool):
+    try:
+        shm.close()
+    except BufferError:
+        pass  # NumPy views still exist; the mapping goes away with them
+    if unlink:
+        try:
+            shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+class SharedFrameRing:
+    """
+    Single-producer ring buffer of NumPy arrays in one shared memory segment
+
+    The producer allocates space for an array, writes it (or has it written
+    in place), and sends the `FrameDescriptor` to the consumer, which maps
+    it with `read` as a zero-copy view. When the consumer is done it sends
+    the descriptor back and the producer calls `free`. Allocation metadata
+    lives only in the producer, so the segment itself holds nothing but
+    frame data.
+
+    Space is reclaimed in allocation order: a freed allocation behind an
+    older live one is reused only once the older one is freed as well.
+
+    The process that creates a ring owns the segment and unlinks it on
+    `close`, at garbage collection or at exit, and the resource tracker
+    unlinks it if that process crashes. Attached processes never unlink.
+    If a worker crashes while holding descriptors, the owner calls `reset`
+    to reclaim everything in its rings and hands them to a new worker.
+    """
+
+    def __init__(self, shm: SharedMemory, owner: bool):
+        self.shm = shm
+        self.owner = owner
+        self.capacity = shm.size
+        self._ids = itertools.count()
+        self._live: "OrderedDict[int, Tuple[int, int]]" = OrderedDict()  # alloc_id -> (offset, nbytes)
+        self._head = 0
+        self._finalizer = weakref.finalize(self, _release_segment, shm, owner)
+
+    @classmethod
+    def create(cls, capacity_bytes: int, name: Optional[str] = None) -> "SharedFrameRing":
+        return cls(SharedMemory(name=name, create=True, size=capacity_bytes), owner=True)
+
+    @classmethod
+    def attach(cls, name: str) -> "SharedFrameRing":
+        return cls(_attach_untracked(name), owner=False)
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    @property
+    def used_bytes(self) -> int:
+        return sum(nbytes for _, nbytes in self._live.values())
+
+    def _reserve(self, nbytes: int) -> int:
+        size = -(-nbytes // ALIGNMENT) * ALIGNMENT
+        if size > self.capacity:
+            raise ValueError(f"{nbytes} bytes do not fit in a {self.capacity} byte ring")
+        if not self._live:
+            offset = 0
+        else:
+            tail = next(iter(self._live.values()))[0]
+            if tail < self._head:
+                # Live data is [tail, head): use the end, else wrap to the start
+                if self._head + size <= self.capacity:
+                    offset = self._head
+                elif size <= tail:
+                    offset = 0
+                else:
+                    raise RingFull(f"No room for {nbytes} bytes in ring {self.name}")
+            elif self._head + size <= tail:
+                # Wrapped: free space is [head, tail)
+                offset = self._head
+            else:
+                raise RingFull(f"No room for {nbytes} bytes in ring {self.name}")
+        self._head = offset + size
+        return offset
+
+    def allocate(self, shape: Tuple[int, ...], dtype="uint8") -> Tuple[FrameDescriptor, np.ndarray]:
+        """
+        Reserve space for an array
+
+        Returns:
+            (descriptor, writable view) so producers can fill the array in place
+
+        Raises:
+            RingFull: Until older allocations are freed
+        """
+        dtype = np.dtype(dtype)
+        shape = tuple(int(n) for n in shape)
+        nbytes = int(np.prod(shape)) * dtype.itemsize
+        offset = self._reserve(nbytes)
+        descriptor = FrameDescriptor(self.name, offset, shape, dtype.str, next(self._ids))
+        self._live[descriptor.alloc_id] = (offset, nbytes)
+        return descriptor, self.read(descriptor)
+
+    def write(self, array: np.ndarray) -> FrameDescriptor:
+        """Copy an array into the ring; the only copy on the way to the consumer"""
+        descriptor, view = self.allocate(array.shape, array.dtype)
+        view[...] = array
+        return descriptor
+
+    def read(self, descriptor: FrameDescriptor) -> np.ndarray:
+        """Zero-copy view of an array in this ring"""
+        if descriptor.segment != self.name:
+            raise ValueError(f"Descriptor is for segment {descriptor.segment}, not {self.name}")
+        return np.ndarray(descriptor.shape, dtype=descriptor.dtype, buffer=self.shm.buf, offset=descriptor.offset)
+
+    def free(self, descriptor: FrameDescriptor):
+        """Release an allocation once the consumer is done with it (producer side)"""
+        self._live.pop(descriptor.alloc_id, None)
+        if not self._live:
+            self._head = 0
+
+    def reset(self):
+        """Drop every allocation, e.g. after the worker holding them crashed"""
+        self._live.clear()
+        self._head = 0
+
+    def close(self):
+        """Detach, and unlink the segment if this process created it"""
+        self._finalizer()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _benchmark_worker(conn, mode: str, ring_names: Optional[Tuple[str, str]]):
+    """Echo worker: receives a motion signal, returns output frames of the same shape"""
+    if mode == "shm":
+        inbox = SharedFrameRing.attach(ring_names[0])
+        outbox = SharedFrameRing.attach(ring_names[1])
+    while True:
+        message = conn.recv()
+        if message is None:
+            break
+        if mode == "pickle":
+            frames = message
+            conn.send(255 - frames)
+            continue
+        kind, descriptor = message
+        if kind == "free":
+            outbox.free(descriptor)
+            continue
+        signal = inbox.read(descriptor)
+        out_descriptor, out = outbox.allocate(signal.shape, signal.dtype)
+        np.subtract(255, signal, out=out)  # Stand-in for inference writing frames in place
+        del signal, out
+        conn.send(("frames", descriptor, out_descriptor))
+    if mode == "shm":
+        inbox.close()
+        outbox.close()
+
+
+if __name__ == "__main__":
+    import multiprocessing as mp
+    import time
+
+    T, H, W = 81, 480, 832
+    ITERATIONS = 5
+    frames = np.random.default_rng(0).integers(0, 256, (T, H, W, 3), dtype=np.uint8)
+    print(f"Round trip of {T}x{H}x{W}x3 uint8 frames ({frames.nbytes / 1024**2:.0f} MB) each way")
+
+    ctx = mp.get_context("spawn")
+
+    def run(mode: str) -> float:
+        parent, child = ctx.Pipe()
+        rings = None
+        if mode == "shm":
+            rings = (SharedFrameRing.create(2 * frames.nbytes + ALIGNMENT), SharedFrameRing.create(2 * frames.nbytes + ALIGNMENT))
+        worker = ctx.Process(target=_benchmark_worker, args=(child, mode, rings and (rings[0].name, rings[1].name)))
+        worker.start()
+        timings = []
+        for _ in range(ITERATIONS + 1):
+            start = time.perf_counter()
+            if mode == "pickle":
+                parent.send(frames)
+                out = parent.recv()
+            else:
+                parent.send(("frames", rings[0].write(frames)))
+                _, sent, out_descriptor = parent.recv()
+                rings[0].free(sent)
+                out = rings[1].read(out_descriptor)
+            checksum = int(out[0, 0, 0, 0]) + int(out[-1, -1, -1, -1])  # Touch the result like a consumer would
+            timings.append(time.perf_counter() - start)
+            if mode == "shm":
+                del out
+                parent.send(("free", out_descriptor))
+        parent.send(None)
+        worker.join()
+        if rings:
+            for ring in rings:
+                ring.close()
+        return sorted(timings[1:])[ITERATIONS // 2]
+
+    for mode in ("pickle", "shm"):
+        print(f"{mode:>7}: {run(mode) * 1000:8.1f} ms per job (median)")
+
+    # Worker crash while it holds descriptors: the owner reclaims its rings
+    ring = SharedFrameRing.create(2 * frames.nbytes + ALIGNMENT)
+    parent, child = ctx.Pipe()
+    worker = ctx.Process(target=_benchmark_worker, args=(child, "shm", (ring.name, ring.name)))
+    worker.start()
+    parent.send(("frames", ring.write(frames)))
+    parent.recv()
+    worker.kill()
+    worker.join()
+    print(f"worker killed holding {ring.used_bytes / 1024**2:.0f} MB; ", end="")
+    ring.reset()
+    print(f"after reset {ring.used_bytes} bytes in use, ring writable: {ring.read(ring.write(frames)).sum() == frames.sum()}")
+    name = ring.name
+    ring.close()
+    print(f"segment unlinked on close: {not os.path.exists('/dev/shm/' + name)}")
@@ -0,0 +1,206 @@
+"""
+Local model snapshot resolution and verification
+Works from the Hugging Face cache manifest and safetensors headers, without importing torch
+"""
+
+import hashlib
+import json
+import logging
+import os
+import struct
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+MODEL_ID = os.getenv("MODEL_ID", "Wan-AI/Wan2.2-I2V-A14B-Diffusers")
+MODEL_PATH = os.getenv("TTM_MODEL_PATH")  # Local snapshot directory, skips the hub cache lookup
+ALLOW_DOWNLOAD = os.getenv("TTM_ALLOW_DOWNLOAD", "1") == "1"
+
+# Only these files are fetched into a snapshot; pickled .bin/.pth weights are never loaded
+SNAPSHOT_PATTERNS = ["*.json", "*.safetensors", "*.txt", "*.model", "*.tiktoken", "spiece*"]
+
+HASH_CHUNK_BYTES = 16 * 1024**2
+
+
+def resolve_snapshot(
+    model_id: str = MODEL_ID,
+    local_path: Optional[str] = None,
+    allow_download: bool = ALLOW_DOWNLOAD
+) -> Path:
+    """
+    Local directory holding the model snapshot
+
+    An explicit `local_path` wins. Otherwise the Hugging Face cache is used
+    without touching the network, and only if the snapshot is missing and
+    downloads are allowed are the safetensors files fetched into the cache.
+    """
+    if local_path:
+        return Path(local_path)
+
+    from huggingface_hub import snapshot_download
+    from huggingface_hub.errors import LocalEntryNotFoundError
+
+    try:
+        return Path(snapshot_download(model_id, allow_patterns=SNAPSHOT_PATTERNS, local_files_only=True))
+    except LocalEntryNotFoundError:
+        if not allow_download:
+            raise
+    logger.info(f"Snapshot for {model_id} not cached, downloading safetensors weights")
+    return Path(snapshot_download(model_id, allow_patterns=SNAPSHOT_PATTERNS))
+
+
+def safetensors_expected_size(path: Path) -> int:
+    """
+    File size implied by a safetensors header
+
+    The file is an 8-byte little-endian header length, a JSON header with
+    each tensor's byte range, then the tensor data; a truncated download is
+    shorter than the end of the last range.
+    """
+    with open(path, "rb") as f:
+        (header_len,) = struct.unpack("<Q", f.read(8))
+        header = json.loads(f.read(header_len))
+    data_end = max(
+        (entry["data_offsets"][1] for name, entry in header.items() if name != "__metadata__"),
+        default=0
+    )
+    return 8 + header_len + data_end
+
+
+def cached_blob_sha256(path: Path) -> Optional[str]:
+    """
+    Expected SHA-256 of a file in the Hugging Face cache
+
+    Snapshot files are symlinks into `blobs/`, and LFS blobs (all weight
+    files) are named by the SHA-256 of their content.
+    """
+    name = os.path.basename(os.path.realpath(path))
+    if path.is_symlink() and len(name) == 64 and all(c in "0123456789abcdef" for c in name):
+        return name
+    return None
+
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(HASH_CHUNK_BYTES):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def check_weight_file(path: Path, verify_hash: bool = False) -> Dict[str, Any]:
+    """Size (and optionally hash) check of one safetensors file"""
+    result: Dict[str, Any] = {"file": str(path), "ok": False}
+    try:
+        size = path.stat().st_size
+        result["bytes"] = size
+        expected = safetensors_expected_size(path)
+        if size != expected:
+            result["error"] = f"size {size} does not match header ({expected})"
+            return result
+        if verify_hash:
+            expected_hash = cached_blob_sha256(path)
+            if expected_hash is None:
+                result["sha256"] = "unverified"
+            elif file_sha256(path) != expected_hash:
+                result["error"] = "sha256 mismatch"
+                return result
+            else:
+                result["sha256"] = "ok"
+        result["ok"] = True
+    except Exception as e:
+        result["error"] = str(e)
+    return result
+
+
+def list_weight_files(path: Path) -> tuple[Dict[str, List[Path]], List[str]]:
+    """
+    Safetensors files of every weighted component listed in model_index.json
+
+    Sharded components must have every shard named in their index.
+
+    Returns:
+        (files per component, problems)
+    """
+    model_index = path / "model_index.json"
+    if not model_index.exists():
+        return {}, [f"{path} is not a diffusers snapshot: model_index.json is missing"]
+
+    problems = []
+    components: Dict[str, List[Path]] = {}
+    for name, spec in json.loads(model_index.read_text()).items():
+        if name.startswith("_") or not isinstance(spec, list) or spec[0] is None:
+            continue
+        component = path / name
+        if not (component / "config.json").exists():
+            continue  # Tokenizers, schedulers and processors carry no weights
+
+        indexes = list(component.glob("*.safetensors.index.json"))
+        if indexes:
+            shards = set(json.loads(indexes[0].read_text())["weight_map"].values())
+            missing = sorted(s for s in shards if not (component / s).exists())
+            if missing:
+                problems.append(f"{name}: missing shards {missing}")
+            files = [component / s for s in sorted(shards) if s not in missing]
+        else:
+            files = sorted(component.glob("*.safetensors"))
+            if not files:
+                problems.append(f"{name}: no safetensors weights")
+        components[name] = files
+    return components, problems
+
+
+def inspect_snapshot(path: Path, verify_hashes: bool = False, max_workers: int = 8) -> Dict[str, Any]:
+    """
+    Check a snapshot's weight files in parallel and report on each component
+
+    Sizes are checked against the safetensors headers, which only reads a
+    few KB per file. With `verify_hashes`, cached files are also hashed and
+    compared with their blob names, which reads every byte.
+    """
+    start = time.perf_counter()
+    components, problems = list_weight_files(path)
+    files = [f for component_files in components.values() for f in component_files]
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        results = dict(zip(files, pool.map(lambda f: check_weight_file(f, verify_hashes), files)))
+
+    report_components = {}
+    for name, component_files in components.items():
+        checks = [results[f] for f in component_files]
+        problems.extend(f"{name}: {Path(c['file']).name} {c['error']}" for c in checks if not c["ok"])
+        report_components[name] = {
+            "files": len(checks),
+            "bytes": sum(c.get("bytes", 0) for c in checks),
+            "ok": all(c["ok"] for c in checks) and bool(checks),
+        }
+
+    return {
+        "ok": not problems,
+        "path": str(path),
+        "components": report_components,
+        "weight_files": len(files),
+        "weight_bytes": sum(r.get("bytes", 0) for r in results.values()),
+        "hashes_verified": verify_hashes,
+        "problems": problems,
+        "seconds": time.perf_counter() - start,
+    }
+
+
+def verify_snapshot(path: Path, verify_hashes: bool = False) -> Dict[str, Any]:
+    """
+    Check that every pipeline component has complete safetensors weights
+
+    Returns:
+        Summary with the number of weight files and their total size
+
+    Raises:
+        RuntimeError: Listing every problem found
+    """
+    report = inspect_snapshot(path, verify_hashes)
+    if not report["ok"]:
+        raise RuntimeError(f"Snapshot {path} failed verification: " + "; ".join(report["problems"]))
+    return {"weight_files": report["weight_files"], "weight_bytes": report["weight_bytes"]}
@@ -0,0 +1,132 @@
+"""
+Long-video generation for the TTM service
+Clips longer than one pipeline call are generated in overlapping windows and cross-faded at the seams
+"""
+
+import math
+from typing import Callable, Iterable, Iterator, List, Optional
+
+import cv2
+import numpy as np
+
+
+def plan_windows(num_frames: int, window: int, overlap: int) -> List[range]:
+    """
+    Overlapping windows of at most `window` frames covering [0, num_frames)
+
+    Each window starts `overlap` frames before the previous one ends. The
+    last window is shortened to the fewest 4k + 1 frames (the lengths the
+    Wan VAE decodes exactly) that cover the remaining frames, and is moved
+    back to end at `num_frames`, so it may overlap by more than `overlap`.
+    """
+    if (window - 1) % 4 or not 0 < overlap < window // 2:
+        raise ValueError(f"Window of {window} frames must be 4k + 1 and overlap by between 1 and {window // 2 - 1}")
+    windows = [range(0, min(window, num_frames))]
+    while windows[-1].stop < num_frames:
+        remaining = num_frames - windows[-1].stop
+        if remaining + overlap <= window:
+            length = 4 * math.ceil((remaining + overlap - 1) / 4) + 1
+            windows.append(range(num_frames - length, num_frames))
+        else:
+            start = windows[-1].stop - overlap
+            windows.append(range(start, start + window))
+    return windows
+
+
+def crossfade(previous: np.ndarray, current: np.ndarray, offset: int, overlap: int) -> np.ndarray:
+    """
+    Blend frames `offset` onward of a seam `overlap` frames long
+
+    The weight of `current` rises linearly from 1 / (overlap + 1) at the
+    first shared frame to overlap / (overlap + 1) at the last one.
+    """
+    output = np.empty_like(current)
+    for k in range(len(current)):
+        weight = (offset + k + 1) / (overlap + 1)
+        output[k] = cv2.addWeighted(current[k], weight, previous[k], 1 - weight, 0)
+    return output
+
+
+def stitch_windows(
+    windows: List[range],
+    render: Callable[[int, range, Optional[np.ndarray]], Iterable[np.ndarray]]
+) -> Iterator[np.ndarray]:
+    """
+    Join windows generated one after another into a single stream of chunks
+
+    `render(index, window, tail)` yields the window's frames in chunks;
+    `tail` holds the previous window's frames over the shared range, to
+    condition the window on, or None for the first one. The shared range
+    is held back from the earlier window and cross-faded into the later
+    one, so apart from the tail only one chunk is ever in memory, however
+    long the clip.
+    """
+    tail: Optional[np.ndarray] = None
+    for index, window in enumerate(windows):
+        keep = window.stop - windows[index + 1].start if index + 1 < len(windows) else 0
+        emit = len(window) - keep  # Frames of this window before the next one's range
+        held = []
+        received = 0
+        for chunk in render(index, window, tail):
+            first, received = received, received + len(chunk)
+            if tail is not None and first < len(tail):
+                shared = min(len(chunk), len(tail) - first)
+                chunk = np.concatenate([crossfade(tail[first:first + shared], chunk[:shared], first, len(tail)), chunk[shared:]])
+            if received > emit:
+                held.append(chunk[max(0, emit - first):])
+            if first < emit:
+                yield chunk[:emit - first]
+        if received != len(window):
+            raise RuntimeError(f"Window {index} produced {received} frames instead of {len(window)}")
+        tail = np.concatenate(held) if held else None
+
+
+if __name__ == "__main__":
+    # Peak memory of stitching a long clip vs holding it whole, and how much
+    # the cross-fade smooths a seam between windows that disagree slightly
+    import argparse
+    import tracemalloc
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--frames", type=int, default=801)
+    parser.add_argument("--window", type=int, default=81)
+    parser.add_argument("--overlap", type=int, default=9)
+    parser.add_argument("--chunk", type=int, default=16)
+    args = parser.parse_args()
+
+    height, width = 240, 416
+    rng = np.random.default_rng(0)
+    background = cv2.GaussianBlur(rng.integers(0, 256, (height, width + args.frames, 3), dtype=np.uint8), (0, 0), 2)
+    windows = plan_windows(args.frames, args.window, args.overlap)
+
+    def render(index: int, window: range, tail: Optional[np.ndarray]):
+        # A pan, each window off by a few grey levels as a model's windows would be
+        shift = np.full(3, 4 * (index % 2), np.uint8)
+        for start in range(window.start, window.stop, args.chunk):
+            yield np.stack([cv2.add(background[:, t:t + width], shift) for t in range(start, min(start + args.chunk, window.stop))])
+
+    tracemalloc.start()
+    stitched = []
+    for chunk in stitch_windows(windows, render):
+        stitched.append(chunk[:, ::8, ::8].copy())  # Thumbnails only, to keep the measurement to the stitcher
+    stitch_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    output = np.concatenate(stitched).astype(np.int16)
+
+    # The same windows joined by cutting at the middle of each overlap, without blending
+    cut = np.concatenate([
+        np.concatenate(list(render(i, w, None)))[:, ::8, ::8][
+            (w.start + (windows[i - 1].stop - w.start) // 2 if i else 0) - w.start:
+            (windows[i + 1].start + (w.stop - windows[i + 1].start) // 2 if i + 1 < len(windows) else w.stop) - w.start
+        ]
+        for i, w in enumerate(windows)
+    ]).astype(np.int16)
+
+    def seam_jump(frames: np.ndarray) -> float:
+        jumps = np.abs(np.diff(frames, axis=0)).mean(axis=(1, 2, 3))
+        return float(jumps[[t - 1 for w in windows[1:] for t in range(w.start, windows[windows.index(w) - 1].stop + 1)]].max())
+
+    print(f"{args.frames} frames at {width}x{height} in {len(windows)} windows: {[(w.start, w.stop) for w in windows]}")
+    print(f"Peak memory stitching: {stitch_peak / 2 ** 20:.1f} MB, whole clip: {args.frames * height * width * 3 / 2 ** 20:.1f} MB")
+    print(f"Largest frame-to-frame change across a seam: cross-faded {seam_jump(output):.2f}, "
+          f"cut {seam_jump(cut):.2f}, away from seams {np.abs(np.diff(output[:windows[1].start], axis=0)).mean():.2f}")
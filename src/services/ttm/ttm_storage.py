@@ -0,0 +1,168 @@
+"""
+Output storage backends for the TTM API
+Generated videos and thumbnails go to the local filesystem, Supabase Storage or an S3-compatible bucket
+"""
+
+import shutil
+import time
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Optional
+
+
+class StorageBackend(ABC):
+    """
+    Where finished outputs are stored and how clients reach them
+
+    Backends are synchronous; the API calls them from worker threads.
+    """
+
+    name = "base"
+    is_local = False
+
+    @abstractmethod
+    def upload(self, local_path: Path, key: str, content_type: str) -> str:
+        """Store a local file under `key` and return the URL clients should use"""
+
+    @abstractmethod
+    def delete(self, key: str):
+        """Remove a stored object; missing objects are ignored"""
+
+
+class LocalStorage(StorageBackend):
+    """Outputs stay on local disk and are served by the download endpoint"""
+
+    name = "local"
+    is_local = True
+
+    def __init__(self, directory: str):
+        self.directory = Path(directory)
+
+    def path(self, key: str) -> Path:
+        """Local path of `key`; keys that resolve outside the storage directory are rejected"""
+        path = (self.directory / key).resolve()
+        if not path.is_relative_to(self.directory.resolve()):
+            raise ValueError(f"Storage key {key!r} is outside {self.directory}")
+        return path
+
+    def upload(self, local_path: Path, key: str, content_type: str) -> str:
+        destination = self.path(key)
+        if local_path.resolve() != destination:
+            destination.parent.mkdir(parents=True, exist_ok=True)
+            shutil.move(str(local_path), destination)
+        return str(self.directory / key)
+
+    def delete(self, key: str):
+        self.path(key).unlink(missing_ok=True)
+
+
+class SupabaseStorage(StorageBackend):
+    """Public Supabase Storage bucket"""
+
+    name = "supabase"
+
+    def __init__(self, client, bucket: str = "ttm-videos"):
+        self.client = client
+        self.bucket = bucket
+
+    def upload(self, local_path: Path, key: str, content_type: str) -> str:
+        bucket = self.client.storage.from_(self.bucket)
+        # storage3 streams the file when given a path
+        bucket.upload(key, local_path, {"content-type": content_type})
+        return bucket.get_public_url(key)
+
+    def delete(self, key: str):
+        self.client.storage.from_(self.bucket).remove([key])
+
+
+class S3Storage(StorageBackend):
+    """
+    S3-compatible bucket (AWS S3, MinIO, R2, ...)
+
+    Files larger than one part are sent as multipart uploads, with parts
+    uploaded in parallel by boto3's transfer manager. Clients get presigned
+    GET URLs and fetch the bytes straight from the bucket.
+    Credentials come from the usual AWS environment variables or config files.
+    """
+
+    name = "s3"
+
+    def __init__(
+        self,
+        bucket: str,
+        endpoint_url: Optional[str] = None,
+        region: Optional[str] = None,
+        prefix: str = "",
+        part_size_mb: int = 8,
+        max_concurrency: int = 8,
+        presign_expiry: int = 7 * 24 * 3600,
+        client=None
+    ):
+        import boto3
+        from boto3.s3.transfer import TransferConfig
+
+        self.bucket = bucket
+        self.prefix = prefix
+        self.presign_expiry = presign_expiry
+        self.client = client or boto3.client("s3", endpoint_url=endpoint_url or None, region_name=region or None)
+        part_size = part_size_mb * 1024**2
+        self.transfer_config = TransferConfig(
+            multipart_threshold=part_size,
+            multipart_chunksize=part_size,
+            max_concurrency=max_concurrency,
+            use_threads=True
+        )
+
+    def upload(self, local_path: Path, key: str, content_type: str) -> str:
+        key = self.prefix + key
+        self.client.upload_file(
+            str(local_path),
+            self.bucket,
+            key,
+            ExtraArgs={"ContentType": content_type},
+            Config=self.transfer_config
+        )
+        return self.url(key)
+
+    def url(self, key: str) -> str:
+        """Presigned GET URL, valid for `presign_expiry` seconds"""
+        return self.client.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": self.bucket, "Key": key},
+            ExpiresIn=self.presign_expiry
+        )
+
+    def delete(self, key: str):
+        self.client.delete_object(Bucket=self.bucket, Key=self.prefix + key)
+
+
+if __name__ == "__main__":
+    # Multipart upload against an in-process S3 stand-in
+    import os
+    import tempfile
+
+    import boto3
+    from moto import mock_aws
+
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+
+    with mock_aws(), tempfile.TemporaryDirectory() as tmp:
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket="ttm-videos")
+
+        path = Path(tmp) / "video.mp4"
+        path.write_bytes(os.urandom(64 * 1024**2))
+
+        print(f"{'part MB':>8} {'threads':>8} {'parts':>6} {'seconds':>8}")
+        for part_size_mb, max_concurrency in [(64, 1), (8, 1), (8, 8)]:
+            storage = S3Storage("ttm-videos", part_size_mb=part_size_mb, max_concurrency=max_concurrency, client=client)
+            start = time.perf_counter()
+            url = storage.upload(path, f"bench/{part_size_mb}-{max_concurrency}.mp4", "video/mp4")
+            elapsed = time.perf_counter() - start
+            etag = client.head_object(Bucket="ttm-videos", Key=f"bench/{part_size_mb}-{max_concurrency}.mp4")["ETag"]
+            parts = etag.strip('"').partition("-")[2] or "1"
+            print(f"{part_size_mb:>8} {max_concurrency:>8} {parts:>6} {elapsed:>8.2f}")
+
+        print(f"Presigned URL: {url[:80]}...")
+        storage.delete(f"bench/{part_size_mb}-{max_concurrency}.mp4")
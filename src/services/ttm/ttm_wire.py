@@ -0,0 +1,163 @@
+"""
+Wire formats for TTM requests
+Trajectories are validated into (N, 2) float32 arrays, and requests may be sent as msgpack
+"""
+
+import base64
+import binascii
+import json
+import time
+from itertools import chain
+from operator import itemgetter
+from typing import Any, Dict, List
+
+import msgpack
+import numpy as np
+import orjson
+from pydantic import PlainSerializer, PlainValidator, WithJsonSchema
+from typing_extensions import Annotated
+
+MAX_TRAJECTORY_POINTS = 100_000
+
+
+def parse_trajectory(value: Any) -> np.ndarray:
+    """
+    Validate a trajectory into a contiguous (N, 2) float32 array of normalized (x, y)
+
+    Accepts any of:
+        - packed little-endian float32 bytes: x0, y0, x1, y1, ...
+        - a list of [x, y] pairs or an (N, 2) array
+        - a list of {"x": ..., "y": ...} dicts (the JSON form)
+    """
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        if len(value) % 8:
+            raise ValueError("packed trajectory length must be a multiple of 8 bytes")
+        points = np.frombuffer(value, dtype="<f4").reshape(-1, 2)
+    elif isinstance(value, list) and value and isinstance(value[0], dict):
+        try:
+            coords = chain.from_iterable(map(itemgetter("x", "y"), value))
+            points = np.fromiter(coords, dtype=np.float32, count=2 * len(value)).reshape(-1, 2)
+        except (KeyError, TypeError, ValueError):
+            raise ValueError("trajectory points must have numeric x and y")
+    else:
+        points = np.asarray(value, dtype=np.float32)
+
+    if points.ndim != 2 or points.shape[1] != 2:
+        raise ValueError("trajectory must be a list of (x, y) points")
+    if not 1 <= len(points) <= MAX_TRAJECTORY_POINTS:
+        raise ValueError(f"trajectory must have between 1 and {MAX_TRAJECTORY_POINTS} points")
+    if not np.isfinite(points).all() or points.min() < 0 or points.max() > 1:
+        raise ValueError("trajectory coordinates must be between 0 and 1")
+
+    return np.ascontiguousarray(points, dtype=np.float32)
+
+
+def trajectory_to_points(points: np.ndarray) -> List[Dict[str, float]]:
+    """JSON form of a trajectory"""
+    return [{"x": x, "y": y} for x, y in points.tolist()]
+
+
+# Pydantic field type for trajectories; serializes back to the JSON form
+Trajectory = Annotated[
+    Any,
+    PlainValidator(parse_trajectory),
+    PlainSerializer(trajectory_to_points, when_used="json"),
+    WithJsonSchema({
+        "type": "array",
+        "items": {
+            "type": "object",
+            "properties": {"x": {"type": "number"}, "y": {"type": "number"}},
+        },
+    }),
+]
+
+
+def parse_binary(value: Any) -> bytes:
+    """Raw bytes as sent in msgpack `bin` fields, or a base64 string as sent in JSON"""
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return bytes(value)
+    if isinstance(value, str):
+        try:
+            return base64.b64decode(value)
+        except (binascii.Error, ValueError):
+            raise ValueError("must be base64-encoded")
+    raise ValueError("must be bytes or a base64 string")
+
+
+# Pydantic field type for images embedded in requests; serializes back to base64
+Binary = Annotated[
+    bytes,
+    PlainValidator(parse_binary),
+    PlainSerializer(lambda value: base64.b64encode(value).decode("ascii"), when_used="json"),
+    WithJsonSchema({"type": "string", "format": "base64"}),
+]
+
+
+def decode_json_request(data: str | bytes) -> Dict[str, Any]:
+    """
+    Decode a JSON request body for `model_validate`
+
+    Parsing with orjson and validating the Python objects is faster than
+    `model_validate_json` here: the trajectory field takes any input, so
+    pydantic would build the same list of point dicts, only more slowly.
+    """
+    payload = orjson.loads(data)
+    if not isinstance(payload, dict):
+        raise ValueError("JSON request must be an object")
+    return payload
+
+
+def decode_msgpack_request(data: bytes) -> Dict[str, Any]:
+    """Decode a msgpack request body; binary trajectory fields stay as bytes"""
+    payload = msgpack.unpackb(data, raw=False)
+    if not isinstance(payload, dict):
+        raise ValueError("msgpack request must be a map")
+    return payload
+
+
+def encode_msgpack_request(payload: Dict[str, Any]) -> bytes:
+    """Encode a request as msgpack, packing array trajectories as float32 bytes"""
+    def pack(value):
+        if isinstance(value, np.ndarray):
+            return np.ascontiguousarray(value, dtype="<f4").tobytes()
+        if isinstance(value, dict):
+            return {k: pack(v) for k, v in value.items()}
+        if isinstance(value, list):
+            return [pack(v) for v in value]
+        return value
+
+    return msgpack.packb(pack(payload), use_bin_type=True)
+
+
+if __name__ == "__main__":
+    from pydantic import BaseModel
+    from typing import Optional
+
+    class LegacyRequest(BaseModel):
+        prompt: str
+        trajectory: Optional[List[Dict[str, float]]] = None
+
+    class PackedRequest(BaseModel):
+        prompt: str
+        trajectory: Optional[Trajectory] = None
+
+    print("Trajectory parse cost (ms per request)")
+    print(f"{'points':>8} {'json dicts':>12} {'json+array':>12} {'orjson+array':>13} {'msgpack f32':>12}")
+
+    for n in (100, 1_000, 10_000, 100_000):
+        points = np.random.rand(n, 2).astype(np.float32)
+        as_json = json.dumps({"prompt": "bench", "trajectory": trajectory_to_points(points)})
+        as_msgpack = encode_msgpack_request({"prompt": "bench", "trajectory": points})
+        repeats = max(3, 20_000 // n)
+
+        def bench(fn):
+            start = time.perf_counter()
+            for _ in range(repeats):
+                fn()
+            return (time.perf_counter() - start) / repeats * 1000
+
+        legacy = bench(lambda: LegacyRequest.model_validate_json(as_json))
+        json_array = bench(lambda: PackedRequest.model_validate_json(as_json))
+        orjson_array = bench(lambda: PackedRequest.model_validate(decode_json_request(as_json)))
+        packed = bench(lambda: PackedRequest.model_validate(decode_msgpack_request(as_msgpack)))
+        print(f"{n:>8} {legacy:>12.3f} {json_array:>12.3f} {orjson_array:>13.3f} {packed:>12.3f}")
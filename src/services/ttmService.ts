@@ -35,6 +35,7 @@ export enum CameraMovementType {
   ZOOM = 'zoom',
   ORBIT = 'orbit',
   DOLLY = 'dolly',
+  PATH = 'path',
 }
 
 export interface Point2D {
@@ -47,9 +48,15 @@ export interface CameraMovement {
   params: {
     dx?: number // Pan horizontal
     dy?: number // Pan vertical
-    amount?: number // Zoom amount
-    angle?: number // Orbit angle
+    amount?: number // Zoom amount, or dolly distance (nearest surface = 1)
+    angle?: number // Orbit angle in degrees, positive orbits right
+    elevation?: number // Orbit elevation in degrees
+    pivot?: number // Orbit pivot distance (default: median scene depth)
+    fov?: number // Horizontal field of view in degrees for orbit/dolly/path
+    translation?: number[] | number[][] // Path: [x, y, z] end position or waypoints
+    rotation?: number[] | number[][] // Path: [yaw, pitch, roll] end angles or waypoints
   }
+  depth?: string // Base64 depth image for orbit/dolly/path, brighter = nearer
 }
 
 export interface TTMRequest {
@@ -59,27 +66,65 @@ export interface TTMRequest {
   cameraMovement?: CameraMovement // For camera motion
   tweakIndex?: number // When to start denoising outside mask (0-50)
   tstrongIndex?: number // When to start denoising inside mask (0-50)
-  numFrames?: number // Number of frames (default: 81)
+  numFrames?: number // Number of frames, 16-1601; over 161 they are generated in stitched windows (default: 81)
+  fps?: number // Output frame rate, 8-60; frames above the model's 16 fps are interpolated (default: 16)
+  interpolate?: boolean // Generate fewer frames and synthesize the rest by optical flow
+  outputWidth?: number // Upscale to this width; the height follows the aspect ratio unless given
+  outputHeight?: number // Upscale to this height; the width follows the aspect ratio unless given
   guidanceScale?: number // Guidance scale (default: 3.5)
   seed?: number // Random seed for reproducibility
-  projectId?: string // Alkemy project ID for storage
+  projectId?: string // Alkemy project ID for storage: 1-64 letters, digits, _ or -
+  timeoutSeconds?: number // Per-job deadline in seconds (default: 600 per pipeline call, at most 3600 per call)
+  imageId?: string // Handle from uploadTTMImage, sent instead of the image file
+}
+
+export interface ImageHandle {
+  imageId: string
+  width: number
+  height: number
+  expiresAt: string
+  deduplicated: boolean
 }
 
 export interface TTMResponse {
-  status: 'completed' | 'failed'
+  status: 'completed' | 'failed' | 'cancelled' | 'timed_out'
   videoUrl?: string
   thumbnailUrl?: string
+  previewUrl?: string
+  spriteUrl?: string
+  spriteLayout?: {
+    columns: number
+    rows: number
+    tileWidth: number
+    tileHeight: number
+    frameIndices: number[]
+    keyframeIndices: number[]
+  }
+  keyframeUrls?: string[]
   durationSeconds?: number
   frames?: number
+  diffusedFrames?: number // Frames generated by the model; the rest were interpolated
+  width?: number
+  height?: number
+  upscaled?: boolean // Generated smaller and upscaled to width x height
+  windows?: number // Pipeline calls the video was generated in; above 1 they were stitched
   generationTime?: number
   error?: string
 }
 
 export interface JobStatus {
   jobId: string
-  status: 'pending' | 'processing' | 'completed' | 'failed'
+  status: 'pending' | 'processing' | 'completed' | 'failed' | 'cancelled' | 'timed_out'
   progress: number // 0.0 to 1.0
   result?: TTMResponse
+  projectId?: string
+  parentId?: string // Variant sweep this job belongs to
+}
+
+export interface JobPage {
+  jobs: JobStatus[]
+  nextCursor?: string // Pass back as `cursor` for the next page
+  total: number
 }
 
 // Default parameters based on motion type
@@ -221,9 +266,10 @@ export async function generateTTMVideo(
     formData.append('image', imageBlob, 'input.jpg')
     formData.append('request_json', JSON.stringify(finalRequest))
 
-    // Submit generation request
+    // Submit generation request; the key makes retries return the same job
     const response = await fetch(`${TTM_API_URL}${TTM_API_PREFIX}/generate`, {
       method: 'POST',
+      headers: { 'Idempotency-Key': requestId },
       body: formData,
     })
 
@@ -238,8 +284,8 @@ export async function generateTTMVideo(
     // Poll for completion
     const result = await pollJobStatus(job.jobId, onProgress)
 
-    if (result.status === 'failed') {
-      throw new Error(result.result?.error || 'Generation failed')
+    if (result.status !== 'completed') {
+      throw new Error(result.result?.error || `Generation ${result.status}`)
     }
 
     console.log('[TTM Service] Generation completed:', result.result)
@@ -273,7 +319,12 @@ async function pollJobStatus(
       onProgress(status.progress)
     }
 
-    if (status.status === 'completed' || status.status === 'failed') {
+    if (
+      status.status === 'completed' ||
+      status.status === 'failed' ||
+      status.status === 'cancelled' ||
+      status.status === 'timed_out'
+    ) {
       return status
     }
 
@@ -285,6 +336,94 @@ async function pollJobStatus(
   throw new Error('Generation timeout')
 }
 
+/**
+ * Upload an image once so repeated generations can reference it by handle
+ *
+ * @param imageBlob - Source image
+ * @returns Image handle; pass its imageId in TTMRequest
+ */
+export async function uploadTTMImage(imageBlob: Blob): Promise<ImageHandle> {
+  const formData = new FormData()
+  formData.append('image', imageBlob, 'input.jpg')
+
+  const response = await fetch(`${TTM_API_URL}${TTM_API_PREFIX}/images`, {
+    method: 'POST',
+    body: formData,
+  })
+
+  if (!response.ok) {
+    const error = await response.json()
+    throw new Error(error.detail || 'Image upload failed')
+  }
+
+  return response.json()
+}
+
+/**
+ * Cancel a pending or running generation job
+ *
+ * @param jobId - Job ID returned by the generate endpoint
+ * @returns Updated job status
+ */
+export async function cancelTTMJob(jobId: string): Promise<JobStatus> {
+  const response = await fetch(`${TTM_API_URL}${TTM_API_PREFIX}/cancel/${jobId}`, {
+    method: 'POST',
+  })
+
+  if (!response.ok) {
+    const error = await response.json()
+    throw new Error(error.detail || 'Failed to cancel job')
+  }
+
+  return response.json()
+}
+
+/**
+ * List jobs newest first, optionally filtered by project and status
+ *
+ * @param filters - Project, status, page size and the cursor of the previous page
+ * @returns One page of jobs
+ */
+export async function listTTMJobs(filters: {
+  projectId?: string
+  status?: JobStatus['status'] | 'partial'
+  cursor?: string
+  limit?: number
+} = {}): Promise<JobPage> {
+  const params = new URLSearchParams()
+  if (filters.projectId) params.set('project_id', filters.projectId)
+  if (filters.status) params.set('status', filters.status)
+  if (filters.cursor) params.set('cursor', filters.cursor)
+  if (filters.limit) params.set('limit', String(filters.limit))
+
+  const response = await fetch(`${TTM_API_URL}${TTM_API_PREFIX}/jobs?${params}`)
+  if (!response.ok) {
+    throw new Error('Failed to list jobs')
+  }
+
+  return response.json()
+}
+
+/**
+ * Get the status of many jobs in one request (up to 500)
+ *
+ * @param jobIds - Job IDs to look up
+ * @returns Statuses of known jobs and the IDs that were not found
+ */
+export async function getTTMJobStatuses(jobIds: string[]): Promise<{ jobs: JobStatus[]; missing: string[] }> {
+  const response = await fetch(`${TTM_API_URL}${TTM_API_PREFIX}/status:batch`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({ job_ids: jobIds }),
+  })
+
+  if (!response.ok) {
+    throw new Error('Failed to fetch job statuses')
+  }
+
+  return response.json()
+}
+
 /**
  * Create trajectory for simple linear motion
  *
@@ -365,7 +504,7 @@ export function createDollyZoom(
  * Create camera orbit movement
  *
  * @param angle - Orbit angle in degrees
- * @param elevation - Elevation change
+ * @param elevation - Elevation in degrees
  * @returns Camera movement parameters
  */
 export function createOrbitMovement(angle: number = 30, elevation: number = 0): CameraMovement {
@@ -373,11 +512,26 @@ export function createOrbitMovement(angle: number = 30, elevation: number = 0):
     type: CameraMovementType.ORBIT,
     params: {
       angle,
-      dy: elevation,
+      elevation,
     },
   }
 }
 
+/**
+ * Create camera dolly movement, with parallax from the scene depth
+ *
+ * @param amount - Distance to move forward (negative moves back), where the nearest surface is 1 away
+ * @param depth - Optional base64 depth image, brighter = nearer
+ * @returns Camera movement parameters
+ */
+export function createDollyMovement(amount: number = 0.3, depth?: string): CameraMovement {
+  return {
+    type: CameraMovementType.DOLLY,
+    params: { amount },
+    ...(depth ? { depth } : {}),
+  }
+}
+
 /**
  * Integrate TTM with Alkemy's Frame animation
  * This can be used as an alternative to animateFrame in aiService.ts
@@ -499,6 +653,8 @@ export async function checkTTMStatus(): Promise<boolean> {
 export default {
   generateTTMVideo,
   animateFrameWithTTM,
+  cancelTTMJob,
+  uploadTTMImage,
   createLinearTrajectory,
   createCircularTrajectory,
   createDollyZoom,